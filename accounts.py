@@ -0,0 +1,101 @@
+"""
+Accounts - Multi-account configuration and sharding
+"accounts" in bot_config.json lists every billing account the bot works on:
+
+    "accounts": [
+        {"account_number": "202744967", "country_code": "CA", "label": "Toronto"},
+        {"account_number": "309912331", "country_code": "US", "username": "...", "password": "..."}
+    ]
+
+Each entry overrides the top-level config for its runs (credentials, country, comment, ...).
+Without "accounts" the single top-level account_number is the only account.
+Every account gets its own retry queue, pacing state and fingerprints; accounts with
+their own login also get their own session snapshot.
+"""
+import os
+import re
+
+# Per-account ledgers: config key -> default file name
+ACCOUNT_FILES = {
+    "retry_file": "retry_queue.json",
+    "fingerprint_file": "invoice_fingerprints.json",
+    "pacing_file": "pacing_state.json",
+}
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(text)).strip('_') or "default"
+
+
+def _suffixed(path, suffix):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{suffix}{ext}"
+
+
+def account_numbers(config):
+    """Every configured account number, in config order"""
+    entries = config.get("accounts") or []
+    if not entries:
+        return [str(config.get("account_number", ""))]
+    return [str(entry["account_number"]) for entry in entries if entry.get("account_number")]
+
+
+def login_key(config, account):
+    """Which login an account uses ("" = the top-level username)"""
+    entry = _entry(config, account)
+    return entry.get("username", "") if entry else ""
+
+
+def _entry(config, account):
+    for entry in config.get("accounts") or []:
+        if str(entry.get("account_number")) == str(account):
+            return entry
+    return None
+
+
+def account_config(config, account):
+    """
+    The config to run `account` with: its accounts entry over the top-level config, plus
+    its own ledgers (only when several accounts are configured) and session snapshot.
+    """
+    if not account:
+        return config
+    entry = _entry(config, account)
+    merged = {**config, **(entry or {}), "account_number": str(account)}
+    merged.pop("accounts", None)
+    if len(account_numbers(config)) > 1:
+        # Keyed by account only, so whichever worker runs the account finds its ledgers
+        for key, default in ACCOUNT_FILES.items():
+            merged[key] = (entry or {}).get(key) or _suffixed(default, _slug(account))
+    if entry and entry.get("username"):
+        merged["session_file"] = _suffixed(config.get("session_file", "session_state.json"),
+                                           _slug(entry["username"]))
+    return merged
+
+
+def shard_accounts(config, shard_count):
+    """
+    Split the accounts into shards, one worker each. A worker stays logged in as one user,
+    so accounts with different logins never share a shard; shard_count is raised to the
+    number of distinct logins if needed. Returns a list of account-number lists.
+    """
+    groups = {}
+    for account in account_numbers(config):
+        groups.setdefault(login_key(config, account), []).append(account)
+    shard_count = max(shard_count, len(groups), 1)
+
+    # Every login gets one shard; the spare shards go to the logins with the most accounts
+    slots = {login: 1 for login in groups}
+    for _ in range(shard_count - len(groups)):
+        login = max(groups, key=lambda key: len(groups[key]) / slots[key])
+        if slots[login] >= len(groups[login]):
+            break
+        slots[login] += 1
+
+    shards = []
+    for login, accounts in groups.items():
+        parts = [[] for _ in range(slots[login])]
+        for i, account in enumerate(accounts):
+            parts[i % len(parts)].append(account)
+        shards.extend(parts)
+    return shards
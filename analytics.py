@@ -0,0 +1,130 @@
+"""
+Analytics - Recovery analytics over the dispute ledger (stats.db)
+Loads disputes and credits into pandas and computes totals by period, by invoice and by
+tracking prefix, plus dispute-to-credit latency. Results are cached until the store's
+version counter changes (every recorded dispute or credit bumps it).
+
+Credits are not visible to the bot; import them from a CSV (invoice,tracking,amount,credited_at[,account]):
+Usage: python analytics.py [--import-credits credits.csv]
+"""
+import argparse
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+import stats_store
+
+PREFIX_LENGTH = 4  # tracking ID digits used to group shipments
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_ledger(path=stats_store.DB_FILE):
+    """Disputes and credits as DataFrames (timestamps parsed)"""
+    stats_store.connect(path).close()  # make sure the schema exists
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        disputes = pd.read_sql_query(
+            "SELECT filed_at, account, invoice, tracking, amount FROM disputes", conn)
+        credits = pd.read_sql_query(
+            "SELECT credited_at, account, invoice, tracking, amount FROM credits", conn)
+    finally:
+        conn.close()
+    disputes["filed_at"] = pd.to_datetime(disputes["filed_at"], format="ISO8601")
+    credits["credited_at"] = pd.to_datetime(credits["credited_at"], format="ISO8601")
+    return disputes, credits
+
+
+def _records(frame):
+    return json.loads(frame.to_json(orient="records", date_format="iso"))
+
+
+def _latency_stats(days):
+    if days.empty:
+        return {"count": 0, "mean_days": None, "median_days": None, "p90_days": None}
+    return {
+        "count": int(days.count()),
+        "mean_days": round(float(days.mean()), 1),
+        "median_days": round(float(days.median()), 1),
+        "p90_days": round(float(days.quantile(0.9)), 1)
+    }
+
+
+def compute(disputes, credits, period="month"):
+    """All aggregates as plain dicts/lists (JSON ready)"""
+    freq = {"day": "D", "week": "W", "month": "M", "quarter": "Q"}[period]
+
+    # First credit per disputed shipment, joined back onto the disputes
+    first_credit = (credits.sort_values("credited_at")
+                    .groupby(["invoice", "tracking"], as_index=False)
+                    .agg(credited_at=("credited_at", "first"), credited=("amount", "sum")))
+    ledger = disputes.merge(first_credit, on=["invoice", "tracking"], how="left")
+    ledger["credited"] = ledger["credited"].fillna(0.0)
+    ledger["latency_days"] = (ledger["credited_at"] - ledger["filed_at"]).dt.total_seconds() / 86400
+    ledger["period"] = ledger["filed_at"].dt.to_period(freq).astype(str)
+    ledger["prefix"] = ledger["tracking"].str[:PREFIX_LENGTH]
+
+    def totals(by):
+        grouped = ledger.groupby(by).agg(
+            disputes=("tracking", "size"),
+            disputed=("amount", "sum"),
+            credited=("credited", "sum"),
+            credited_disputes=("credited_at", "count"),
+            median_latency_days=("latency_days", "median")
+        ).reset_index()
+        grouped["recovery_rate"] = (grouped["credited"] / grouped["disputed"].where(grouped["disputed"] > 0)).fillna(0.0)
+        return _records(grouped.round(2))
+
+    return {
+        "period": period,
+        "totals": {
+            "disputes": int(len(ledger)),
+            "disputed": round(float(ledger["amount"].sum()), 2),
+            "credited": round(float(ledger["credited"].sum()), 2),
+            "outstanding": int(ledger["credited_at"].isna().sum())
+        },
+        "by_period": totals("period"),
+        "by_invoice": totals("invoice"),
+        "by_prefix": totals("prefix"),
+        "latency": _latency_stats(ledger["latency_days"].dropna())
+    }
+
+
+def get_analytics(period="month", path=stats_store.DB_FILE):
+    """Cached compute(); recomputed only when the store version moved"""
+    version = stats_store.version(path)
+    key = (path, period)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+    disputes, credits = load_ledger(path)
+    result = compute(disputes, credits, period)
+    result["version"] = version
+    with _cache_lock:
+        _cache[key] = (version, result)
+    return result
+
+
+def import_credits(csv_path, path=stats_store.DB_FILE):
+    """Record credits from a CSV export. Returns the number of new credits"""
+    frame = pd.read_csv(csv_path, dtype={"invoice": str, "tracking": str, "account": str})
+    added = 0
+    for row in frame.itertuples(index=False):
+        if stats_store.record_credit(row.invoice, row.tracking, row.amount,
+                                     getattr(row, "credited_at", None), getattr(row, "account", ""), path=path):
+            added += 1
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispute recovery analytics")
+    parser.add_argument("--import-credits", help="CSV with invoice,tracking,amount,credited_at[,account]")
+    parser.add_argument("--period", choices=["day", "week", "month", "quarter"], default="month")
+    args = parser.parse_args()
+    if args.import_credits:
+        print(f"Imported {import_credits(args.import_credits)} credits")
+    print(json.dumps(get_analytics(args.period), indent=2))
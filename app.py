@@ -1,9 +1,32 @@
+if __name__ == '__main__':
+    # Green threads for the dashboard server must be patched in before anything else is imported
+    from config import load_config
+    if load_config().get("dashboard_server", "gevent") in ("auto", "gevent"):
+        try:
+            from gevent import monkey
+            monkey.patch_all()
+        except ImportError:
+            pass
+
 import json
 import os
-import subprocess
 import time
 import logging
+import tempfile
+from datetime import datetime
 from flask import Flask, render_template, jsonify, send_file, request, Response
+from worker_daemon import load_heartbeat, worker_is_alive
+from planner import load_plan
+import stats_store
+import export_disputes
+import analytics
+import job_queue
+from pacing import load_pacing_state
+from resilience import retry_queue_for
+from supervisor import Supervisor
+from orchestrator import shard_status
+from config import load_config
+from dashboard_server import FrameBroadcaster, StreamLimitReached, serve
 
 # Suppress Werkzeug request logs (GET /status 200 etc)
 log = logging.getLogger('werkzeug')
@@ -15,9 +38,9 @@ app = Flask(__name__)
 STATE_FILE = "bot_state.json"
 LOG_FILE = "bot_logs.json"
 
-# Global reference to worker process and latest frame
-worker_process = None
-latest_frame = None
+# Queued/scheduled jobs are handed to the worker by the supervisor; live-view frames are fanned out by the broadcaster
+supervisor = Supervisor()
+frames = FrameBroadcaster(max_clients=load_config().get("stream_max_clients", 200))
 
 def load_state():
     if os.path.exists(STATE_FILE):
@@ -49,67 +72,42 @@ def index():
 
 @app.route('/start', methods=['POST'])
 def start_bot():
-    global worker_process
-    
-    # Check if already running
-    state = load_state()
-    if state.get("status") in ["running", "processing", "waiting_for_login"]:
-        return jsonify({"status": "already_running"})
+    # Manual runs go through the job queue ahead of scheduled ones
+    job_id = job_queue.enqueue(priority=job_queue.PRIORITY_MANUAL, source="manual")
+    supervisor.tick()
 
-    # Reset files - BUT KEEP HISTORY
-    if os.path.exists(STATE_FILE): os.remove(STATE_FILE)
-    
-    # Clear logs and invoices for new session
-    logs_data = {"logs": [], "stats": {"disputed": 0, "skipped": 0, "errors": 0, "invoices_processed": 0, "total_invoices": 0}, "invoices": []}
-    with open(LOG_FILE, 'w') as f:
-        json.dump(logs_data, f)
-    
-    # Start worker
-    # We use Popen to start it as a separate independent process
-    worker_process = subprocess.Popen(
-        ["python", "browser_worker.py"],
-        shell=True
-    )
-    
-    # Give it a moment to initialize
-    time.sleep(2)
-    
-    # Send start command immediately (worker waits for it after login, or we can let it wait)
-    # Actually, the worker waits for "start" command after login. 
-    # But for auto-login, we might want to send "start" automatically?
-    # The user wants "one button". 
-    # So we should probably write "start" to the state file after a delay or let the worker handle it.
-    # In browser_worker.py, it waits for "start" command after login.
-    # So we should write "start" to the state file.
-    
-    save_command("start")
-    
-    return jsonify({"status": "started"})
+    job = job_queue.get_job(job_id)
+    if job["status"] == "failed":
+        return jsonify({"status": "worker_failed", "job_id": job_id}), 500
+    if job["status"] == "running":
+        return jsonify({"status": "started", "job_id": job_id})
+    return jsonify({"status": "queued", "job_id": job_id})
 
 @app.route('/stop', methods=['POST'])
 def stop_bot():
     save_command("stop")
     return jsonify({"status": "stopping"})
 
+@app.route('/shutdown', methods=['POST'])
+def shutdown_worker():
+    save_command("shutdown")
+    return jsonify({"status": "shutting_down"})
+
+@app.route('/worker')
+def get_worker():
+    heartbeat = load_heartbeat()
+    heartbeat["alive"] = worker_is_alive(heartbeat)
+    return jsonify(heartbeat)
+
 @app.route('/status')
 def get_status():
     state = load_state()
     logs_data = load_logs()
     
-    # Load persistent history
-    stats_file = "stats.json"
-    stats = {}
-    if os.path.exists(stats_file):
-        try:
-            with open(stats_file, 'r') as f:
-                stats = json.load(f)
-        except:
-            pass
-            
-    # Calculate stats
-    current_month = time.strftime("%Y-%m")
-    monthly_disputes = stats.get("monthly_disputes", {}).get(current_month, 0)
-    total_disputes = stats.get("total_disputes", 0)
+    # Persistent history (precomputed rollups, no file scan)
+    stats = stats_store.summary()
+    monthly_disputes = stats["month"]["count"]
+    total_disputes = stats["all"]["count"]
     
     # Session disputes (from current log file)
     # Note: browser_worker updates persistent stats when it updates session stats
@@ -119,6 +117,8 @@ def get_status():
     response_stats = {
         "disputed_month": monthly_disputes,
         "total_disputed": total_disputes,
+        "amount_month": stats["month"]["amount"],
+        "amount_total": stats["all"]["amount"],
         "disputed_session": session_disputes,
         "errors": logs_data.get("stats", {}).get("errors", 0),
         "skipped": logs_data.get("stats", {}).get("skipped", 0)
@@ -128,46 +128,168 @@ def get_status():
         "status": state.get("status", "idle"),
         "logs": logs_data.get("logs", []),
         "invoices": logs_data.get("invoices", []),
-        "stats": response_stats
+        "stats": response_stats,
+        "pacing": load_pacing_state()
     })
 
+@app.route('/history')
+def get_history():
+    # e.g. /history?period=month&start=2025-01&end=2025-12&account=123456789
+    try:
+        rows = stats_store.history(
+            request.args.get("period", "day"),
+            request.args.get("start"),
+            request.args.get("end"),
+            request.args.get("account")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"history": rows, "accounts": stats_store.accounts()})
+
+@app.route('/export')
+def export():
+    # e.g. /export?format=parquet&start=2025-01-01&end=2025-01-31&account=123456789
+    fmt = request.args.get("format", "csv")
+    start, end, account = request.args.get("start"), request.args.get("end"), request.args.get("account")
+    try:
+        for day in (start, end):
+            if day:
+                datetime.strptime(day[:10], "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+
+    name = f"disputes_{start or 'all'}_{end or 'now'}"
+    if fmt == "csv":
+        return Response(export_disputes.iter_csv(start, end, account), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={name}.csv"})
+    if fmt != "parquet":
+        return jsonify({"error": "format must be csv or parquet"}), 400
+
+    # Parquet's footer is written last, so build it in a temp file (row group by row group) and stream that
+    tmp = tempfile.TemporaryFile()
+    export_disputes.write_parquet(tmp, start, end, account)
+    tmp.seek(0)
+
+    def stream():
+        with tmp:
+            while True:
+                chunk = tmp.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(stream(), mimetype="application/vnd.apache.parquet",
+                    headers={"Content-Disposition": f"attachment; filename={name}.parquet"})
+
+@app.route('/analytics')
+def get_analytics():
+    period = request.args.get("period", "month")
+    if period not in ("day", "week", "month", "quarter"):
+        return jsonify({"error": "period must be day, week, month or quarter"}), 400
+    return jsonify(analytics.get_analytics(period))
+
+@app.route('/plan')
+def get_plan():
+    plan = load_plan()
+    if plan is None:
+        return jsonify({"status": "none", "invoices": []})
+    return jsonify(plan)
+
+@app.route('/metrics')
+def get_metrics():
+    """Throughput controls and health in one place (pacing limits, retries, worker, live view)"""
+    heartbeat = load_heartbeat()
+    retries = retry_queue_for(load_config()).summary()
+    return jsonify({
+        "pacing": load_pacing_state(),
+        "retries": {"pending": retries["pending"], "exhausted": retries["exhausted"]},
+        "worker": {"alive": worker_is_alive(heartbeat), "phase": heartbeat.get("phase"),
+                   "jobs_done": heartbeat.get("jobs_done"), "memory_mb": heartbeat.get("memory_mb")},
+        "jobs": {key: len(value) for key, value in job_queue.list_jobs(limit=0).items()},
+        "live_view": frames.stats()
+    })
+
+@app.route('/shards')
+def get_shards():
+    """Multi-account run (orchestrator.py): per-shard progress and totals over every account"""
+    return jsonify(shard_status())
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    return jsonify({
+        "jobs": job_queue.list_jobs(),
+        "schedules": job_queue.list_schedules(),
+        "supervisor": job_queue.lease_owner()
+    })
+
+@app.route('/jobs', methods=['POST'])
+def add_job():
+    data = request.json or {}
+    job_id = job_queue.enqueue(data.get("account", ""), data.get("priority", job_queue.PRIORITY_SCHEDULED),
+                               data.get("params"), data.get("not_before"), source="api")
+    return jsonify({"status": "queued", "job_id": job_id})
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        return jsonify({"error": "job is not queued"}), 409
+    return jsonify({"status": "cancelled", "job_id": job_id})
+
+@app.route('/schedules', methods=['POST'])
+def add_schedule():
+    data = request.json or {}
+    try:
+        schedule_id = job_queue.add_schedule(data.get("spec", ""), data.get("account", ""),
+                                             data.get("priority", job_queue.PRIORITY_SCHEDULED), data.get("params"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"status": "added", "schedule_id": schedule_id})
+
+@app.route('/schedules/<int:schedule_id>', methods=['DELETE'])
+def delete_schedule(schedule_id):
+    if not job_queue.remove_schedule(schedule_id):
+        return jsonify({"error": "no such schedule"}), 404
+    return jsonify({"status": "deleted", "schedule_id": schedule_id})
+
+@app.route('/schedules/<int:schedule_id>/<action>', methods=['POST'])
+def toggle_schedule(schedule_id, action):
+    if action not in ("enable", "disable"):
+        return jsonify({"error": "action must be enable or disable"}), 400
+    if not job_queue.set_schedule_enabled(schedule_id, action == "enable"):
+        return jsonify({"error": "no such schedule"}), 404
+    return jsonify({"status": action + "d", "schedule_id": schedule_id})
+
 @app.route('/update_frame', methods=['POST'])
 def update_frame():
-    global latest_frame
-    latest_frame = request.data
-    # print(f"Received frame: {len(latest_frame)} bytes") 
+    frames.publish(request.data)
     return "ok"
 
-def generate_frames():
-    global latest_frame
-    
-    # Try to load a placeholder if no frame yet
-    if latest_frame is None and os.path.exists("static/latest_view.png"):
+@app.route('/video_feed')
+def video_feed():
+    # Show a placeholder until the first real frame arrives
+    if frames.latest() is None and os.path.exists("static/latest_view.png"):
         try:
             with open("static/latest_view.png", "rb") as f:
-                latest_frame = f.read()
+                frames.publish(f.read())
         except:
             pass
 
-    while True:
-        if latest_frame:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + latest_frame + b'\r\n')
-        else:
-            # If we still have nothing, just wait
-            pass
-            
-        time.sleep(0.05)
+    try:
+        stream = frames.open_stream()
+    except StreamLimitReached:
+        return "Too many live view clients", 503
+    return Response(stream, mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/stream_stats')
+def get_stream_stats():
+    return jsonify(frames.stats())
 
 @app.route('/screenshot')
 def get_screenshot():
     # Fallback for static image if needed
-    if latest_frame:
-         return Response(latest_frame, mimetype='image/jpeg')
+    frame = frames.latest()
+    if frame:
+         return Response(frame, mimetype='image/jpeg')
     else:
         return "", 404
 
@@ -214,5 +336,7 @@ if __name__ == '__main__':
     # Create a clean idle state
     save_command("idle")
         
-    print("Starting Flask server on http://localhost:5000")
-    app.run(debug=True, port=5000, use_reloader=False)
+    supervisor.start()
+    config = load_config()
+    serve(app, frames, port=config.get("dashboard_port", 5000), backend=config.get("dashboard_server", "gevent"),
+          threads=config.get("dashboard_threads", 64))
@@ -0,0 +1,284 @@
+"""
+Async Engine - Runs the shared pipeline (pipeline.py) on playwright.async_api pages
+One event loop owns the browser, its N pages and the live-view frame channel. Each page's
+Pipeline is a task in one TaskGroup on that loop: steps.run_async drives the pipeline's step scripts, so
+scanning, planning, the dispute form and the retry / breaker / pacing bookkeeping are the
+same code the sync worker runs, awaiting each Playwright call instead of blocking on it.
+
+Login still uses the visible sync worker (browser_worker.login_phase); the session is then
+handed to this engine through the storage-state snapshot.
+
+Usage: python async_engine.py
+"""
+import asyncio
+import base64
+import time
+
+import requests
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright
+
+from browser_worker import (
+    save_state, save_logs, log, log_event, load_worker_config, launch_browser, login_phase,
+    publish_persistent_stats, stop_requested, DashboardSink
+)
+from pipeline import Pipeline, FormExecutor
+from session_store import save_snapshot, load_snapshot, session_is_valid_steps, BILLING_URL, SESSION_FILE
+from screencast import FRAME_URL
+from steps import run_async
+from pacing import controller_for
+from fingerprints import fingerprints_for
+from priority import budget_for
+from resilience import retry_queue_for, breaker_for, WHOLE_INVOICE
+
+
+class FrameChannel:
+    """
+    Live-view channel on the engine's loop: CDP screencast frames from the
+    active page are kept as "latest only" and posted to the dashboard by a task.
+    """
+
+    def __init__(self, url=FRAME_URL, quality=60, max_fps=5):
+        self.url = url
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+        self.latest = None
+        self.last_frame_time = 0
+        self.cdp = None
+        self._new_frame = asyncio.Event()
+        self._http = requests.Session()
+
+    async def attach(self, page):
+        try:
+            self.cdp = await page.context.new_cdp_session(page)
+            self.cdp.on("Page.screencastFrame", self._on_frame)
+            await self.cdp.send("Page.startScreencast", {"format": "jpeg", "quality": self.quality})
+        except Exception as e:
+            log(f"Live view unavailable: {e}")
+            self.cdp = None
+
+    def _on_frame(self, params):
+        asyncio.ensure_future(self.cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]}))
+        now = time.time()
+        if now - self.last_frame_time < self.min_interval:
+            return
+        self.last_frame_time = now
+        self.latest = params["data"]
+        self._new_frame.set()
+
+    async def run(self):
+        """Post frames until cancelled"""
+        while True:
+            await self._new_frame.wait()
+            self._new_frame.clear()
+            frame, self.latest = self.latest, None
+            if not frame:
+                continue
+            try:
+                await asyncio.to_thread(self._http.post, self.url, data=base64.b64decode(frame),
+                                        timeout=2, headers={"Content-Type": "image/jpeg"})
+            except Exception:
+                pass
+
+
+class AsyncDisputeEngine:
+    """
+    Runs invoices on N pages of one browser context. Every page has its own Pipeline, run as
+    one task of a TaskGroup; the retry queue, circuit breaker, pacer, fingerprints and run
+    budget are shared, so the pages back off together. On a stop each page finishes its
+    current dispute; a page still busy after "stop_grace_seconds" is cancelled. A page that
+    crashes cancels the others. Either way every page's finally blocks (pacer slot, breaker
+    trial, prefetch tab) run before run() returns.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.page_count = max(1, int(config.get("async_pages", 1)))
+        # One breaker for all pages - they share the same (possibly degraded) site
+        self.retries = retry_queue_for(config)
+        self.breaker = breaker_for(config)
+        self.pacer = controller_for(config, max_limit=self.page_count)
+        self.fingerprints = fingerprints_for(config)
+        self.budget = budget_for(config)
+        self.aborted = False
+
+    def pipeline(self):
+        """A page's pipeline: its own planner and dashboard sink, the engine's shared controls"""
+        return Pipeline(self.config, executor=FormExecutor(self.config), sinks=[DashboardSink(self.config)],
+                        should_stop=lambda: self.aborted or stop_requested(),
+                        retries=self.retries, breaker=self.breaker, pacer=self.pacer,
+                        fingerprints=self.fingerprints, budget=self.budget)
+
+    async def run(self, context):
+        """Navigate, scan and dispute. Returns "completed" or "stopped"."""
+        if self.budget is not None:
+            self.budget.start()
+        scan_page = context.pages[0] if context.pages else await context.new_page()
+
+        frames = None
+        if self.config.get("live_view", True):
+            frames = FrameChannel(self.config.get("live_view_url", FRAME_URL), max_fps=self.config.get("live_view_fps", 5))
+            await frames.attach(scan_page)
+        helpers = [asyncio.create_task(frames.run())] if frames else []
+
+        extra_pages = []
+        try:
+            # ========== NAVIGATE + SCAN ==========
+            await scan_page.goto(self.config.get("billing_url", BILLING_URL), wait_until="domcontentloaded")
+            await asyncio.sleep(3)
+            pages = [scan_page]
+            pipelines = [self.pipeline()]
+            _, to_process = await run_async(pipelines[0].scan_steps(scan_page))
+            if not to_process:
+                log("No Duty/Tax invoices to process!")
+                return "completed"
+            log(f"📋 Processing {len(to_process)} Duty/Tax invoices on {self.page_count} page(s)...")
+
+            for _ in range(self.page_count - 1):
+                extra_pages.append(await context.new_page())
+                pages.append(extra_pages[-1])
+                pipelines.append(self.pipeline())
+            totals = [{"invoices": 0, "disputed": 0, "would_dispute": 0, "skipped": 0, "errors": 0}
+                      for _ in pages]
+
+            # ========== DISPUTE ==========
+            queue = asyncio.Queue()
+            for i, invoice in enumerate(to_process):
+                queue.put_nowait((invoice, None, (i + 1, len(to_process))))
+            status = await self._drain(pipelines, pages, totals, queue)
+
+            # ========== RETRIES ==========
+            if status == "completed":
+                for invoice, trackings in self.retries.due().items():
+                    queue.put_nowait((invoice, trackings, None))
+                status = await self._drain(pipelines, pages, totals, queue)
+        finally:
+            for task in helpers:
+                task.cancel()
+            await asyncio.gather(*helpers, return_exceptions=True)
+            for page in extra_pages:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+        if status == "stopped":
+            log("Stopping by user request...")
+            return status
+        summary = {key: sum(page_totals[key] for page_totals in totals) for key in totals[0]}
+        summary["retries"] = self.retries.summary()
+        summary["breaker"] = self.breaker.to_dict()
+        self.pacer.publish(min_interval=0)
+        summary["pacing"] = self.pacer.to_dict()
+        pipelines[0].emit("job_finished", summary)
+        return status
+
+    async def _drain(self, pipelines, pages, totals, queue):
+        """Work the queue with one task per page. "stopped" if any page was stopped or cancelled"""
+        async with asyncio.TaskGroup() as group:
+            work = [group.create_task(self._work(pipeline, page, page_totals, queue))
+                    for pipeline, page, page_totals in zip(pipelines, pages, totals)]
+            watcher = group.create_task(self._watch_stop(work))
+            await asyncio.wait(work)
+            watcher.cancel()
+        results = ["stopped" if task.cancelled() else task.result() for task in work]
+        return "stopped" if "stopped" in results else "completed"
+
+    async def _watch_stop(self, work):
+        """Once a stop is requested, give the pages the grace period to finish, then cancel them"""
+        while not (self.aborted or stop_requested() or (self.budget is not None and self.budget.spent(log))):
+            await asyncio.sleep(1)
+        self.aborted = True
+        grace = self.config.get("stop_grace_seconds", 60)
+        _, busy = await asyncio.wait(work, timeout=grace)
+        if busy:
+            log(f"⏹️ {len(busy)} page(s) still busy {grace}s after the stop - cancelling them")
+            for task in busy:
+                task.cancel()
+
+    async def _work(self, pipeline, page, totals, queue):
+        """One page: take invoices off the queue until it is empty or the run stops"""
+        pipeline.page = page
+        try:
+            while True:
+                if pipeline.should_stop():
+                    return "stopped"
+                try:
+                    invoice, trackings, position = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return "completed"
+                only = None
+                if trackings is None:
+                    pipeline.emit("invoice_started", invoice, *position)
+                else:
+                    only = None if WHOLE_INVOICE in trackings else set(trackings)
+                    pipeline.emit("retry_started", invoice, trackings)
+                if await run_async(pipeline.process_guarded_steps(pipeline.page, invoice, totals, only)) is None:
+                    return "stopped"
+        finally:
+            await run_async(pipeline.planner.close_steps())
+
+
+def login_with_visible_browser(config):
+    """Run the sync login phase in the visible browser and snapshot the session"""
+    with sync_playwright() as p:
+        browser_context, page = launch_browser(p, config)
+        try:
+            login_phase(browser_context, page, config)
+            save_snapshot(browser_context, config.get("session_file", SESSION_FILE))
+        finally:
+            browser_context.close()
+
+
+async def main_async(config):
+    # Same rule as the sync warm start: without a readable snapshot the context starts logged out
+    session_file = config.get("session_file", SESSION_FILE)
+    if load_snapshot(session_file) is None:
+        log_event("Login Warning", f"⚠️ No saved session in {session_file} - run the login again.", "warning")
+        return "error"
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=config.get("headless_processing", False),
+            channel="chrome",
+            args=["--disable-blink-features=AutomationControlled"]
+        )
+        context = await browser.new_context(
+            storage_state=session_file,
+            viewport={"width": 1280, "height": 720}
+        )
+        try:
+            # The sync worker's session check, run on this context
+            if not await run_async(session_is_valid_steps(context, config)):
+                log_event("Login Warning", "⚠️ Saved session is not valid - run the login again.", "warning")
+                return "error"
+            return await AsyncDisputeEngine(config).run(context)
+        finally:
+            await context.close()
+            await browser.close()
+
+
+def main():
+    """Async worker - visible login, then the coroutine engine for processing"""
+    print("=" * 50)
+    print("FedEx Dispute Bot - Async Worker")
+    print("=" * 50)
+
+    save_state({"command": "idle", "status": "waiting_for_login", "start_time": time.time()})
+    save_logs({"logs": [], "stats": {"disputed": 0, "skipped": 0, "errors": 0, "invoices_processed": 0, "total_invoices": 0}, "invoices": []})
+
+    config = load_worker_config()
+    if config is None:
+        return
+
+    login_with_visible_browser(config)
+    publish_persistent_stats()
+
+    save_state({"command": "processing", "status": "running"})
+    status = asyncio.run(main_async(config))
+    save_state({"command": "idle", "status": status})
+    print("Async Worker Finished")
+
+
+if __name__ == "__main__":
+    main()
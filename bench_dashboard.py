@@ -0,0 +1,126 @@
+"""
+Dashboard Benchmark - Simulates many dashboard clients against a running app.py
+Opens N live-view streams and M /status pollers while a fake worker publishes frames,
+then reports frames delivered per stream, poll latency and errors.
+
+Usage: python bench_dashboard.py [--streams 200] [--pollers 50] [--fps 5] [--duration 30]
+                                 [--url http://localhost:5000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from urllib.parse import urlparse
+
+FRAME_MARKER = b"--frame\r\n"
+
+
+async def _request(host, port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection(host, port)
+    head = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+    writer.write(head + body)
+    await writer.drain()
+    return reader, writer
+
+
+async def publisher(host, port, fps, deadline, result):
+    frame = b"\xff\xd8" + os.urandom(40 * 1024) + b"\xff\xd9"  # ~40 KB, a typical 1280x720 JPEG
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            reader, writer = await _request(host, port, "POST", "/update_frame", frame)
+            await reader.read()
+            writer.close()
+            result["published"] += 1
+        except OSError:
+            result["errors"] += 1
+        await asyncio.sleep(max(0, 1.0 / fps - (time.time() - started)))
+
+
+async def stream_client(host, port, deadline, result):
+    frames = 0
+    try:
+        reader, writer = await _request(host, port, "GET", "/video_feed")
+        status = await reader.readline()
+        if b" 200 " not in status:
+            result["rejected"] += 1
+            writer.close()
+            return
+        tail = b""
+        while time.time() < deadline:
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), deadline - time.time())
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data = tail + chunk
+            frames += data.count(FRAME_MARKER)
+            tail = data[-(len(FRAME_MARKER) - 1):]
+        writer.close()
+    except OSError:
+        result["errors"] += 1
+    result["frames"].append(frames)
+
+
+async def poller(host, port, deadline, result, interval=1.0):
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            reader, writer = await _request(host, port, "GET", "/status")
+            response = await reader.read()
+            writer.close()
+            if b" 200 " in response.split(b"\r\n", 1)[0]:
+                result["latencies"].append(time.time() - started)
+            else:
+                result["errors"] += 1
+        except OSError:
+            result["errors"] += 1
+        await asyncio.sleep(max(0, interval - (time.time() - started)))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(url, streams, pollers, fps, duration):
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    result = {"published": 0, "frames": [], "latencies": [], "errors": 0, "rejected": 0}
+    deadline = time.time() + duration
+
+    tasks = [publisher(host, port, fps, deadline, result)]
+    tasks += [stream_client(host, port, deadline, result) for _ in range(streams)]
+    tasks += [poller(host, port, deadline, result) for _ in range(pollers)]
+    await asyncio.gather(*tasks)
+
+    frames = result["frames"] or [0]
+    latencies = result["latencies"]
+    print("=" * 60)
+    print(f"Dashboard benchmark: {streams} streams, {pollers} pollers, {fps} fps, {duration}s")
+    print("=" * 60)
+    print(f"Frames published:        {result['published']}")
+    print(f"Frames per stream:       min {min(frames)} / median {statistics.median(frames)} / max {max(frames)}")
+    print(f"Stream delivery ratio:   {statistics.mean(frames) / max(1, result['published']):.0%}")
+    print(f"Streams rejected (503):  {result['rejected']}")
+    print(f"/status polls:           {len(latencies)}")
+    print(f"/status latency:         p50 {_percentile(latencies, 0.5) * 1000:.0f} ms / "
+          f"p95 {_percentile(latencies, 0.95) * 1000:.0f} ms / max {max(latencies or [0]) * 1000:.0f} ms")
+    print(f"Errors:                  {result['errors']}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the dashboard with simulated clients")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--streams", type=int, default=200, help="concurrent /video_feed clients")
+    parser.add_argument("--pollers", type=int, default=50, help="concurrent /status pollers (1 Hz)")
+    parser.add_argument("--fps", type=float, default=5, help="frames published per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.streams, args.pollers, args.fps, args.duration))
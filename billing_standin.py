@@ -0,0 +1,122 @@
+"""
+Billing Stand-in - Local stand-in for the FedEx billing endpoints the bot talks to
+Used to check the direct submission path offline, without touching the real portal,
+and to run remote workers end to end on localhost: it serves an invoice list and
+invoice pages (shipments + Dispute Activity) for a fixed set of generated invoices.
+
+Usage: python billing_standin.py [port] [invoice count]
+"""
+import html
+import random
+import sys
+import threading
+from datetime import date, timedelta
+from flask import Flask, jsonify, request
+
+from config import load_config
+from direct_submit import load_request_shape, validate_against_shape, EXAMPLE_SHAPE_FILE
+
+app = Flask(__name__)
+
+# Disputes filed against the stand-in, keyed by (invoice, tracking)
+filed_disputes = {}
+filed_lock = threading.Lock()
+
+INVOICE_COUNT = 8
+
+
+def make_invoices(count=INVOICE_COUNT, seed=7, today=None):
+    """Deterministic invoices: {"1-234-56789": {"type", "invoice_date", "due_date", "shipments": [(tracking, amount)]}}"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    invoices = {}
+    for i in range(count):
+        number = f"{rng.randint(1, 9)}-{rng.randint(100, 999)}-{rng.randint(10000, 99999)}"
+        invoice_date = today - timedelta(days=rng.randint(1, 150))
+        shipments = [(str(rng.randint(10 ** 11, 10 ** 12 - 1)), f"{rng.uniform(1, 400):.2f}")
+                     for _ in range(rng.randint(2, 6))]
+        invoices[number] = {
+            "type": "Transportation" if i % 5 == 4 else "Duty/Tax",
+            "invoice_date": invoice_date,
+            "due_date": invoice_date + timedelta(days=30),
+            "shipments": shipments
+        }
+    return invoices
+
+
+invoices_by_number = make_invoices()
+
+
+def _rows(cells_list):
+    return "".join("<tr>" + "".join(f"<td>{html.escape(str(c))}</td>" for c in cells) + "</tr>" for cells in cells_list)
+
+
+def current_shape():
+    config = load_config()
+    return load_request_shape(config) or load_request_shape(config, EXAMPLE_SHAPE_FILE)
+
+
+@app.route('/online/billing/cbs/invoices')
+def invoices():
+    # Session probe target and invoice list (newest first, like the portal)
+    listed = sorted(invoices_by_number.items(), key=lambda item: item[1]["invoice_date"], reverse=True)
+    rows = _rows([number, inv["type"], inv["invoice_date"].strftime("%m/%d/%Y"), inv["due_date"].strftime("%m/%d/%Y"),
+                  f"${sum(float(amount) for _, amount in inv['shipments']):.2f}"] for number, inv in listed)
+    return ("<html><body><h1>INVOICES</h1><table><thead><tr><th>Invoice number</th><th>Type</th>"
+            "<th>Invoice date</th><th>Due date</th><th>Amount due</th></tr></thead>"
+            f"<tbody>{rows}</tbody></table></body></html>")
+
+
+@app.route('/online/billing/cbs/invoices/invoice-details')
+def invoice_details():
+    number = request.args.get("invoiceNumber", "")
+    invoice = next((inv for key, inv in invoices_by_number.items() if key.replace("-", "") == number), None)
+    if invoice is None:
+        return "<html><body><h1>Invoice not found</h1></body></html>", 404
+    with filed_lock:
+        filed = [(entry["disputeId"], tracking, entry["filed"]) for (inv, tracking), entry in filed_disputes.items()
+                 if inv == number]
+    disputed = {tracking for _, tracking, _ in filed}
+    shipments = _rows([tracking, invoice["invoice_date"].strftime("%m/%d/%Y"), f"${amount}",
+                       "In dispute" if tracking in disputed else "Open"] for tracking, amount in invoice["shipments"])
+    activity = _rows([dispute_id, tracking, "Duty/Tax", filed_on] for dispute_id, tracking, filed_on in filed)
+    return ("<html><body><h1>INVOICE " + html.escape(number) + "</h1>"
+            "<table><thead><tr><th>Tracking ID</th><th>Ship date</th><th>Amount due</th><th>Status</th></tr></thead>"
+            f"<tbody>{shipments}</tbody></table>"
+            "<h2>Dispute Activity</h2><table><thead><tr><th>Dispute ID</th><th>Air waybill</th>"
+            f"<th>Dispute reason</th><th>Date</th></tr></thead><tbody>{activity}</tbody></table></body></html>")
+
+
+@app.route('/api/disputes', methods=['POST'])
+def create_dispute():
+    shape = current_shape()
+    body = request.get_json(silent=True)
+    if body is None:
+        return jsonify({"errors": ["body must be JSON"]}), 400
+
+    problems = validate_against_shape(body, shape) if shape else []
+    if problems:
+        return jsonify({"errors": problems}), 400
+
+    key = (body.get("invoiceNumber"), body.get("trackingNumber"))
+    with filed_lock:
+        if key in filed_disputes:
+            return jsonify({"errors": ["Item already in dispute status"]}), 409
+        dispute_id = f"D{len(filed_disputes) + 1:06d}"
+        filed_disputes[key] = {"disputeId": dispute_id, "body": body, "filed": date.today().strftime("%m/%d/%Y")}
+
+    return jsonify({"disputeId": dispute_id})
+
+
+@app.route('/api/disputes', methods=['GET'])
+def list_disputes():
+    with filed_lock:
+        return jsonify([entry for entry in filed_disputes.values()])
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5050
+    if len(sys.argv) > 2:
+        invoices_by_number = make_invoices(int(sys.argv[2]))
+    print(f"Billing stand-in on http://localhost:{port}")
+    app.run(port=port, threaded=True)
@@ -1,12 +1,14 @@
 import time
-import re
+import queue
 import threading
-import os
 import asyncio
 import sys
 from datetime import datetime
 from typing import Callable, Optional, List, Dict
 from playwright.sync_api import sync_playwright, Page, BrowserContext
+from log_writer import SessionLogWriter
+from screencast import ScreenshotFileRelay
+from pipeline import Pipeline, Sink, FormExecutor
 
 # Fix for Windows asyncio + threading issue
 if sys.platform == 'win32':
@@ -23,6 +25,91 @@ class BotState:
     ANALYZING = "analyzing"
     READY_TO_PROCESS = "ready_to_process"
 
+# Allowed state changes; anything else is rejected by FedExDisputeBot._transition
+TRANSITIONS = {
+    BotState.IDLE: {BotState.WAITING_FOR_LOGIN},
+    BotState.WAITING_FOR_LOGIN: {BotState.ANALYZING, BotState.STOPPED, BotState.ERROR},
+    BotState.ANALYZING: {BotState.READY_TO_PROCESS, BotState.STOPPED, BotState.ERROR},
+    BotState.READY_TO_PROCESS: {BotState.RUNNING, BotState.ANALYZING, BotState.STOPPED, BotState.ERROR},
+    BotState.RUNNING: {BotState.PAUSED, BotState.COMPLETED, BotState.STOPPED, BotState.ERROR},
+    BotState.PAUSED: {BotState.RUNNING, BotState.STOPPED, BotState.ERROR},
+    BotState.COMPLETED: {BotState.WAITING_FOR_LOGIN},
+    BotState.STOPPED: {BotState.WAITING_FOR_LOGIN},
+    BotState.ERROR: {BotState.WAITING_FOR_LOGIN},
+}
+
+# Command -> (state it is valid in, state it moves to)
+COMMANDS = {
+    "analyze": ({BotState.WAITING_FOR_LOGIN, BotState.READY_TO_PROCESS}, BotState.ANALYZING),
+    "process": ({BotState.READY_TO_PROCESS}, BotState.RUNNING),
+    "pause": ({BotState.RUNNING}, BotState.PAUSED),
+    "resume": ({BotState.PAUSED}, BotState.RUNNING),
+    "stop": (set(TRANSITIONS) - {BotState.IDLE, BotState.COMPLETED, BotState.STOPPED, BotState.ERROR}, BotState.STOPPED),
+}
+
+class BotStopped(Exception):
+    """Raised on the bot thread when a stop command is applied"""
+
+class BotSink(Sink):
+    """Pipeline events -> FedExDisputeBot log, stats and UI callbacks"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def log(self, message, level="INFO"):
+        self.bot.log(message, level)
+
+    def invoices_found(self, found, selected):
+        if self.bot.invoices_callback:
+            self.bot.invoices_callback(found)
+        self.bot.log(f"Analysis: Found {len(found)} total invoices, {len(selected)} to process.", "INFO")
+
+    def invoice_started(self, invoice, index, total):
+        self.bot.update_stats("total_invoices", total)
+        self.bot.update_stats("invoices_processed", index)
+        self.bot.update_stats("current_invoice", invoice)
+        if self.bot.progress_callback:
+            self.bot.progress_callback(index, total)
+        self.bot.log(f"Processing Invoice {index}/{total}: {invoice}", "INFO")
+
+    def invoice_planned(self, work):
+        for tracking in work.shipments:
+            if tracking in work.duty_tax:
+                self.bot.log(f"Skipping {tracking} (already disputed for Duty/Tax)", "INFO")
+                self.bot.update_stats("skipped", increment=True)
+
+    def dispute_result(self, invoice, tracking, amount, outcome, detail=""):
+        if outcome == "disputed":
+            self.bot.log(f"Successfully disputed {tracking}", "SUCCESS")
+            self.bot.update_stats("disputed", increment=True)
+        elif outcome == "skipped":
+            self.bot.log(f"Skipping {tracking} (already in dispute)", "INFO")
+            self.bot.update_stats("skipped", increment=True)
+        else:
+            self.bot.log(f"Failed to dispute {tracking} ({outcome})", "ERROR")
+            self.bot.update_stats("errors", increment=True)
+
+    def invoice_finished(self, work, counts, status, partial=False):
+        self.bot.log(f"Finished invoice {work.invoice}", "WARNING" if partial else "SUCCESS")
+
+    def invoice_error(self, invoice, error):
+        self.bot.log(f"Error processing invoice {invoice}: {error}", "ERROR")
+        self.bot.update_stats("errors", increment=True)
+
+    def page_switched(self, page):
+        # Screenshots and the live view follow the tab the pipeline is working in
+        self.bot.page = page
+        if self.bot.screenshots:
+            self.bot.screenshots.attach(page)
+
+    def retry_started(self, invoice, trackings):
+        self.bot.log(f"Retrying invoice {invoice} ({len(trackings)} pending)", "INFO")
+
+    def job_finished(self, totals):
+        retries = totals.get("retries")
+        if retries and retries["items"]:
+            self.bot.log(f"Pending retry: {retries['pending']}, gave up: {retries['exhausted']}", "WARNING")
+
 class FedExDisputeBot:
     def __init__(self, config: dict):
         self.config = config
@@ -31,14 +118,22 @@ class FedExDisputeBot:
         self.browser_context = None
         self.page = None
         self.thread = None
-        self.stop_event = threading.Event()
-        self.pause_event = threading.Event()
-        self.pause_event.set()
         
-        # Create logs directory
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
-        self.log_file = f"logs/session_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
+        # UI threads only enqueue commands; the bot thread applies them, so only it changes state
+        self.commands = queue.Queue()
+        self.state_lock = threading.Lock()
+        self.state_entered_at = time.time()
+        self.state_metrics = {}        # state -> {"entries": n, "seconds": total}
+        self.command_latency = {"last_ms": 0.0, "max_ms": 0.0}
+        
+        # Buffered, rotating session log (creates logs/ and compresses old segments)
+        self.log_writer = SessionLogWriter(
+            directory="logs",
+            name=f"session_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}",
+            max_bytes=config.get("log_max_mb", 5) * 1024 * 1024,
+            max_total_bytes=config.get("log_max_total_mb", 200) * 1024 * 1024,
+            max_age_days=config.get("log_retention_days", 30)
+        )
         
         # Log history for UI sync
         self.log_history = []
@@ -54,13 +149,22 @@ class FedExDisputeBot:
         }
         
         self.found_invoices = [] # List of invoices found during analysis
+        self.to_process = [] # Duty/Tax invoices selected for processing
+        
+        # Shared navigate -> scan -> dispute flow; results come back through BotSink
+        self.pipeline = Pipeline(config, executor=FormExecutor(config), sinks=[BotSink(self)],
+                                 should_stop=self._stop_requested)
         
         # Callbacks (optional, may not work with Streamlit threads)
         self.log_callback: Optional[Callable[[str, str], None]] = None
         self.stats_callback: Optional[Callable[[dict], None]] = None
         self.progress_callback: Optional[Callable[[int, int], None]] = None
         self.invoices_callback: Optional[Callable[[list], None]] = None
-        self.screenshot_path = "latest_view.png"
+        self.screenshot_path = "latest_view.jpg"
+        # Frames are written by the screencast's own thread; the page.screenshot fallback is throttled
+        self.screenshots = None
+        self.screenshot_interval = 1.0 / config.get("screenshot_fps", 2)
+        self.last_screenshot = 0
 
     def set_callbacks(self, log_cb=None, stats_cb=None, progress_cb=None, invoices_cb=None):
         self.log_callback = log_cb
@@ -69,12 +173,33 @@ class FedExDisputeBot:
         self.invoices_callback = invoices_cb
 
     def capture_screenshot(self):
-        """Captures a screenshot of the current page state"""
+        """
+        Keeps latest_view.jpg current without blocking the automation step.
+        With the CDP screencast running this is a no-op: Chrome pushes a frame on every
+        repaint and a background thread writes it. Otherwise take a throttled JPEG.
+        """
+        if not self.page or self.page.is_closed():
+            return
+        if self.screenshots and self.screenshots.cdp:
+            return
+        now = time.time()
+        if now - self.last_screenshot < self.screenshot_interval:
+            return
+        self.last_screenshot = now
+        try:
+            self.page.screenshot(path=self.screenshot_path, type="jpeg", quality=60)
+        except Exception as e:
+            print(f"Screenshot failed: {e}")
+
+    def _idle_wait(self, seconds):
+        """Sleep between polls; inside Playwright so screencast frames keep arriving"""
         if self.page and not self.page.is_closed():
             try:
-                self.page.screenshot(path=self.screenshot_path)
-            except Exception as e:
-                print(f"Screenshot failed: {e}")
+                self.page.wait_for_timeout(seconds * 1000)
+                return
+            except:
+                pass
+        time.sleep(seconds)
 
     def log(self, message: str, level: str = "INFO"):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -92,8 +217,7 @@ class FedExDisputeBot:
         
         # Write to file
         try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(formatted_msg + "\n")
+            self.log_writer.write(formatted_msg, level)
         except: pass
         
         # Callback to UI (may not work with Streamlit threads)
@@ -112,14 +236,81 @@ class FedExDisputeBot:
         if self.stats_callback:
             self.stats_callback(self.stats)
 
+    def _transition(self, new_state):
+        """Move to new_state if TRANSITIONS allows it; records time spent in the old state"""
+        with self.state_lock:
+            if new_state not in TRANSITIONS.get(self.state, set()):
+                return False
+            now = time.time()
+            metrics = self.state_metrics.setdefault(self.state, {"entries": 0, "seconds": 0.0})
+            metrics["seconds"] += now - self.state_entered_at
+            self.state_metrics.setdefault(new_state, {"entries": 0, "seconds": 0.0})["entries"] += 1
+            self.state = new_state
+            self.state_entered_at = now
+            return True
+
+    def get_metrics(self):
+        """Per-state entry counts and seconds (including the current state so far), command latency, pacing and breaker"""
+        with self.state_lock:
+            metrics = {state: dict(m) for state, m in self.state_metrics.items()}
+            current = metrics.setdefault(self.state, {"entries": 0, "seconds": 0.0})
+            current["seconds"] += time.time() - self.state_entered_at
+            return {
+                "state": self.state,
+                "states": {state: {"entries": m["entries"], "seconds": round(m["seconds"], 2)}
+                           for state, m in metrics.items()},
+                "command_latency_ms": dict(self.command_latency),
+                "pacing": self.pipeline.pacer.to_dict() if self.pipeline.pacer else None,
+                "breaker": self.pipeline.breaker.to_dict() if self.pipeline.breaker else None
+            }
+
+    def send_command(self, command):
+        """Queue a command for the bot thread (returns immediately)"""
+        self.commands.put((command, time.time()))
+
+    def _apply_command(self, command, sent_at):
+        latency = (time.time() - sent_at) * 1000
+        self.command_latency["last_ms"] = round(latency, 2)
+        self.command_latency["max_ms"] = round(max(self.command_latency["max_ms"], latency), 2)
+
+        valid_from, new_state = COMMANDS[command]
+        if self.state not in valid_from or not self._transition(new_state):
+            self.log(f"Ignoring '{command}' while {self.state}.", "WARNING")
+            return
+        if command == "pause":
+            self.log("Bot paused.", "WARNING")
+        elif command == "resume":
+            self.log("Bot resumed.", "INFO")
+        elif command == "stop":
+            self.log("Bot stopped.", "WARNING")
+            raise BotStopped()
+
+    def _next_command(self, timeout):
+        """
+        Wait up to `timeout` seconds for a command and apply it; returns True if one was applied.
+        Wakes as soon as a command is queued; between checks Playwright is pumped so
+        screencast frames keep arriving.
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                command, sent_at = self.commands.get(timeout=min(0.05, max(0, deadline - time.time())))
+            except queue.Empty:
+                if time.time() >= deadline:
+                    return False
+                self._idle_wait(0.001)
+                continue
+            self._apply_command(command, sent_at)
+            return True
+
     def start_browser(self):
         """Phase 1: Launch browser and wait for login"""
-        if self.state == BotState.RUNNING or self.state == BotState.WAITING_FOR_LOGIN:
+        if self.thread is not None or not self._transition(BotState.WAITING_FOR_LOGIN):
             return
         
-        self.stop_event.clear()
-        self.pause_event.set()
-        self.state = BotState.WAITING_FOR_LOGIN
+        # Drop commands left over from an earlier run
+        while not self.commands.empty():
+            self.commands.get_nowait()
         
         self.thread = threading.Thread(target=self._launch_and_wait)
         self.thread.daemon = True
@@ -127,19 +318,11 @@ class FedExDisputeBot:
 
     def start_analysis(self):
         """Phase 2: Navigate to invoices and analyze list"""
-        if self.state != BotState.WAITING_FOR_LOGIN:
-            return
-        
-        # Just change state - the main loop running in _launch_and_wait will pick this up
-        self.state = BotState.ANALYZING
+        self.send_command("analyze")
 
     def start_processing(self):
         """Phase 3: Process the found invoices"""
-        if self.state != BotState.READY_TO_PROCESS:
-            return
-        
-        # Just change state - the main loop will pick this up
-        self.state = BotState.RUNNING
+        self.send_command("process")
 
     def _launch_and_wait(self):
         try:
@@ -160,6 +343,10 @@ class FedExDisputeBot:
                 self.page = self.browser_context.pages[0]
                 self.log("Browser context created.", "INFO")
                 
+                self.screenshots = ScreenshotFileRelay(
+                    self.screenshot_path, max_fps=self.config.get("screenshot_fps", 2))
+                self.screenshots.attach(self.page)
+                
                 # TAKE INITIAL SCREENSHOT IMMEDIATELY
                 self.capture_screenshot()
                 
@@ -178,353 +365,88 @@ class FedExDisputeBot:
                 self.log("Browser launched. Please log in manually if needed.", "WARNING")
                 self.log("Waiting for user to click 'Analyze Invoices'...", "INFO")
                 
-                # Keep browser open and update screenshots while waiting
-                while self.state == BotState.WAITING_FOR_LOGIN and not self.stop_event.is_set():
-                    self.capture_screenshot()
-                    time.sleep(1)
-                    
-                # If state changed to ANALYZING, we keep the browser open but exit this thread loop
-                # The actual Playwright context needs to be kept alive.
-                # We can't close the context here if we want to continue.
-                # Ideally, we run one persistent thread that handles messages/states.
-                
-                # REFACTOR: We need a single main loop that handles state transitions
-                # to keep the playwright context alive in one thread.
+                # One loop on this thread owns the Playwright context and every state change
                 self._main_loop()
                 
+        except BotStopped:
+            pass
         except Exception as e:
             self.log(f"Bot crashed: {e}", "ERROR")
-            self.state = BotState.ERROR
+            self._transition(BotState.ERROR)
             import traceback
             traceback.print_exc()
         finally:
+            if self.screenshots:
+                self.screenshots.stop()
+                self.screenshots = None
             if self.browser_context:
                 try:
                     self.browser_context.close()
                 except: pass
+            self.log_writer.flush()
             self.thread = None
 
     def _main_loop(self):
-        """Main loop that runs inside the Playwright context"""
-        while not self.stop_event.is_set():
+        """Main loop that runs inside the Playwright context, driven by the command queue"""
+        while True:
             if self.state == BotState.ANALYZING:
-                self._navigate_to_invoices()
                 self._scan_invoices()
-                self.state = BotState.READY_TO_PROCESS
+                self._transition(BotState.READY_TO_PROCESS)
                 self.log("Analysis complete. Ready to process.", "SUCCESS")
                 
             elif self.state == BotState.RUNNING: # Processing phase
                 self._process_invoices_loop()
-                self.state = BotState.COMPLETED
+                self._transition(BotState.COMPLETED)
                 self.log("All tasks completed.", "SUCCESS")
                 break # Exit loop when done
                 
-            elif self.state == BotState.WAITING_FOR_LOGIN:
-                self.capture_screenshot()
-                time.sleep(1)
-                
-            elif self.state == BotState.PAUSED:
-                self.capture_screenshot()
-                time.sleep(1)
-            
-            elif self.state == BotState.READY_TO_PROCESS:
-                self.capture_screenshot()
-                time.sleep(1)
-                
             else:
-                time.sleep(0.5)
+                # Waiting for login / ready to process: block until the next command
+                self.capture_screenshot()
+                self._next_command(1)
 
     def _check_control_signals(self):
-        """Check for pause/stop signals"""
-        if self.stop_event.is_set():
-            raise Exception("Bot stopped by user")
-        
-        while not self.pause_event.is_set():
-            self.capture_screenshot()
-            time.sleep(0.5)
-            if self.stop_event.is_set():
-                raise Exception("Bot stopped by user")
-
-    def _navigate_to_invoices(self):
-        """Navigate from logged-in page to invoices list"""
-        page = self.page
-        self.log("Navigating to invoices...", "INFO")
-        self.capture_screenshot()
-        
-        try:
-            # Try clicking "PAY A BILL" or similar
-            pay_bill = page.locator("text=PAY A BILL").first
-            if pay_bill.is_visible(timeout=3000):
-                pay_bill.click()
-                time.sleep(2)
-                self.capture_screenshot()
-        except:
-            pass
-        
-        try:
-            # Try clicking "FedEx Billing Online"
-            billing_link = page.locator("text=FedEx Billing Online").first
-            if billing_link.is_visible(timeout=3000):
-                billing_link.click()
-                time.sleep(3)
-                self.capture_screenshot()
-        except:
-            pass
-        
-        try:
-            # Handle any popups
-            close_btn = page.locator("button:has-text('Close'), button:has-text('CLOSE')").first
-            if close_btn.is_visible(timeout=1000):
-                close_btn.click()
-                time.sleep(1)
-        except:
-            pass
-        
-        try:
-            # Click INVOICES
-            invoices_link = page.locator("text=INVOICES").first
-            if invoices_link.is_visible(timeout=5000):
-                invoices_link.click()
-                time.sleep(3)
-                self.capture_screenshot()
-        except:
-            pass
+        """Apply queued pause/resume/stop commands; blocks here while paused"""
+        while not self.commands.empty():
+            self._next_command(0)
         
-        # If we're still not on invoices page, try direct URL
-        if "invoices" not in page.url.lower():
-            self.log("Trying direct navigation to invoices...", "INFO")
-            page.goto("https://www.fedex.com/online/billing/cbs/invoices", wait_until="domcontentloaded")
-            time.sleep(3)
+        while self.state == BotState.PAUSED:
             self.capture_screenshot()
-        
-        self.log("Navigation complete.", "INFO")
+            self._next_command(1)
 
     def pause(self):
         """Pause the bot"""
-        self.pause_event.clear()
-        self.state = BotState.PAUSED
-        self.log("Bot paused.", "WARNING")
+        self.send_command("pause")
 
     def resume(self):
         """Resume the bot"""
-        self.pause_event.set()
-        self.state = BotState.RUNNING
-        self.log("Bot resumed.", "INFO")
+        self.send_command("resume")
 
     def stop(self):
         """Stop the bot"""
-        self.stop_event.set()
-        self.pause_event.set()  # Unblock if paused
-        self.state = BotState.STOPPED
-        self.log("Bot stopped.", "WARNING")
+        if self.thread is None:
+            # No bot thread to apply it
+            if self._transition(BotState.STOPPED):
+                self.log("Bot stopped.", "WARNING")
+            return
+        self.send_command("stop")
+
+    def _stop_requested(self):
+        """Pipeline stop check: applies queued commands (blocking while paused)"""
+        try:
+            self._check_control_signals()
+            return False
+        except BotStopped:
+            return True
 
     def _scan_invoices(self):
         self._check_control_signals()
-        page = self.page
-        
         self.log("Scanning invoice list...", "INFO")
         self.capture_screenshot()
-        
-        try:
-            page.wait_for_selector("table tbody", timeout=30000)
-            time.sleep(2)
-        except Exception as e:
-            self.log(f"Error waiting for table: {e}", "ERROR")
-            return
-
-        # Scan rows
-        all_rows = page.locator("tbody tr").all()
-        self.found_invoices = []
-        
-        for row in all_rows:
-            row_text = row.text_content() or ""
-            invoice_match = re.search(r'\d-\d{3}-\d{5}', row_text)
-            invoice_num = invoice_match.group() if invoice_match else "Unknown"
-            
-            status = "Unknown"
-            if "Transportation" in row_text: status = "Transportation"
-            elif "OPEN IN DISPUTE" in row_text: status = "Disputed"
-            elif "Duty/Tax" in row_text: status = "Duty/Tax"
-            
-            self.found_invoices.append({
-                "invoice": invoice_num,
-                "type": status,
-                "text": row_text
-            })
-            
-        if self.invoices_callback:
-            self.invoices_callback(self.found_invoices)
-            
-        duty_tax_count = sum(1 for inv in self.found_invoices if inv["type"] == "Duty/Tax")
-        self.log(f"Analysis: Found {len(self.found_invoices)} total invoices, {duty_tax_count} to process.", "INFO")
+        # Fully handled, unchanged invoices are already left out of the selection
+        self.found_invoices, self.to_process = self.pipeline.scan(self.page)
         self.capture_screenshot()
 
     def _process_invoices_loop(self):
-        # Filter for duty/tax only
-        to_process = [inv["invoice"] for inv in self.found_invoices if inv["type"] == "Duty/Tax"]
-        
-        total = len(to_process)
-        self.update_stats("total_invoices", total)
-        
-        for i, invoice_num in enumerate(to_process):
-            self._check_control_signals()
-            
-            self.update_stats("invoices_processed", i + 1)
-            self.update_stats("current_invoice", invoice_num)
-            
-            if self.progress_callback:
-                self.progress_callback(i + 1, total)
-                
-            self.log(f"Processing Invoice {i+1}/{total}: {invoice_num}", "INFO")
-            
-            try:
-                self._process_single_invoice(invoice_num)
-            except Exception as e:
-                self.log(f"Error processing invoice {invoice_num}: {e}", "ERROR")
-                self.update_stats("errors", increment=True)
-                try:
-                    self.page.goto("https://www.fedex.com/online/billing/cbs/invoices")
-                    time.sleep(3)
-                except: pass
-
-    def _process_single_invoice(self, invoice_number):
-        page = self.page
-        
-        # Navigate directly
-        invoice_no_clean = invoice_number.replace("-", "")
-        account_no = self.config.get("account_number", "202744967") # Should be config
-        invoice_url = f"https://www.fedex.com/online/billing/cbs/invoices/invoice-details?accountNo={account_no}&countryCode=CA&invoiceNumber={invoice_no_clean}"
-        
-        page.goto(invoice_url)
-        time.sleep(3)
-        
-        if "invoice-details" not in page.url:
-            self.log(f"Failed to load invoice {invoice_number}", "ERROR")
-            return
-
-        # Process shipments logic (copied from original bot with improvements)
-        self._process_shipments_in_page()
-        
-        self.log(f"Finished invoice {invoice_number}", "SUCCESS")
-        page.go_back()
-        time.sleep(2)
-
-    def _process_shipments_in_page(self):
-        page = self.page
-        
-        # 1. Check Dispute Activity
-        already_disputed_duty_tax = set()
-        try:
-            dispute_section = page.locator("text=Dispute Activity").first
-            if dispute_section.is_visible(timeout=3000):
-                dispute_section.click()
-                time.sleep(1)
-                
-                duty_tax_rows = page.locator("tr:has-text('Duty/Tax')").all()
-                for row in duty_tax_rows:
-                    row_text = row.text_content() or ""
-                    tracking_nums = re.findall(r'\b\d{12}\b', row_text)
-                    already_disputed_duty_tax.update(tracking_nums)
-        except: pass
-        
-        # 2. Process rows
-        try:
-            page.wait_for_selector("tbody tr", timeout=10000)
-            time.sleep(2)
-            rows = page.locator("tbody tr").all()
-            
-            for row in rows:
-                self._check_control_signals()
-                
-                row_text = row.text_content() or ""
-                tracking_nums = re.findall(r'\b\d{12}\b', row_text)
-                
-                if not tracking_nums: continue
-                tracking_num = tracking_nums[0]
-                
-                if tracking_num in already_disputed_duty_tax:
-                    self.log(f"Skipping {tracking_num} (already disputed for Duty/Tax)", "INFO")
-                    self.update_stats("skipped", increment=True)
-                    continue
-                    
-                # Process dispute
-                self.log(f"Disputing tracking {tracking_num}...", "INFO")
-                try:
-                    # Click menu
-                    btns = row.locator("button").all()
-                    if not btns: continue
-                    
-                    btns[0].evaluate("element => element.click()")
-                    time.sleep(0.5)
-                    
-                    page.get_by_text("Dispute", exact=True).click()
-                    time.sleep(1)
-                    
-                    if self._handle_dispute_form():
-                        self.log(f"Successfully disputed {tracking_num}", "SUCCESS")
-                        self.update_stats("disputed", increment=True)
-                    else:
-                        self.log(f"Failed to dispute {tracking_num}", "ERROR")
-                        self.update_stats("errors", increment=True)
-                        
-                    self._handle_error_popup()
-                    
-                    # Check if stuck
-                    if "create-dispute" in page.url:
-                        page.go_back()
-                        time.sleep(2)
-                        
-                except Exception as e:
-                    self.log(f"Error disputing {tracking_num}: {e}", "ERROR")
-                    self.update_stats("errors", increment=True)
-                    continue
-                    
-        except Exception as e:
-            self.log(f"Error processing shipments table: {e}", "ERROR")
-
-    def _handle_dispute_form(self):
-        page = self.page
-        try:
-            # Similar to original handle_dispute_form
-            page.wait_for_selector("div[role='dialog'], text=Dispute type", timeout=5000)
-            
-            # 1. Dispute Type
-            try:
-                page.click("text=Select >> nth=0")
-                time.sleep(0.5)
-                page.click("text=Incorrect charge")
-                time.sleep(1)
-            except: return False
-            
-            # 2. Dispute Reason
-            try:
-                page.click("text=Select >> nth=0")
-                time.sleep(0.5)
-                page.click("text=Duty/Tax")
-                time.sleep(1)
-            except: return False
-            
-            # 3. Comment
-            comment = self.config.get("dispute_comment", "Dispute per logic")
-            try:
-                page.locator("textarea").first.fill(comment)
-            except:
-                page.locator("input[type='text']").last.fill(comment)
-                
-            # 4. Submit
-            page.locator("button:has-text('SUBMIT'), button:has-text('Submit')").first.click()
-            time.sleep(3)
-            
-            return True
-        except:
-            return False
-
-    def _handle_error_popup(self):
-        page = self.page
-        try:
-            if page.locator("text=ERROR CODE").is_visible(timeout=500):
-                self.log("Handling error popup...", "WARNING")
-                page.locator("button:has-text('CLOSE')").click()
-                time.sleep(1)
-        except: pass
-
+        if self.pipeline.run(self.page, self.to_process) == "stopped":
+            raise BotStopped()
@@ -8,7 +8,50 @@ DEFAULT_CONFIG = {
     "account_number": "202744967",
     "dispute_comment": "Reason for dispute- Products are CUSMA compliant. COO is Canada. FTN CCP 10221998 / PWDBW 7702060 Database and USMCA on file.",
     "headless": False,
-    "fedex_url": "https://www.fedex.com/en-ca/logged-in-home.html"
+    "headless_processing": False,
+    "live_view": True,
+    "live_view_fps": 5,
+    "worker_max_jobs": 20,
+    "async_pages": 1,
+    "stop_grace_seconds": 60,
+    "submission_mode": "ui",
+    "run_mode": "interleaved",
+    "plan_tabs": 4,
+    "record_dispute_request": False,
+    "dispute_request_shape": "dispute_request_shape.json",
+    "worker_max_memory_growth_mb": 500,
+    "log_max_mb": 5,
+    "log_max_total_mb": 200,
+    "log_retention_days": 30,
+    "screenshot_fps": 2,
+    "dashboard_server": "gevent",
+    "dashboard_port": 5000,
+    "dashboard_threads": 64,
+    "stream_max_clients": 200,
+    "retry_max_attempts": 5,
+    "retry_base_seconds": 60,
+    "breaker_error_rate": 0.5,
+    "breaker_cooldown_seconds": 120,
+    "pacing_initial_delay": 0.5,
+    "pacing_max_delay": 30,
+    "pacing_slow_factor": 2.0,
+    "skip_handled_invoices": True,
+    "fingerprint_max_age_days": 7,
+    "prefetch_next_invoice": True,
+    "profile_root": "profiles",
+    "profile_cleanup": True,
+    "country_code": "CA",
+    "shard_count": 2,
+    "coordinator_url": "http://localhost:5060",
+    "coordinator_port": 5060,
+    "lease_ttl": 60,
+    "work_db": "work_queue.db",
+    "prioritize_by_value": True,
+    "dispute_window_days": 180,
+    "run_budget_minutes": 0,
+    "fedex_url": "https://www.fedex.com/en-ca/logged-in-home.html",
+    "billing_url": "https://www.fedex.com/online/billing/cbs/invoices",
+    "session_file": "session_state.json"
 }
 
 def load_config():
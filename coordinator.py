@@ -0,0 +1,126 @@
+"""
+Coordinator - Hands out invoice work to remote workers over HTTP
+Owns work_queue.db (see work_queue.py). Workers on any machine lease one item at a time,
+renew the lease while they work and report the result; an item whose worker went quiet
+is leased to another worker once its lease expires.
+
+    POST /scan            {"account": N}                   queue a read of an account's invoice list
+    POST /invoices        {"account": N, "invoices": [...]} queue invoices directly
+    POST /lease           {"worker": name, "ttl": 60}      next item (204 if nothing is due)
+    POST /items/<id>/heartbeat  {"worker": name}           renew the lease (409 once it is lost)
+    POST /items/<id>/complete   {"worker", "status", "result"}
+    GET  /items?status=...                                 items and worker summary
+
+Usage: python coordinator.py [--port 5060] [--db work_queue.db] [--scan] [--scan-account N]
+"""
+import argparse
+import threading
+from flask import Flask, jsonify, request
+
+import work_queue
+from accounts import account_numbers
+from config import load_config
+
+REAP_INTERVAL = 5    # seconds between expired-lease sweeps
+
+app = Flask(__name__)
+app.config["WORK_DB"] = work_queue.DB_FILE
+app.config["LEASE_TTL"] = 60
+
+
+def db():
+    return app.config["WORK_DB"]
+
+
+def _body():
+    return request.get_json(silent=True) or {}
+
+
+@app.route('/scan', methods=['POST'])
+def add_scan():
+    body = _body()
+    item_id = work_queue.add_scan(body.get("account", ""), body.get("priority", 0), path=db())
+    return jsonify({"id": item_id, "status": "queued" if item_id else "pending"})
+
+
+@app.route('/invoices', methods=['POST'])
+def add_invoices():
+    body = _body()
+    invoices = body.get("invoices")
+    if not isinstance(invoices, list):
+        return jsonify({"error": "invoices must be a list"}), 400
+    added = work_queue.add_invoices(invoices, body.get("account", ""), body.get("priority", 0), path=db())
+    return jsonify({"added": added})
+
+
+@app.route('/lease', methods=['POST'])
+def lease():
+    body = _body()
+    if not body.get("worker"):
+        return jsonify({"error": "worker is required"}), 400
+    ttl = body.get("ttl") or app.config["LEASE_TTL"]
+    item = work_queue.lease(body["worker"], ttl, path=db())
+    if item is None:
+        return "", 204
+    return jsonify({**item, "ttl": ttl})
+
+
+@app.route('/items/<int:item_id>/heartbeat', methods=['POST'])
+def heartbeat(item_id):
+    body = _body()
+    ttl = body.get("ttl") or app.config["LEASE_TTL"]
+    if not work_queue.renew(item_id, body.get("worker"), ttl, path=db()):
+        return jsonify({"status": "lease_lost"}), 409
+    return jsonify({"status": "ok"})
+
+
+@app.route('/items/<int:item_id>/complete', methods=['POST'])
+def complete(item_id):
+    body = _body()
+    if body.get("status") not in ("done", "error", "stopped"):
+        return jsonify({"error": "status must be done, error or stopped"}), 400
+    if not work_queue.complete(item_id, body.get("worker"), body["status"], body.get("result"), path=db()):
+        return jsonify({"status": "lease_lost"}), 409
+    return jsonify({"status": "ok"})
+
+
+@app.route('/items')
+def items():
+    return jsonify({
+        **work_queue.summary(path=db()),
+        "list": work_queue.list_items(request.args.get("status"), int(request.args.get("limit", 100)), path=db())
+    })
+
+
+def start_reaper(stop_event, interval=REAP_INTERVAL):
+    """Requeue expired leases in the background (leasing also does it, but /items stays current)"""
+    def loop():
+        while not stop_event.wait(interval):
+            try:
+                reaped = work_queue.reap_expired(db())
+                if reaped:
+                    print(f"⏱ {reaped} expired leases back in the queue")
+            except Exception as e:
+                print(f"Reaper failed: {e}")
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Work coordinator for remote workers")
+    parser.add_argument("--port", type=int, default=config.get("coordinator_port", 5060))
+    parser.add_argument("--host", default="0.0.0.0", help="interface to listen on (0.0.0.0 = other machines)")
+    parser.add_argument("--db", default=config.get("work_db", work_queue.DB_FILE))
+    parser.add_argument("--scan", action="store_true", help="queue an invoice-list scan for every account")
+    parser.add_argument("--scan-account", action="append", default=[], help="queue a scan for this account")
+    args = parser.parse_args()
+
+    app.config["WORK_DB"] = args.db
+    app.config["LEASE_TTL"] = config.get("lease_ttl", 60)
+    for account in (account_numbers(config) if args.scan else []) + args.scan_account:
+        work_queue.add_scan(account, path=args.db)
+    start_reaper(threading.Event())
+    print(f"Coordinator on http://{args.host}:{args.port} ({args.db})")
+    app.run(host=args.host, port=args.port, threaded=True)
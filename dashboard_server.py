@@ -0,0 +1,193 @@
+"""
+Dashboard Server - Concurrent serving for the Flask dashboard (app.py)
+FrameBroadcaster fans the newest live-view frame out to every /video_feed client without a
+polling loop: clients block on a condition until a new frame is published, each client only
+ever holds the latest frame (slow clients skip frames instead of queueing them), and close()
+ends every stream so shutdown does not hang on open connections.
+
+serve() runs gevent (green thread per client, so hundreds of streams cost no OS threads) and
+refuses to start without it unless a threaded server was asked for: "auto" falls back to
+waitress, then the Werkzeug dev server, with a warning. A thread pool is never sized to the
+stream limit; the stream limit is cut to what the pool can hold instead.
+"""
+import signal
+import threading
+import time
+
+BOUNDARY = b"frame"
+
+# Threads a waitress pool keeps for the dashboard's polling requests (/status, /logs ...)
+RESERVED_THREADS = 8
+
+
+class StreamLimitReached(Exception):
+    pass
+
+
+class FrameBroadcaster:
+    def __init__(self, max_clients=200, keepalive=5.0):
+        self.max_clients = max_clients
+        self.keepalive = keepalive  # resend the last frame this often so dead clients are noticed
+
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.clients = 0
+        self.closed = False
+        self.frames_published = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+    def publish(self, frame):
+        """Make `frame` the current frame and wake every waiting client"""
+        with self.cond:
+            self.frame = frame
+            self.seq += 1
+            self.frames_published += 1
+            self.cond.notify_all()
+
+    def latest(self):
+        return self.frame
+
+    def open_stream(self):
+        """Reserve a client slot and return its multipart generator (raises StreamLimitReached)"""
+        with self.cond:
+            if self.closed or self.clients >= self.max_clients:
+                raise StreamLimitReached()
+            self.clients += 1
+        return self._stream()
+
+    def _stream(self):
+        sent_seq = 0
+        try:
+            while True:
+                with self.cond:
+                    if self.seq == sent_seq and not self.closed:
+                        self.cond.wait(self.keepalive)
+                    if self.closed:
+                        return
+                    frame, seq = self.frame, self.seq
+                if frame is None:
+                    continue
+                with self.cond:
+                    if sent_seq and seq > sent_seq + 1:
+                        self.frames_skipped += seq - sent_seq - 1
+                    self.frames_sent += 1
+                sent_seq = seq
+                yield (b'--' + BOUNDARY + b'\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        finally:
+            with self.cond:
+                self.clients -= 1
+
+    def stats(self):
+        with self.cond:
+            return {
+                "clients": self.clients,
+                "max_clients": self.max_clients,
+                "frames_published": self.frames_published,
+                "frames_sent": self.frames_sent,
+                "frames_skipped": self.frames_skipped
+            }
+
+    def close(self):
+        """End every open stream (graceful shutdown)"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+def _available_backend(preferred="auto"):
+    order = ["gevent", "waitress", "werkzeug"] if preferred == "auto" else [preferred]
+    for name in order:
+        if name == "werkzeug":
+            return name
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            continue
+    return "werkzeug"
+
+
+def _warn_threaded(backend, reason, streams):
+    print("=" * 70)
+    print(f"⚠️ {reason} - serving the dashboard with {backend} (one OS thread per connection).")
+    print(f"⚠️ Live view is limited to {streams} streams. Install gevent for the real server:")
+    print("⚠️     pip install -r requirements.txt")
+    print("=" * 70)
+
+
+def serve(app, broadcaster, host="127.0.0.1", port=5000, backend="gevent", threads=64, grace=5.0):
+    """
+    Run `app` until SIGINT/SIGTERM, then stop accepting connections, end the frame
+    streams and give in-flight requests `grace` seconds to finish.
+    gevent only helps if app.py was monkey patched before its other imports.
+    Raises RuntimeError if "gevent" is requested and not installed.
+    """
+    requested, backend = backend, _available_backend(backend)
+    if requested == "gevent" and backend != "gevent":
+        raise RuntimeError('gevent is not installed - run "pip install -r requirements.txt", or set '
+                           '"dashboard_server" to "auto" to accept a threaded fallback server')
+    print(f"Starting dashboard ({backend}) on http://localhost:{port}")
+
+    if backend == "gevent":
+        from gevent.pywsgi import WSGIServer
+        import gevent
+
+        server = WSGIServer((host, port), app, log=None)
+
+        def shutdown():
+            print("Shutting down dashboard...")
+            broadcaster.close()
+            server.stop(timeout=grace)
+
+        gevent.signal_handler(signal.SIGINT, shutdown)
+        if hasattr(signal, "SIGTERM"):
+            gevent.signal_handler(signal.SIGTERM, shutdown)
+        server.serve_forever()
+        return
+
+    if backend == "waitress":
+        from waitress.server import create_server
+
+        # Streams pin a waitress thread each: cap them below the pool so polling still gets threads
+        threads = max(threads, RESERVED_THREADS + 1)
+        broadcaster.max_clients = min(broadcaster.max_clients, threads - RESERVED_THREADS)
+        if requested != "waitress":
+            _warn_threaded("waitress", "gevent is not installed", broadcaster.max_clients)
+        server = create_server(app, host=host, port=port, threads=threads)
+
+        def shutdown(*_):
+            print("Shutting down dashboard...")
+            broadcaster.close()
+            time.sleep(min(grace, 0.5))  # let streams see the close and return
+            server.close()
+
+        signal.signal(signal.SIGINT, shutdown)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, shutdown)
+        try:
+            server.run()
+        except (OSError, ValueError):
+            pass  # select() on the closed listening socket
+        return
+
+    # Dev server fallback (one thread per request, streams included) - never in debug mode,
+    # whose interactive debugger would run code for anyone who can reach the port. Its threads
+    # are unbounded, so the stream limit is what keeps them in check
+    broadcaster.max_clients = min(broadcaster.max_clients, threads - RESERVED_THREADS)
+    reason = "Neither gevent nor waitress is installed" if requested == "auto" else f'"dashboard_server" is {requested}'
+    _warn_threaded("the Flask development server", reason, broadcaster.max_clients)
+
+    def interrupt(*_):
+        broadcaster.close()
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, interrupt)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, interrupt)
+    try:
+        app.run(host=host, port=port, use_reloader=False, threaded=True)
+    except KeyboardInterrupt:
+        print("Shutting down dashboard...")
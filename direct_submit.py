@@ -0,0 +1,273 @@
+"""
+Direct Submit - Files a dispute by replaying the portal's create-dispute request
+through the logged-in browser context (context.request), skipping the dispute form UI.
+
+The request is built from a recorded "shape" (dispute_request_shape.json): the URL, method,
+headers and JSON body the portal sent for a real dispute, with the per-dispute values replaced
+by placeholders such as {invoice_number}. Record one by submitting a dispute through the UI
+with "record_dispute_request": true, or check a shape offline against billing_standin.py:
+
+    python billing_standin.py
+    python direct_submit.py --check http://localhost:5050
+"""
+import json
+import os
+import re
+import sys
+
+from session_store import LOGIN_URL_MARKERS
+from steps import run
+
+SHAPE_FILE = "dispute_request_shape.json"
+EXAMPLE_SHAPE_FILE = "dispute_request_shape.example.json"
+PLACEHOLDER_RE = re.compile(r'\{([a-z_]+(?::[^}]+)?)\}')
+
+# Field of the create-dispute response that holds the new dispute's id (a shape can set "response_id_field")
+RESPONSE_ID_FIELD = "disputeId"
+
+# Values that change per dispute and become placeholders when a request is recorded
+PLACEHOLDER_KEYS = ["account_number", "invoice_number", "tracking_id", "dispute_comment", "amount", "country_code"]
+
+_shape_cache = {}
+
+
+def load_request_shape(config, path=None):
+    """Load the recorded request shape (cached), or None if none was recorded"""
+    path = path or config.get("dispute_request_shape", SHAPE_FILE)
+    if path in _shape_cache:
+        return _shape_cache[path]
+    shape = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                shape = json.load(f)
+        except:
+            pass
+    _shape_cache[path] = shape
+    return shape
+
+
+def dispute_values(config, invoice_number, tracking_id, amount="0.00"):
+    """The values substituted into a shape's placeholders"""
+    return {
+        "account_number": str(config.get("account_number", "")),
+        "invoice_number": invoice_number.replace("-", ""),
+        "tracking_id": tracking_id,
+        "dispute_comment": config.get("dispute_comment", ""),
+        "amount": str(amount),
+        "country_code": config.get("country_code", "CA")
+    }
+
+
+def fill_placeholders(template, values, cookies=None):
+    """Recursively replace {name} (and {cookie:NAME}) placeholders in a JSON template"""
+    if isinstance(template, dict):
+        return {k: fill_placeholders(v, values, cookies) for k, v in template.items()}
+    if isinstance(template, list):
+        return [fill_placeholders(v, values, cookies) for v in template]
+    if not isinstance(template, str):
+        return template
+
+    def replace(match):
+        name = match.group(1)
+        if name.startswith("cookie:"):
+            return (cookies or {}).get(name[len("cookie:"):], match.group(0))
+        return values.get(name, match.group(0))
+
+    return PLACEHOLDER_RE.sub(replace, template)
+
+
+def unfilled_placeholders(value):
+    """Placeholders still present after filling (a request with any of these must not be sent)"""
+    return PLACEHOLDER_RE.findall(json.dumps(value))
+
+
+def build_dispute_request(shape, config, invoice_number, tracking_id, amount="0.00", cookies=None):
+    """Build (url, method, headers, body) for one dispute from the recorded shape"""
+    values = dispute_values(config, invoice_number, tracking_id, amount)
+    url = config.get("dispute_api_url") or fill_placeholders(shape["url"], values)
+    headers = fill_placeholders(shape.get("headers", {}), values, cookies)
+    body = fill_placeholders(shape.get("body", {}), values, cookies)
+    return url, shape.get("method", "POST"), headers, body
+
+
+def validate_against_shape(body, shape):
+    """
+    Check a body against the recorded shape: same keys (recursively) and no placeholder left.
+    Returns a list of problems (empty if the body is valid).
+    """
+    problems = []
+
+    def compare(expected, actual, path):
+        if isinstance(expected, dict):
+            if not isinstance(actual, dict):
+                problems.append(f"{path or 'body'}: expected an object")
+                return
+            for key in expected:
+                if key not in actual:
+                    problems.append(f"{path}{key}: missing")
+                else:
+                    compare(expected[key], actual[key], f"{path}{key}.")
+            for key in actual:
+                if key not in expected:
+                    problems.append(f"{path}{key}: not in recorded shape")
+
+    compare(shape.get("body", {}), body, "")
+    for name in unfilled_placeholders(body):
+        problems.append(f"placeholder {{{name}}} not filled")
+    return problems
+
+
+def submit_dispute_http_steps(context, config, invoice_number, tracking_id, amount="0.00", shape=None):
+    """
+    File one dispute through the authenticated request context (a steps.py script).
+    Returns (status, detail) where status is "disputed", "already_disputed" or "failed".
+    """
+    shape = shape or load_request_shape(config)
+    if not shape:
+        return "failed", "no recorded request shape"
+
+    cookies = {}
+    if hasattr(context, "cookies"):
+        jar = yield lambda: context.cookies()
+        cookies = {c["name"]: c["value"] for c in jar}
+    url, method, headers, body = build_dispute_request(shape, config, invoice_number, tracking_id, amount, cookies)
+
+    problems = validate_against_shape(body, shape)
+    if problems:
+        return "failed", "; ".join(problems)
+
+    try:
+        response = yield lambda: context.request.fetch(url, method=method, headers=headers, data=body,
+                                                       timeout=config.get("dispute_api_timeout", 15000))
+    except Exception as e:
+        return "failed", str(e)[:80]
+
+    text = ""
+    try:
+        text = yield lambda: response.text()
+    except Exception:
+        pass
+
+    # An expired session answers with the login page (often 200 after a redirect) - never a dispute
+    if any(marker in (response.url or "") for marker in LOGIN_URL_MARKERS):
+        return "failed", "session expired (redirected to login)"
+    if response.status == 409 or "already in dispute" in text.lower():
+        return "already_disputed", text[:80]
+    if not response.ok:
+        return "failed", f"HTTP {response.status}"
+
+    content_type = (response.headers or {}).get("content-type", "")
+    if "json" not in content_type.lower():
+        return "failed", f"session error (non-JSON response: {content_type or 'no content type'})"
+    try:
+        payload = json.loads(text) if text else None
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return "failed", "unexpected response (not a JSON object)"
+    # Some APIs answer 200 with an error object
+    if payload.get("errors") or payload.get("error"):
+        return "failed", str(payload.get("errors") or payload.get("error"))[:80]
+    # Only a response that names the new dispute counts as filed
+    dispute_id = payload.get(shape.get("response_id_field", RESPONSE_ID_FIELD))
+    if not dispute_id:
+        return "failed", "no dispute id in response"
+    return "disputed", str(dispute_id)
+
+
+def submit_dispute_http(context, config, invoice_number, tracking_id, amount="0.00", shape=None):
+    """File one dispute through the authenticated request context (sync API)"""
+    return run(submit_dispute_http_steps(context, config, invoice_number, tracking_id, amount, shape))
+
+
+class DisputeRequestRecorder:
+    """
+    Captures the portal's create-dispute request while a dispute is filed through the UI
+    and saves it as a shape with the per-dispute values turned into placeholders.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.pattern = config.get("dispute_api_pattern", "dispute")
+        self.path = config.get("dispute_request_shape", SHAPE_FILE)
+        self.values = None
+        self.recorded = os.path.exists(self.path)
+
+    def attach(self, page):
+        page.on("request", self._on_request)
+
+    def expect(self, invoice_number, tracking_id, amount="0.00"):
+        """Set the values of the dispute about to be submitted through the UI"""
+        self.values = dispute_values(self.config, invoice_number, tracking_id, amount)
+
+    def _on_request(self, request):
+        if self.recorded or not self.values or request.method != "POST":
+            return
+        if self.pattern not in request.url.lower():
+            return
+        try:
+            body = request.post_data_json
+        except:
+            return
+        if not isinstance(body, dict):
+            return
+
+        shape = {
+            "url": self._templatize(request.url),
+            "method": request.method,
+            "headers": {k: v for k, v in request.headers.items()
+                        if k.lower() in ("content-type", "accept", "x-clientid", "x-locale", "x-version")},
+            "body": self._templatize(body)
+        }
+        with open(self.path, 'w') as f:
+            json.dump(shape, f, indent=4)
+        _shape_cache.pop(self.path, None)
+        self.recorded = True
+        print(f"Recorded create-dispute request shape to {self.path}")
+
+    def _templatize(self, value):
+        if isinstance(value, dict):
+            return {k: self._templatize(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._templatize(v) for v in value]
+        if not isinstance(value, str):
+            return value
+        # Longest values first so a tracking ID inside a comment is not split
+        for key in sorted(PLACEHOLDER_KEYS, key=lambda k: -len(self.values.get(k, ""))):
+            known = self.values.get(key)
+            if known and len(known) > 3 and known in value:
+                value = value.replace(known, "{" + key + "}")
+        return value
+
+
+def check(base_url):
+    """Offline check: build a request from the recorded shape and post it to the stand-in"""
+    from playwright.sync_api import sync_playwright
+    from config import load_config
+
+    config = load_config()
+    shape = load_request_shape(config) or load_request_shape(config, EXAMPLE_SHAPE_FILE)
+    if not shape:
+        print(f"No request shape at {config.get('dispute_request_shape', SHAPE_FILE)}")
+        return False
+
+    config = {**config, "dispute_api_url": base_url.rstrip("/") + "/api/disputes"}
+    with sync_playwright() as p:
+        request_context = p.request.new_context()
+
+        class _Context:
+            request = request_context
+
+        status, detail = submit_dispute_http(_Context(), config, "2-700-01643", "123456789012", "12.34", shape)
+        print(f"First submission:  {status} {detail}")
+        again, detail = submit_dispute_http(_Context(), config, "2-700-01643", "123456789012", "12.34", shape)
+        print(f"Second submission: {again} {detail}")
+        request_context.dispose()
+    return status == "disputed" and again == "already_disputed"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "--check":
+        sys.exit(0 if check(sys.argv[2]) else 1)
+    print(__doc__)
@@ -0,0 +1,233 @@
+"""
+Dispute Activity Reader - Reads the invoice's Dispute Activity table
+Finds the panel's own table and scroll container, scrolls/pages it until no new rows
+appear and returns typed records. Only that table is read (not every tr on the page).
+"""
+import time
+from typing import NamedTuple, List
+
+from steps import run
+from table_model import Table, TRACKING_RE, DATE_RE
+
+HEADING_SELECTORS = ["text=Dispute activity", "text=Dispute Activity", "text=DISPUTE ACTIVITY"]
+
+# Header names (upper case) that identify each column
+COLUMN_ALIASES = {
+    "dispute_id": ("DISPUTE ID", "DISPUTE #", "DISPUTE NUMBER"),
+    "tracking": ("AIR WAYBILL", "TRACKING", "AWB"),
+    "reason": ("DISPUTE REASON", "REASON"),
+    "date": ("DATE",),
+}
+
+
+class DisputeRecord(NamedTuple):
+    dispute_id: str
+    tracking: str
+    reason: str
+    date: str
+
+    @property
+    def is_duty_tax(self):
+        reason = self.reason.lower()
+        return "duty" in reason and "tax" in reason
+
+
+# Mark the Dispute Activity table and its scroll container so later calls can find them.
+# Prefers a table whose header names a dispute ID; otherwise the first table after the heading.
+MARK_JS = """
+(heading) => {
+    document.querySelectorAll('[data-activity-table],[data-activity-scroll]').forEach(e => {
+        e.removeAttribute('data-activity-table');
+        e.removeAttribute('data-activity-scroll');
+    });
+    let table = Array.from(document.querySelectorAll('table')).find(t => {
+        const head = (t.querySelector('thead') || t.querySelector('tr'));
+        return head && /DISPUTE\\s*(ID|#|NUMBER)/i.test(head.textContent);
+    });
+    if (!table && heading) {
+        let node = heading;
+        while (node && !table) {
+            table = Array.from(node.querySelectorAll ? node.querySelectorAll('table') : [])
+                .find(t => heading.compareDocumentPosition(t) & Node.DOCUMENT_POSITION_FOLLOWING);
+            node = node.parentElement;
+        }
+    }
+    if (!table) return false;
+    table.setAttribute('data-activity-table', '1');
+
+    let scroller = table.parentElement;
+    while (scroller && scroller !== document.body && scroller !== document.documentElement) {
+        const style = getComputedStyle(scroller);
+        if (/(auto|scroll)/.test(style.overflowY) && scroller.scrollHeight > scroller.clientHeight + 2) break;
+        scroller = scroller.parentElement;
+    }
+    if (scroller && scroller !== document.body && scroller !== document.documentElement) {
+        scroller.setAttribute('data-activity-scroll', '1');
+    }
+    return true;
+}
+"""
+
+READ_JS = """
+() => {
+    const table = document.querySelector('[data-activity-table]');
+    if (!table) return null;
+    const cells = row => Array.from(row.querySelectorAll('td, th')).map(c => c.textContent.trim());
+    let headerRow = table.querySelector('thead tr');
+    let bodyRows = Array.from(table.querySelectorAll('tbody tr'));
+    if (!headerRow && bodyRows.length && bodyRows[0].querySelector('th')) headerRow = bodyRows.shift();
+    return {
+        headers: headerRow ? cells(headerRow) : [],
+        rows: bodyRows.map(cells),
+        signature: bodyRows.length + '|' + (bodyRows.length ? bodyRows[0].textContent + '|' + bodyRows[bodyRows.length - 1].textContent : '')
+    };
+}
+"""
+
+# Scroll the panel's container (or the last row into view); if already at the bottom,
+# press the panel's "load more" / "next page" control. Returns what it did, or "".
+ADVANCE_JS = """
+() => {
+    const table = document.querySelector('[data-activity-table]');
+    if (!table) return '';
+    const scroller = document.querySelector('[data-activity-scroll]');
+    if (scroller) {
+        if (scroller.scrollTop + scroller.clientHeight < scroller.scrollHeight - 2) {
+            scroller.scrollTop = scroller.scrollHeight;
+            return 'scrolled';
+        }
+    } else {
+        const last = table.querySelector('tbody tr:last-child');
+        if (last) {
+            const rect = last.getBoundingClientRect();
+            if (rect.bottom > window.innerHeight) {
+                last.scrollIntoView({block: 'end'});
+                return 'scrolled';
+            }
+        }
+    }
+    let panel = table;
+    for (let i = 0; i < 4 && panel.parentElement; i++) panel = panel.parentElement;
+    const more = Array.from(panel.querySelectorAll('button, a, [role="button"]')).find(b => {
+        const label = (b.getAttribute('aria-label') || b.textContent || '').trim();
+        return /^(load more|show more|view more|next)/i.test(label)
+            && !b.disabled && b.getAttribute('aria-disabled') !== 'true';
+    });
+    if (more) { more.click(); return 'paged'; }
+    return '';
+}
+"""
+
+CHANGED_JS = """
+(previous) => {
+    const table = document.querySelector('[data-activity-table]');
+    if (!table) return true;
+    const rows = table.querySelectorAll('tbody tr');
+    const signature = rows.length + '|' + (rows.length ? rows[0].textContent + '|' + rows[rows.length - 1].textContent : '');
+    return signature !== previous;
+}
+"""
+
+
+def parse_activity_rows(headers, rows):
+    """Turn raw cell lists into DisputeRecords (header positions first, per-cell patterns as fallback)"""
+    table = Table(headers, rows, COLUMN_ALIASES)
+    columns = table.columns
+    records = []
+    for cells in table.rows:
+        if not any(cells):
+            continue
+
+        if "tracking" in columns:
+            tracking_match = TRACKING_RE.search(table.cell(cells, "tracking"))
+        else:
+            tracking_match = next((m for m in map(TRACKING_RE.search, cells) if m), None)
+        if not tracking_match:
+            continue
+
+        date = table.cell(cells, "date")
+        if "date" not in columns:
+            date = next((m.group() for m in map(DATE_RE.search, cells) if m), "")
+
+        reason = table.cell(cells, "reason")
+        if "reason" not in columns and any("Duty/Tax" in c or "Duty / Tax" in c for c in cells):
+            reason = "Duty/Tax"
+
+        records.append(DisputeRecord(
+            dispute_id=table.cell(cells, "dispute_id") if "dispute_id" in columns else (cells[0].split() or [""])[0],
+            tracking=tracking_match.group(),
+            reason=reason,
+            date=date
+        ))
+    return records
+
+
+def split_records(records):
+    """Split records into tracking IDs disputed for Duty/Tax and for other reasons"""
+    duty_tax = {r.tracking for r in records if r.is_duty_tax}
+    other = {r.tracking for r in records if not r.is_duty_tax}
+    return duty_tax, other
+
+
+def _merge(collected, data):
+    """Add newly seen records; returns how many were new"""
+    new = 0
+    for record in parse_activity_rows(data["headers"], data["rows"]):
+        key = (record.dispute_id, record.tracking, record.reason)
+        if key not in collected:
+            collected[key] = record
+            new += 1
+    return new
+
+
+def _find_heading_steps(page):
+    for selector in HEADING_SELECTORS:
+        try:
+            elem = page.locator(selector).first
+            if (yield lambda: elem.is_visible(timeout=2000)):
+                return elem
+        except Exception:
+            continue
+    return None
+
+
+def read_activity_records_steps(page, settle_ms=800, max_rounds=40):
+    """
+    Expand Dispute Activity and read every entry (a steps.py script).
+    Returns [] when the invoice has no Dispute Activity section.
+    """
+    heading = yield from _find_heading_steps(page)
+    if heading is None:
+        return []
+    yield lambda: heading.click()
+
+    # Wait for the panel's table to render (instead of a fixed sleep)
+    deadline = time.time() + 5
+    handle = yield lambda: heading.element_handle()
+    while not (yield lambda: page.evaluate(MARK_JS, handle)):
+        if time.time() > deadline:
+            return []
+        yield lambda: page.wait_for_timeout(200)
+
+    collected = {}
+    idle_rounds = 0
+    for _ in range(max_rounds):
+        data = yield lambda: page.evaluate(READ_JS)
+        if data is None:
+            break
+        new = _merge(collected, data)
+        idle_rounds = 0 if new else idle_rounds + 1
+
+        moved = yield lambda: page.evaluate(ADVANCE_JS)
+        if not moved or idle_rounds >= 2:
+            break
+        try:
+            yield lambda: page.wait_for_function(CHANGED_JS, arg=data["signature"], timeout=settle_ms)
+        except Exception:
+            pass
+
+    return list(collected.values())
+
+
+def read_activity_records(page, settle_ms=800, max_rounds=40) -> List[DisputeRecord]:
+    return run(read_activity_records_steps(page, settle_ms, max_rounds))
@@ -0,0 +1,95 @@
+"""
+Export Disputes - Streams filed disputes from the stats store as CSV or Parquet
+Rows are read from a cursor in batches, so memory stays flat however long the history is.
+
+Usage: python export_disputes.py [--format csv|parquet] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                                 [--account NUMBER] [--output FILE]
+"""
+import argparse
+import csv
+import io
+import sys
+
+import stats_store
+
+COLUMNS = ["filed_at", "account", "invoice", "tracking", "amount"]
+BATCH_SIZE = 5000  # rows per CSV chunk / Parquet row group
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(start=None, end=None, account=None, path=stats_store.DB_FILE):
+    """Yield the export as CSV text chunks (header first)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for batch in _batches(stats_store.iter_disputes(start, end, account, path=path)):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def write_parquet(output, start=None, end=None, account=None, path=stats_store.DB_FILE):
+    """
+    Write the export as Parquet, one row group per batch (pandas + pyarrow).
+    `output` is a file path or a binary file object. Returns the number of rows written.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("filed_at", pa.timestamp("us")),
+        ("account", pa.string()),
+        ("invoice", pa.string()),
+        ("tracking", pa.string()),
+        ("amount", pa.float64()),
+    ])
+    written = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        for batch in _batches(stats_store.iter_disputes(start, end, account, path=path)):
+            frame = pd.DataFrame(batch, columns=COLUMNS)
+            frame["filed_at"] = pd.to_datetime(frame["filed_at"], format="ISO8601")
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            written += len(frame)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export filed disputes")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--start", help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last day, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--account", help="only this account number")
+    parser.add_argument("--output", "-o", help="output file (CSV defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        output = args.output or "disputes.parquet"
+        rows = write_parquet(output, args.start, args.end, args.account)
+        print(f"Wrote {rows} disputes to {output}", file=sys.stderr)
+        return
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in iter_csv(args.start, args.end, args.account):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Fingerprints - Per-invoice completion fingerprints so handled invoices are not reopened
+After an invoice is read, its fingerprint is stored: the signature of its row in the
+invoice list and whether every tracking ID on it is disputed for Duty/Tax. On the next
+scan an invoice whose list row is unchanged and that was complete is skipped without
+opening its page.
+
+Fingerprints older than `fingerprint_max_age_days` are re-checked anyway. Invoices that
+have not been on the invoice list for a whole dispute window (`dispute_window_days`) are
+dropped from the file.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from priority import DISPUTE_WINDOW_DAYS
+
+FINGERPRINT_FILE = "invoice_fingerprints.json"
+
+
+def row_signature(row_text):
+    """Signature of an invoice-list row (whitespace-insensitive hash of its full text)"""
+    text = re.sub(r'\s+', ' ', row_text or "").strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16] if text else None
+
+
+class FingerprintStore:
+    """Invoice fingerprints, persisted across runs"""
+
+    def __init__(self, path=FINGERPRINT_FILE, max_age_days=7, window_days=DISPUTE_WINDOW_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.window_days = window_days
+        self.lock = threading.Lock()
+        self.items = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {}
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.items, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def is_handled(self, invoice, signature, now=None):
+        """True if the invoice was fully handled and its list row has not changed since"""
+        item = self.items.get(invoice)
+        if not item or not item.get("complete") or not signature:
+            return False
+        if item.get("row") != signature:
+            return False
+        return (now or time.time()) - item.get("checked_at", 0) < self.max_age
+
+    def skip_unchanged(self, found, selected, log=print):
+        """
+        Drop the selected invoices whose fingerprint says there is nothing left to do.
+        Remembers every listed row's signature so the next record() can store it, and
+        forgets invoices that have not been listed for a whole dispute window.
+        """
+        signatures = {inv["invoice"]: inv.get("signature") for inv in found}
+        now = time.time()
+        with self.lock:
+            for invoice, signature in signatures.items():
+                if signature:
+                    self.items.setdefault(invoice, {}).update({"seen_row": signature, "seen_at": now})
+            pruned = self._prune(now)
+            self._save()
+        if pruned:
+            log(f"🧹 Forgot {pruned} invoices not listed for {self.window_days} days")
+
+        remaining = [invoice for invoice in selected if not self.is_handled(invoice, signatures.get(invoice), now)]
+        skipped = len(selected) - len(remaining)
+        if skipped:
+            log(f"⏭ {skipped} invoices unchanged since they were fully handled - not reopened")
+        return remaining
+
+    def _prune(self, now):
+        """Drop invoices last listed (or read) more than a dispute window ago. Returns how many"""
+        window = self.window_days * 86400
+        stale = [invoice for invoice, item in self.items.items()
+                 if now - max(item.get("seen_at", 0), item.get("checked_at", 0)) > window]
+        for invoice in stale:
+            del self.items[invoice]
+        return len(stale)
+
+    def record(self, invoice, trackings, complete):
+        """
+        Store the fingerprint of an invoice that was just read. `complete` means every
+        tracking ID is now disputed for Duty/Tax (nothing left to file).
+        """
+        with self.lock:
+            item = self.items.get(invoice) or {}
+            item.update({
+                "row": item.get("seen_row"),
+                "shipments": len(trackings),
+                "complete": bool(complete and trackings),
+                "checked": datetime.now().isoformat(timespec="seconds"),
+                "checked_at": time.time()
+            })
+            self.items[invoice] = item
+            self._save()
+        return item
+
+    def forget(self, invoice):
+        with self.lock:
+            if self.items.pop(invoice, None) is not None:
+                self._save()
+
+
+def fingerprints_for(config):
+    """The fingerprint store, or None when skipping handled invoices is turned off"""
+    if not config.get("skip_handled_invoices", True):
+        return None
+    return FingerprintStore(config.get("fingerprint_file", FINGERPRINT_FILE),
+                            max_age_days=config.get("fingerprint_max_age_days", 7),
+                            window_days=config.get("dispute_window_days", DISPUTE_WINDOW_DAYS))
@@ -0,0 +1,378 @@
+"""
+Job Queue - Persistent SQLite queue of bot runs plus recurring schedules
+Jobs carry a priority, an optional account and a not-before time; the supervisor claims the
+highest priority due job and hands it to the worker. Schedules turn into jobs when due:
+
+    daily@02:00          every day at 02:00 (local time)
+    weekly@tue@03:00     every Tuesday at 03:00 (e.g. the morning after the weekly invoice close)
+    every@6h / every@30m fixed interval
+
+A schedule never has more than one job waiting or running, so a slow run does not pile up.
+"""
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+DB_FILE = "jobs.db"
+
+PRIORITY_SCHEDULED = 0
+PRIORITY_MANUAL = 100   # dashboard "start" jumps ahead of scheduled runs
+
+MAX_ATTEMPTS = 3        # a job whose worker died is requeued this many times
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL DEFAULT 'queued',   -- queued, running, completed, stopped, error, failed, cancelled
+    priority INTEGER NOT NULL DEFAULT 0,
+    account TEXT NOT NULL DEFAULT '',
+    params TEXT NOT NULL DEFAULT '{}',
+    source TEXT NOT NULL DEFAULT 'manual',   -- 'manual', 'api' or 'schedule:<id>'
+    created_at TEXT NOT NULL,
+    not_before TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs(status, priority DESC, not_before, id);
+
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spec TEXT NOT NULL,
+    account TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL DEFAULT '{}',
+    enabled INTEGER NOT NULL DEFAULT 1,
+    next_run TEXT NOT NULL,
+    last_run TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FINISHED = ("completed", "stopped", "error", "failed", "cancelled")
+
+_initialized = set()
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _iso(moment):
+    return moment.isoformat(timespec="seconds")
+
+
+def connect(path=DB_FILE):
+    """Open the queue (creating the schema the first time)"""
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if path not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _initialized.add(path)
+    return conn
+
+
+def _job_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    return job
+
+
+# ========== SCHEDULE SPECS ==========
+
+def parse_spec(spec):
+    """Validate a schedule spec. Returns ("daily", h, m), ("weekly", weekday, h, m) or ("every", seconds)"""
+    spec = spec.strip().lower()
+    match = re.fullmatch(r"daily@(\d{1,2}):(\d{2})", spec)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour < 24 and minute < 60:
+            return ("daily", hour, minute)
+    match = re.fullmatch(r"weekly@([a-z]{3})@(\d{1,2}):(\d{2})", spec)
+    if match and match.group(1) in WEEKDAYS:
+        hour, minute = int(match.group(2)), int(match.group(3))
+        if hour < 24 and minute < 60:
+            return ("weekly", WEEKDAYS.index(match.group(1)), hour, minute)
+    match = re.fullmatch(r"every@(\d+)([mh])", spec)
+    if match and int(match.group(1)) > 0:
+        return ("every", int(match.group(1)) * (60 if match.group(2) == "m" else 3600))
+    raise ValueError(f"Invalid schedule '{spec}' (use daily@HH:MM, weekly@mon@HH:MM or every@30m / every@6h)")
+
+
+def next_run(spec, after=None):
+    """First run time strictly after `after` (local time)"""
+    after = after or _now()
+    parsed = parse_spec(spec)
+    if parsed[0] == "every":
+        return after + timedelta(seconds=parsed[1])
+    hour, minute = parsed[-2], parsed[-1]
+    candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if parsed[0] == "weekly":
+        candidate += timedelta(days=(parsed[1] - candidate.weekday()) % 7)
+        step = timedelta(days=7)
+    else:
+        step = timedelta(days=1)
+    while candidate <= after:
+        candidate += step
+    return candidate
+
+
+# ========== JOBS ==========
+
+def enqueue(account="", priority=PRIORITY_SCHEDULED, params=None, not_before=None, source="manual", path=DB_FILE):
+    """Add a job. Returns its id"""
+    now = _now()
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            """INSERT INTO jobs (priority, account, params, source, created_at, not_before)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (int(priority), str(account or ""), json.dumps(params or {}), source,
+             _iso(now), not_before or _iso(now))
+        )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def claim_next(path=DB_FILE):
+    """Atomically mark the highest priority due job as running and return it (None if nothing is due)"""
+    now = _iso(_now())
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ?
+                   ORDER BY priority DESC, not_before, id LIMIT 1""", (now,)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return get_job(row["id"], path)
+    finally:
+        conn.close()
+
+
+def finish(job_id, status, result=None, path=DB_FILE):
+    """Record how a running job ended"""
+    conn = connect(path)
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE id = ? AND status = 'running'",
+            (status, _iso(_now()), result, job_id)
+        )
+    finally:
+        conn.close()
+
+
+def requeue(job_id, reason, path=DB_FILE):
+    """Put a running job back (its worker died); fails it after MAX_ATTEMPTS. Returns the new status"""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        status = "failed" if row is None or row["attempts"] >= MAX_ATTEMPTS else "queued"
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            (status, reason, _iso(_now()) if status == "failed" else None, job_id)
+        )
+        return status
+    finally:
+        conn.close()
+
+
+def cancel(job_id, path=DB_FILE):
+    """Cancel a queued job. Returns False if it already started or finished"""
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (_iso(_now()), job_id)
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def get_job(job_id, path=DB_FILE):
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def running_job(path=DB_FILE):
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'running' ORDER BY started_at LIMIT 1").fetchone()
+        return _job_dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def list_jobs(limit=50, path=DB_FILE):
+    """Queued jobs in dispatch order, then the running job, then the most recent finished ones"""
+    conn = connect(path)
+    try:
+        queued = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, not_before, id").fetchall()
+        running = conn.execute("SELECT * FROM jobs WHERE status = 'running'").fetchall()
+        recent = conn.execute(
+            "SELECT * FROM jobs WHERE status NOT IN ('queued', 'running') ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return {
+            "queued": [_job_dict(r) for r in queued],
+            "running": [_job_dict(r) for r in running],
+            "recent": [_job_dict(r) for r in recent]
+        }
+    finally:
+        conn.close()
+
+
+# ========== SCHEDULES ==========
+
+def add_schedule(spec, account="", priority=PRIORITY_SCHEDULED, params=None, path=DB_FILE):
+    """Add a recurring schedule. Returns its id (raises ValueError for a bad spec)"""
+    first = next_run(spec)
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            "INSERT INTO schedules (spec, account, priority, params, next_run) VALUES (?, ?, ?, ?, ?)",
+            (spec.strip().lower(), str(account or ""), int(priority), json.dumps(params or {}), _iso(first))
+        )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def remove_schedule(schedule_id, path=DB_FILE):
+    conn = connect(path)
+    try:
+        return conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,)).rowcount > 0
+    finally:
+        conn.close()
+
+
+def set_schedule_enabled(schedule_id, enabled, path=DB_FILE):
+    conn = connect(path)
+    try:
+        return conn.execute("UPDATE schedules SET enabled = ? WHERE id = ?",
+                            (1 if enabled else 0, schedule_id)).rowcount > 0
+    finally:
+        conn.close()
+
+
+def list_schedules(path=DB_FILE):
+    conn = connect(path)
+    try:
+        schedules = []
+        for row in conn.execute("SELECT * FROM schedules ORDER BY next_run"):
+            schedule = dict(row)
+            schedule["params"] = json.loads(schedule["params"] or "{}")
+            schedule["enabled"] = bool(schedule["enabled"])
+            schedules.append(schedule)
+        return schedules
+    finally:
+        conn.close()
+
+
+def enqueue_due_schedules(now=None, path=DB_FILE):
+    """Turn every due schedule into a job (unless it already has one pending). Returns the new job ids"""
+    now = now or _now()
+    created = []
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            due = conn.execute(
+                "SELECT * FROM schedules WHERE enabled = 1 AND next_run <= ?", (_iso(now),)).fetchall()
+            for schedule in due:
+                source = f"schedule:{schedule['id']}"
+                pending = conn.execute(
+                    "SELECT 1 FROM jobs WHERE source = ? AND status IN ('queued', 'running')", (source,)).fetchone()
+                if not pending:
+                    cursor = conn.execute(
+                        """INSERT INTO jobs (priority, account, params, source, created_at, not_before)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (schedule["priority"], schedule["account"], schedule["params"], source,
+                         _iso(now), schedule["next_run"])
+                    )
+                    created.append(cursor.lastrowid)
+                # Missed runs (machine was off) collapse into one; the next one is in the future
+                conn.execute("UPDATE schedules SET next_run = ?, last_run = ? WHERE id = ?",
+                             (_iso(next_run(schedule["spec"], now)), _iso(now), schedule["id"]))
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return created
+
+
+# ========== SUPERVISOR LEASE ==========
+
+def acquire_lease(owner, ttl=30, path=DB_FILE):
+    """Take or renew the single-supervisor lease. Returns True while `owner` holds it"""
+    now = datetime.now().timestamp()
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'supervisor'").fetchone()
+            lease = json.loads(row["value"]) if row else {}
+            held = lease.get("owner") == owner or lease.get("until", 0) < now
+            if held:
+                conn.execute(
+                    """INSERT INTO meta (key, value) VALUES ('supervisor', ?)
+                       ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+                    (json.dumps({"owner": owner, "until": now + ttl}),)
+                )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return held
+    finally:
+        conn.close()
+
+
+def release_lease(owner, path=DB_FILE):
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'supervisor'").fetchone()
+        if row and json.loads(row["value"]).get("owner") == owner:
+            conn.execute("DELETE FROM meta WHERE key = 'supervisor'")
+    finally:
+        conn.close()
+
+
+def lease_owner(path=DB_FILE):
+    """Current supervisor lease ({"owner", "until"}) or None"""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'supervisor'").fetchone()
+    finally:
+        conn.close()
+    lease = json.loads(row["value"]) if row else None
+    if lease and lease.get("until", 0) >= datetime.now().timestamp():
+        return lease
+    return None
@@ -0,0 +1,133 @@
+"""
+Log Writer - Buffered, rotating session log for bot_engine
+Keeps one file handle open, flushes on important levels or every few seconds, rotates
+by size and gzips finished segments on a background thread. A retention policy caps the
+logs/ directory by age and total size so an always-on machine never fills its disk.
+"""
+import atexit
+import glob
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+
+class SessionLogWriter:
+    def __init__(self, directory="logs", name="session", max_bytes=5 * 1024 * 1024,
+                 flush_interval=2.0, flush_levels=("SUCCESS", "ERROR", "WARNING"),
+                 max_total_bytes=200 * 1024 * 1024, max_age_days=30):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_levels = set(flush_levels)
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+
+        self.lock = threading.Lock()
+        self.segment = 0
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.dirty = False
+        self.closed = False
+
+        os.makedirs(directory, exist_ok=True)
+
+        # One background thread does all gzip + retention work
+        self.jobs = queue.Queue()
+        threading.Thread(target=self._compress_worker, daemon=True).start()
+        for stale in glob.glob(os.path.join(directory, "*.log")):
+            self.jobs.put(stale)  # leftovers from earlier sessions
+        self.jobs.put(None)       # run retention once at startup
+
+        self._open_segment()
+        threading.Thread(target=self._flush_timer, daemon=True).start()
+        atexit.register(self.close)
+
+    def _segment_path(self):
+        suffix = f".{self.segment}" if self.segment else ""
+        return os.path.join(self.directory, f"{self.name}{suffix}.log")
+
+    def _open_segment(self):
+        self.path = self._segment_path()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, line, level="INFO"):
+        """Append one line; flushed right away for important levels, otherwise by the timer"""
+        data = line + "\n"
+        with self.lock:
+            if self.closed:
+                return
+            self.file.write(data)
+            self.size += len(data.encode("utf-8"))
+            self.dirty = True
+            if level in self.flush_levels:
+                self._flush_locked()
+            if self.size >= self.max_bytes:
+                self._rotate_locked()
+
+    def flush(self):
+        with self.lock:
+            if not self.closed:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self.dirty:
+            self.file.flush()
+            self.dirty = False
+
+    def _rotate_locked(self):
+        self.file.close()
+        self.jobs.put(self.path)
+        self.segment += 1
+        self._open_segment()
+
+    def _flush_timer(self):
+        while not self.closed:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        """Flush and close the active segment (it is compressed by the next session)"""
+        with self.lock:
+            if self.closed:
+                return
+            self._flush_locked()
+            self.file.close()
+            self.closed = True
+
+    def _compress_worker(self):
+        while True:
+            path = self.jobs.get()
+            try:
+                if path:
+                    self._compress(path)
+                self.enforce_retention()
+            except Exception as e:
+                print(f"Log compression failed: {e}")
+
+    def _compress(self, path):
+        if path == self.path and not self.closed or not os.path.exists(path):
+            return
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+
+    def enforce_retention(self):
+        """Delete compressed segments older than max_age_days, then the oldest until under max_total_bytes"""
+        archives = sorted(glob.glob(os.path.join(self.directory, "*.log.gz")), key=os.path.getmtime)
+        cutoff = time.time() - self.max_age_days * 86400
+        for path in list(archives):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                archives.remove(path)
+
+        total = sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.directory, "*.log*")))
+        while archives and total > self.max_total_bytes:
+            oldest = archives.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
@@ -0,0 +1,250 @@
+"""
+Orchestrator - Runs several billing accounts in parallel, one worker process per shard
+The accounts in bot_config.json ("accounts", see accounts.py) are split into shards; each
+shard gets its own resident worker (worker_daemon.py --worker-id shardK) on a profile clone,
+and is handed its accounts one at a time through its own bot_state.worker-shardK.json.
+Progress per shard and account is written to shards.json (dashboard: /shards).
+
+Usage: python orchestrator.py                run every account with shard_count workers
+       python orchestrator.py --shards 3     ... with 3 workers
+       python orchestrator.py --status       show the last run's shards
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from accounts import shard_accounts
+from browser_worker import worker_file
+from config import load_config
+from worker_daemon import worker_is_ready
+
+SHARDS_FILE = "shards.json"
+WORKER_HANDSHAKE_TIMEOUT = 180   # covers the worker's login
+POLL_INTERVAL = 1       # seconds between progress checks
+SHUTDOWN_TIMEOUT = 60   # seconds to wait for the workers to exit after "shutdown"
+
+STAT_KEYS = ("disputed", "skipped", "errors", "invoices_processed", "total_invoices")
+
+
+def _load_json(path, default):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return default
+
+
+def _save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def empty_stats():
+    return {key: 0 for key in STAT_KEYS}
+
+
+class Shard:
+    """One worker process and the accounts it works through"""
+
+    def __init__(self, index, accounts):
+        self.index = index
+        self.worker_id = f"shard{index}"
+        self.accounts = list(accounts)
+        self.pending = list(accounts)
+        self.current = None
+        self.results = {}          # account -> {"status", "stats", "seconds"}
+        self.started_at = None
+        self.process = None
+        self.state_file = worker_file("bot_state.json", self.worker_id)
+        self.log_file = worker_file("bot_logs.json", self.worker_id)
+        self.heartbeat_file = worker_file("worker_heartbeat.json", self.worker_id)
+
+    # ========== WORKER ==========
+
+    def spawn(self):
+        """Start the shard's worker, logged in as its first account's user"""
+        _save_json(self.state_file, {"command": "idle", "status": "starting"})
+        self.process = subprocess.Popen([sys.executable, "worker_daemon.py",
+                                         "--worker-id", self.worker_id, "--account", self.accounts[0]])
+
+    def wait_ready(self, timeout=WORKER_HANDSHAKE_TIMEOUT):
+        """Wait until the worker has logged in and reports "ready" (handshake, like supervisor.ensure_worker)"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            heartbeat = _load_json(self.heartbeat_file, {})
+            if heartbeat.get("pid") == self.process.pid and worker_is_ready(heartbeat):
+                return True
+            if self.process.poll() is not None:
+                return False
+            time.sleep(0.1)
+        return False
+
+    def send(self, command):
+        state = _load_json(self.state_file, {})
+        state["command"] = command
+        _save_json(self.state_file, state)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    # ========== ACCOUNTS ==========
+
+    def start_next(self):
+        """Hand the worker its next account (queued until the worker has logged in)"""
+        self.current = self.pending.pop(0)
+        self.started_at = time.time()
+        # Fresh session log per account so its stats can be collected when it finishes
+        _save_json(self.log_file, {"logs": [], "stats": empty_stats(), "invoices": []})
+        state = _load_json(self.state_file, {})
+        state.update({"command": "start", "job": {"account": self.current, "shard": self.index}})
+        _save_json(self.state_file, state)
+        print(f"▶️ Shard {self.index}: account {self.current}")
+
+    def finish_current(self, status):
+        stats = _load_json(self.log_file, {}).get("stats", {})
+        self.results[self.current] = {
+            "status": status,
+            "stats": {key: stats.get(key, 0) for key in STAT_KEYS},
+            "seconds": round(time.time() - self.started_at, 1)
+        }
+        print(f"✓ Shard {self.index}: account {self.current} {status}")
+        self.current = None
+
+    def poll(self):
+        """Advance the shard: collect a finished account, start the next one. False once done"""
+        if self.current is not None:
+            if not self.alive():
+                self.finish_current("worker_died")
+                self.pending = []
+                return False
+            state = _load_json(self.state_file, {})
+            # The worker sets the command back to idle once the run has ended
+            if state.get("command") != "idle":
+                return True
+            self.finish_current(state.get("status", "completed"))
+            if state.get("status") == "stopped":
+                self.pending = []
+        if self.pending and self.alive():
+            self.start_next()
+            return True
+        return False
+
+    def to_dict(self):
+        running = None
+        if self.current is not None:
+            stats = _load_json(self.log_file, {}).get("stats", {})
+            running = {"account": self.current, "stats": {key: stats.get(key, 0) for key in STAT_KEYS},
+                       "seconds": round(time.time() - self.started_at, 1)}
+        return {
+            "shard": self.index,
+            "worker_id": self.worker_id,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive(),
+            "accounts": self.accounts,
+            "pending": self.pending,
+            "running": running,
+            "results": self.results
+        }
+
+
+class Orchestrator:
+    def __init__(self, config, shard_count=None, path=SHARDS_FILE):
+        self.config = config
+        self.path = path
+        count = shard_count or config.get("shard_count", 2)
+        self.shards = [Shard(i + 1, accounts) for i, accounts in enumerate(shard_accounts(config, count))]
+        self.started = time.time()
+
+    def publish(self, status):
+        _save_json(self.path, {"status": status, "started": self.started, "updated": time.time(),
+                               "shards": [shard.to_dict() for shard in self.shards]})
+
+    def run(self):
+        """Start every shard's worker and keep handing out accounts until all are done"""
+        print(f"Orchestrator: {sum(len(s.accounts) for s in self.shards)} accounts on {len(self.shards)} shards")
+        for shard in self.shards:
+            shard.spawn()
+        for shard in self.shards:
+            if not shard.wait_ready():
+                print(f"❌ Shard {shard.index}: worker did not start")
+            elif shard.pending:
+                shard.start_next()
+        self.publish("running")
+
+        status = "completed"
+        try:
+            while any([shard.poll() for shard in self.shards]):
+                self.publish("running")
+                time.sleep(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            print("Stopping shards...")
+            status = "stopped"
+            for shard in self.shards:
+                if shard.alive():
+                    shard.send("stop")
+            self._wait_idle()
+        finally:
+            self.shutdown()
+            self.publish(status)
+        return status
+
+    def _wait_idle(self, timeout=SHUTDOWN_TIMEOUT):
+        """Give stopped shards time to finish their current dispute and record the account"""
+        deadline = time.time() + timeout
+        while time.time() < deadline and any(shard.current is not None for shard in self.shards):
+            for shard in self.shards:
+                shard.pending = []
+                if shard.current is not None:
+                    shard.poll()
+            time.sleep(POLL_INTERVAL)
+
+    def shutdown(self):
+        for shard in self.shards:
+            if shard.alive():
+                shard.send("shutdown")
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            try:
+                shard.process.wait(timeout=max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                shard.process.kill()
+
+
+def shard_status(path=SHARDS_FILE):
+    """The last (or current) orchestrator run from shards.json, with totals over every account"""
+    data = _load_json(path, None)
+    if data is None:
+        return {"status": "none", "shards": [], "totals": empty_stats()}
+    totals = empty_stats()
+    for shard in data.get("shards", []):
+        runs = list(shard.get("results", {}).values())
+        if shard.get("running"):
+            runs.append(shard["running"])
+        for run in runs:
+            for key in STAT_KEYS:
+                totals[key] += run.get("stats", {}).get(key, 0)
+    data["totals"] = totals
+    data["accounts_done"] = sum(len(shard.get("results", {})) for shard in data.get("shards", []))
+    data["accounts_total"] = sum(len(shard.get("accounts", [])) for shard in data.get("shards", []))
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every billing account across several workers")
+    parser.add_argument("--shards", type=int, default=None, help="number of worker processes (default: shard_count)")
+    parser.add_argument("--status", action="store_true", help="show the last run's shards")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(shard_status(), indent=2))
+    else:
+        Orchestrator(load_config(), args.shards).run()
@@ -0,0 +1,166 @@
+"""
+Pacing - AIMD concurrency and pacing controller for dispute submission
+While submissions succeed at a normal speed the controller raises the number of disputes
+allowed in flight (one more per full window of successes) and shortens the pause between
+actions. An ERROR CODE popup, a timeout or a response much slower than the running
+baseline halves the in-flight limit and doubles the pause.
+
+The current limits are written to pacing_state.json for the dashboard (/status, /metrics).
+"""
+import json
+import os
+import threading
+import time
+
+from steps import Pause, run
+
+PACING_FILE = "pacing_state.json"
+
+BACKOFF_KINDS = ("error_popup", "navigation_timeout")
+
+
+class AimdController:
+    def __init__(self, max_limit=1, min_limit=1, initial_limit=1,
+                 delay=0.5, min_delay=0.0, max_delay=30.0, delay_step=0.1,
+                 slow_factor=2.0, backoff_guard=5.0, state_file=PACING_FILE):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = max(self.min_limit, min(initial_limit, self.max_limit))
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay_step = delay_step
+        self.slow_factor = slow_factor      # slower than this x baseline counts as a backoff signal
+        self.backoff_guard = backoff_guard  # at most one decrease per this many seconds
+        self.state_file = state_file
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.streak = 0                     # healthy results since the last limit change
+        self.baseline = None                # EWMA of healthy latencies (seconds)
+        self.samples = 0
+        self.last_action = 0
+        self.last_backoff = 0
+        self.last_backoff_reason = None
+        self.successes = 0
+        self.failures = 0
+        self.backoffs = 0
+        self.last_write = 0
+
+    # ========== FEEDBACK ==========
+
+    def record(self, success, latency=None, kind=None):
+        """Feed one submission result. kind is the resilience failure kind (None on success)"""
+        with self.lock:
+            slow = (latency is not None and self.baseline is not None and self.samples >= 3
+                    and latency > self.slow_factor * self.baseline)
+            if kind in BACKOFF_KINDS or slow:
+                self.failures += 0 if success else 1
+                self._decrease(kind if kind in BACKOFF_KINDS else "slow_response")
+            elif success:
+                self.successes += 1
+                self._increase()
+                if latency is not None:
+                    self.samples += 1
+                    self.baseline = latency if self.baseline is None else 0.8 * self.baseline + 0.2 * latency
+            else:
+                self.failures += 1  # other failures say nothing about site load
+        self.publish()
+
+    def _increase(self):
+        self.delay = max(self.min_delay, self.delay - self.delay_step)
+        self.streak += 1
+        if self.streak >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self.streak = 0
+
+    def _decrease(self, reason):
+        now = time.time()
+        self.streak = 0
+        if now - self.last_backoff < self.backoff_guard:
+            return
+        self.limit = max(self.min_limit, self.limit // 2)
+        self.delay = min(self.max_delay, max(self.delay * 2, self.delay_step))
+        self.last_backoff = now
+        self.last_backoff_reason = reason
+        self.backoffs += 1
+
+    # ========== GATING ==========
+
+    def _pause_left(self):
+        return self.last_action + self.delay - time.time()
+
+    def pace_steps(self, should_stop=None):
+        """
+        Wait for an in-flight slot and the pacing delay before the next action (a steps.py
+        script); every page's pipeline shares the controller, so at most `limit` disputes are
+        in flight at once. Call release() once the dispute is done. False if stopped (no slot
+        is taken then).
+        """
+        while True:
+            with self.lock:
+                if self.in_flight < self.limit and self._pause_left() <= 0:
+                    self.in_flight += 1
+                    self.last_action = time.time()
+                    break
+            if should_stop and should_stop():
+                return False
+            yield Pause(min(0.5, max(0.05, self._pause_left())))
+        self.publish()
+        return True
+
+    def pace(self, should_stop=None):
+        """Wait for an in-flight slot and the pacing delay (sync API) - see pace_steps"""
+        return run(self.pace_steps(should_stop))
+
+    def release(self):
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    # ========== REPORTING ==========
+
+    def to_dict(self):
+        total = self.successes + self.failures
+        return {
+            "limit": self.limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "delay": round(self.delay, 2),
+            "baseline_latency": round(self.baseline, 2) if self.baseline is not None else None,
+            "success_rate": round(self.successes / total, 3) if total else None,
+            "backoffs": self.backoffs,
+            "last_backoff_reason": self.last_backoff_reason,
+            "updated": time.time()
+        }
+
+    def publish(self, min_interval=1.0):
+        """Write the state file for the dashboard (at most once a second)"""
+        now = time.time()
+        if not self.state_file or now - self.last_write < min_interval:
+            return
+        self.last_write = now
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp, self.state_file)
+        except:
+            pass
+
+
+def controller_for(config, max_limit=1):
+    return AimdController(max_limit=max_limit,
+                          delay=config.get("pacing_initial_delay", 0.5),
+                          max_delay=config.get("pacing_max_delay", 30.0),
+                          slow_factor=config.get("pacing_slow_factor", 2.0),
+                          state_file=config.get("pacing_file", PACING_FILE))
+
+
+def load_pacing_state(path=PACING_FILE):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return None
@@ -0,0 +1,1012 @@
+"""
+Pipeline - The navigate -> scan -> per-invoice -> per-tracking -> form flow, written once
+Every entry point (browser_worker, bot_engine, the legacy scripts and the dry-run checks)
+assembles the same stages and only differs in where results go:
+
+    source    which invoices to work on (the scanned invoice list, or given numbers)
+    planner   reads one invoice: shipments + Dispute Activity -> what still needs a dispute
+    executor  files each dispute (form / HTTP) - or DryRunExecutor, which only reports
+    sinks     receive every event (dashboard log, bot_engine UI, console)
+
+Page operations take a `log` callable so they report through whichever sink is running.
+They and the stages are steps.py scripts (the `*_steps` names), so the sync entry points and
+async_engine.py drive the same code; the plain names run them on the sync API.
+"""
+import re
+import time
+from datetime import datetime
+
+from dispute_activity import read_activity_records_steps, split_records
+from direct_submit import submit_dispute_http_steps, load_request_shape
+from fingerprints import row_signature, fingerprints_for
+from steps import Pause, run, done
+from table_model import (
+    read_shipment_records_steps, shipments_by_tracking, locate_row_steps, parse_money, MONEY_RE, DATE_RE
+)
+from pacing import controller_for
+from priority import order_invoices, order_records, budget_for
+from resilience import (
+    classify, classify_exception, retry_queue_for, breaker_for, RETRYABLE, WHOLE_INVOICE,
+    ERROR_POPUP, FORM_NOT_RENDERED, ALREADY_IN_DISPUTE, NO_BUTTON, NAVIGATION_TIMEOUT
+)
+
+BILLING_INVOICES_URL = "https://www.fedex.com/online/billing/cbs/invoices"
+
+
+# ========== PAGE OPERATIONS ==========
+
+def navigate_to_invoices_steps(page, log=print, url=BILLING_INVOICES_URL):
+    """Navigate from logged-in page to invoices list"""
+    # log_event("Accessing FedEx Portal", "Login successful. Navigating to the Invoice Dashboard.", "processing")
+    # aggregated into the initialization phase logs usually, or keep silent until scan is done
+
+    # 1. Click "PAY A BILL" - Robust Selectors
+    try:
+        log("Looking for 'PAY A BILL'...")
+        # Try multiple selectors for the Pay A Bill card/link
+        selectors = [
+            "text=PAY A BILL",
+            "a[href*='/billing/']",
+            "h3:has-text('PAY A BILL')",
+            ".fxg-c-card__content:has-text('PAY A BILL')"
+        ]
+        
+        found = False
+        for sel in selectors:
+            try:
+                elem = page.locator(sel).first
+                if (yield lambda: elem.is_visible(timeout=2000)):
+                    yield lambda: elem.click()
+                    found = True
+                    yield Pause(3)
+                    break
+            except Exception:
+                continue
+                
+        if not found:
+            log("Could not find 'PAY A BILL' button, trying direct URL...")
+            yield lambda: page.goto(url, wait_until="domcontentloaded")
+            yield Pause(3)
+            
+    except Exception as e:
+        log(f"Navigation error: {e}")
+
+    # 2. Handle "The latest with FedEx Billing Online" Popup -> Click CONTINUE
+    try:
+        # log("Checking for 'CONTINUE' popup...")
+        continue_btn = page.locator("button:has-text('CONTINUE')").first
+        if (yield lambda: continue_btn.is_visible(timeout=5000)):
+            log("Popup found, clicking CONTINUE...")
+            yield lambda: continue_btn.click()
+            yield Pause(3)
+    except Exception:
+        pass
+
+    # 3. Click "VIEW ALL INVOICES"
+    try:
+        log("Looking for 'VIEW ALL INVOICES'...")
+        view_invoices = page.locator("text=VIEW ALL INVOICES").first
+        if (yield lambda: view_invoices.is_visible(timeout=5000)):
+            yield lambda: view_invoices.click()
+            yield Pause(3)
+        else:
+            # Fallback to standard "INVOICES" tab
+            yield lambda: page.locator("text=INVOICES").first.click()
+            yield Pause(3)
+    except Exception:
+        pass
+
+    # Final check: are we on the invoices page?
+    if "invoices" not in page.url.lower():
+        log("Trying direct navigation to invoices...")
+        yield lambda: page.goto(url, wait_until="domcontentloaded")
+        yield Pause(3)
+
+    log("Navigation complete.")
+
+
+def navigate_to_invoices(page, log=print, url=BILLING_INVOICES_URL):
+    """Navigate from logged-in page to invoices list (sync API)"""
+    run(navigate_to_invoices_steps(page, log, url))
+
+
+def handle_dispute_form_steps(page, config, log=print):
+    """
+    Handle the dispute form with multiple fallback methods.
+    Returns True if successful, False otherwise.
+    """
+    try:
+        # Wait for form to appear
+        yield Pause(2)
+
+        # Check if we're on the dispute form
+        form_visible = False
+        for selector in ["text=Dispute type", "text=DISPUTE TYPE", "div[role='dialog']"]:
+            try:
+                if (yield lambda: page.locator(selector).first.is_visible(timeout=3000)):
+                    form_visible = True
+                    break
+            except Exception:
+                continue
+
+        if not form_visible:
+            log("   ⚠️ Dispute form not visible, waiting longer...")
+            yield Pause(3)
+
+        # ========== STEP 1: Select Dispute Type = "Incorrect charge" ==========
+        log("   Step 1: Selecting Dispute Type...")
+        type_selected = False
+
+        # Method 1: Click the first "Select" dropdown
+        try:
+            selects = yield lambda: page.locator("text=Select").all()
+            if len(selects) > 0:
+                yield lambda: selects[0].click()
+                yield Pause(1)
+                yield lambda: page.locator("text=Incorrect charge").first.click()
+                yield Pause(1)
+                type_selected = True
+                log("   ✓ Selected 'Incorrect charge' (method 1)")
+        except Exception as e:
+            log(f"   Method 1 failed: {str(e)[:40]}")
+
+        # Method 2: Click dropdown by aria-label or role
+        if not type_selected:
+            try:
+                yield lambda: page.locator("[aria-haspopup='listbox']").first.click()
+                yield Pause(1)
+                yield lambda: page.locator("text=Incorrect charge").first.click()
+                yield Pause(1)
+                type_selected = True
+                log("   ✓ Selected 'Incorrect charge' (method 2)")
+            except Exception as e:
+                log(f"   Method 2 failed: {str(e)[:40]}")
+
+        # Method 3: Use keyboard navigation
+        if not type_selected:
+            try:
+                yield lambda: page.keyboard.press("Tab")
+                yield Pause(0.3)
+                yield lambda: page.keyboard.press("Enter")
+                yield Pause(0.5)
+                yield lambda: page.keyboard.type("Incorrect")
+                yield Pause(0.3)
+                yield lambda: page.keyboard.press("Enter")
+                yield Pause(1)
+                type_selected = True
+                log("   ✓ Selected 'Incorrect charge' (method 3 - keyboard)")
+            except Exception as e:
+                log(f"   Method 3 failed: {str(e)[:40]}")
+
+        if not type_selected:
+            log("   ❌ Could not select Dispute Type")
+            return False
+
+        # ========== STEP 2: Select Dispute Reason = "Duty/Tax" ==========
+        log("   Step 2: Selecting Dispute Reason...")
+        reason_selected = False
+
+        # Method 1: Click the next "Select" dropdown
+        try:
+            selects = yield lambda: page.locator("text=Select").all()
+            if len(selects) > 0:
+                yield lambda: selects[0].click()
+                yield Pause(1)
+                yield lambda: page.locator("text=Duty/Tax").first.click()
+                yield Pause(1)
+                reason_selected = True
+                log("   ✓ Selected 'Duty/Tax' (method 1)")
+        except Exception as e:
+            log(f"   Method 1 failed: {str(e)[:40]}")
+
+        # Method 2: Click dropdown by aria-label or role
+        if not reason_selected:
+            try:
+                dropdowns = yield lambda: page.locator("[aria-haspopup='listbox']").all()
+                if len(dropdowns) > 1:
+                    yield lambda: dropdowns[1].click()
+                elif len(dropdowns) > 0:
+                    yield lambda: dropdowns[0].click()
+                yield Pause(1)
+                yield lambda: page.locator("text=Duty/Tax").first.click()
+                yield Pause(1)
+                reason_selected = True
+                log("   ✓ Selected 'Duty/Tax' (method 2)")
+            except Exception as e:
+                log(f"   Method 2 failed: {str(e)[:40]}")
+
+        # Method 3: Use keyboard
+        if not reason_selected:
+            try:
+                yield lambda: page.keyboard.press("Tab")
+                yield Pause(0.3)
+                yield lambda: page.keyboard.press("Enter")
+                yield Pause(0.5)
+                yield lambda: page.keyboard.type("Duty")
+                yield Pause(0.3)
+                yield lambda: page.keyboard.press("Enter")
+                yield Pause(1)
+                reason_selected = True
+                log("   ✓ Selected 'Duty/Tax' (method 3 - keyboard)")
+            except Exception as e:
+                log(f"   Method 3 failed: {str(e)[:40]}")
+
+        if not reason_selected:
+            log("   ❌ Could not select Dispute Reason")
+            return False
+
+        # ========== STEP 3: Enter Comment ==========
+        log("   Step 3: Entering comment...")
+        comment = config.get("dispute_comment", "Reason for dispute- Products are CUSMA compliant.")
+
+        comment_entered = False
+        try:
+            textarea = page.locator("textarea").first
+            if (yield lambda: textarea.is_visible(timeout=2000)):
+                yield lambda: textarea.fill(comment)
+                comment_entered = True
+                log("   ✓ Entered comment in textarea")
+        except Exception:
+            pass
+
+        if not comment_entered:
+            try:
+                text_input = page.locator("input[type='text']").last
+                if (yield lambda: text_input.is_visible(timeout=2000)):
+                    yield lambda: text_input.fill(comment)
+                    comment_entered = True
+                    log("   ✓ Entered comment in text input")
+            except Exception:
+                pass
+
+        if not comment_entered:
+            log("   ⚠️ Could not find comment field, continuing anyway...")
+
+        # ========== STEP 4: Click Submit ==========
+        log("   Step 4: Submitting dispute...")
+        submitted = False
+
+        # Try multiple submit button selectors
+        for selector in [
+            "button:has-text('SUBMIT DISPUTE')",
+            "button:has-text('Submit Dispute')",
+            "button:has-text('SUBMIT')",
+            "button:has-text('Submit')",
+            "button[type='submit']"
+        ]:
+            try:
+                btn = page.locator(selector).first
+                if (yield lambda: btn.is_visible(timeout=1000)):
+                    yield lambda: btn.click()
+                    submitted = True
+                    log(f"   ✓ Clicked submit button")
+                    break
+            except Exception:
+                continue
+
+        if not submitted:
+            log("   ❌ Could not find submit button")
+            return False
+
+        # Wait for submission to complete
+        yield Pause(3)
+
+        # Check for success (form should close or we should see a success message)
+        try:
+            if (yield lambda: page.locator("text=successfully").is_visible(timeout=2000)):
+                log("   ✓ Dispute submitted successfully")
+            elif (yield lambda: page.locator("text=ERROR").is_visible(timeout=1000)):
+                log("   ⚠️ Error message appeared, but continuing...")
+        except Exception:
+            pass
+
+        return True
+
+    except Exception as e:
+        log(f"   ❌ Error in dispute form: {str(e)[:80]}")
+        return False
+
+
+def handle_dispute_form(page, config, log=print):
+    """Fill and submit the dispute form (sync API). Returns True if successful"""
+    return run(handle_dispute_form_steps(page, config, log))
+
+def parse_invoice_row(row_text):
+    """Classify one row of the invoice list"""
+    invoice_match = re.search(r'\d-\d{3}-\d{5}', row_text)
+    invoice_num = invoice_match.group() if invoice_match else "Unknown"
+
+    status = "Unknown"
+    if "Transportation" in row_text: status = "Transportation"
+    elif "OPEN IN DISPUTE" in row_text: status = "Disputed"
+    elif "Duty/Tax" in row_text: status = "Duty/Tax"
+
+    # Used to put the most valuable invoices first (priority.py): the row's largest amount and first date
+    amounts = [float(parse_money(match.group())) for match in MONEY_RE.finditer(row_text)]
+    date_match = DATE_RE.search(row_text)
+
+    return {
+        "invoice": invoice_num,
+        "type": status,
+        "text": row_text[:100],
+        "signature": row_signature(row_text),
+        "amount": max(amounts) if amounts else None,
+        "date": date_match.group() if date_match else None
+    }
+
+def read_shipment_rows_steps(page):
+    """Read the invoice's shipments table as table_model.ShipmentRecords, in table order"""
+    yield lambda: page.wait_for_selector("tbody tr", timeout=10000)
+    yield Pause(2)
+    return (yield from read_shipment_records_steps(page))
+
+def read_shipment_rows(page):
+    """Read the invoice's shipments table as table_model.ShipmentRecords (sync API)"""
+    return run(read_shipment_rows_steps(page))
+
+def read_shipments(page):
+    """
+    Read the invoice's shipments table.
+    Returns {tracking_id: amount} in table order (amount as a "12.34" string).
+    """
+    return shipments_by_tracking(read_shipment_rows(page))
+
+def read_dispute_activity_steps(page):
+    """
+    Expand the Dispute Activity section and read the disputes already filed.
+    Returns (already_disputed_duty_tax, already_disputed_other).
+    """
+    # Reads only the panel's own table, scrolling/paging its container until no new rows appear
+    return split_records((yield from read_activity_records_steps(page)))
+
+def read_dispute_activity(page):
+    """Read the disputes already filed (sync API) - see read_dispute_activity_steps"""
+    return run(read_dispute_activity_steps(page))
+
+def invoice_details_url(config, invoice_number):
+    """Deep link to an invoice's details page"""
+    invoice_no_clean = invoice_number.replace("-", "")
+    account_no = config.get("account_number", "202744967")
+    country = config.get("country_code", "CA")
+    base = config.get("billing_url", BILLING_INVOICES_URL).rstrip("/")
+    return f"{base}/invoice-details?accountNo={account_no}&countryCode={country}&invoiceNumber={invoice_no_clean}"
+
+
+def read_invoice_list_steps(page, log=print):
+    """Read and classify every row of the invoice list (top to bottom)"""
+    try:
+        yield lambda: page.wait_for_selector("table tbody", timeout=30000)
+        yield Pause(2)
+    except Exception as e:
+        log(f"Error waiting for table: {e}")
+        return []
+    found = []
+    for row in (yield lambda: page.locator("tbody tr").all()):
+        found.append(parse_invoice_row((yield lambda: row.text_content()) or ""))
+    return found
+
+def read_invoice_list(page, log=print):
+    """Read and classify every row of the invoice list (sync API)"""
+    return run(read_invoice_list_steps(page, log))
+
+def file_dispute_steps(page, row, config, log=print):
+    """
+    Open the row's action menu and file the Duty/Tax dispute through the form.
+    Returns (outcome, failure kind): outcome is "disputed", "skipped" (already in dispute),
+    "failed" (form error or ERROR CODE popup), "error" (anything else) or "no_button".
+    """
+    try:
+        btns = yield lambda: row.locator("button").all()
+        if not btns:
+            return "no_button", NO_BUTTON
+        
+        yield lambda: btns[0].evaluate("element => element.click()")
+        yield Pause(0.5)
+        
+        yield lambda: page.get_by_text("Dispute", exact=True).click()
+        yield Pause(2)
+        
+        # Check for "Item already in dispute status" popup
+        try:
+            already_popup = page.locator("text=already in dispute").first
+            if (yield lambda: already_popup.is_visible(timeout=1500)):
+                # Close the popup by clicking the X or pressing Escape
+                try:
+                    close_btn = page.locator("button:has-text('×'), [aria-label='Close'], svg[data-icon='times']").first
+                    if (yield lambda: close_btn.is_visible(timeout=500)):
+                        yield lambda: close_btn.click()
+                    else:
+                        yield lambda: page.keyboard.press("Escape")
+                except Exception:
+                    yield lambda: page.keyboard.press("Escape")
+                yield Pause(1)
+                return "skipped", ALREADY_IN_DISPUTE
+        except Exception:
+            pass  # No popup, continue with dispute form
+        
+        # Handle dispute form with multiple fallback methods
+        if not (yield from handle_dispute_form_steps(page, config, log)):
+            # Try to close any open dialog
+            try:
+                yield lambda: page.keyboard.press("Escape")
+                yield Pause(1)
+            except Exception:
+                pass
+            return "failed", FORM_NOT_RENDERED
+        
+        # An ERROR CODE popup means the portal rejected the submission - close it and report it
+        error_popup = False
+        try:
+            if (yield lambda: page.locator("text=ERROR CODE").is_visible(timeout=1000)):
+                error_popup = True
+                log("   ⚠️ ERROR CODE popup after submitting")
+                yield lambda: page.locator("button:has-text('CLOSE')").click()
+                yield Pause(1)
+        except Exception:
+            pass
+        
+        # Make sure we're back on the invoice page
+        if "create-dispute" in page.url:
+            yield lambda: page.go_back()
+            yield Pause(2)
+        if error_popup:
+            return "failed", ERROR_POPUP
+        return "disputed", ""
+        
+    except Exception as e:
+        log(f"   ✗ Error disputing row: {str(e)[:80]}")
+        # Try to recover
+        try:
+            yield lambda: page.keyboard.press("Escape")
+            yield Pause(1)
+            if "create-dispute" in page.url:
+                yield lambda: page.go_back()
+                yield Pause(2)
+        except Exception:
+            pass
+        return "error", classify_exception(e)
+
+
+def file_dispute(page, row, config, log=print):
+    """File the row's Duty/Tax dispute through the form (sync API) - see file_dispute_steps"""
+    return run(file_dispute_steps(page, row, config, log))
+
+
+# ========== STAGES ==========
+
+class InvoiceWork:
+    """What one invoice needs: its shipments and the Duty/Tax disputes already filed"""
+
+    def __init__(self, invoice, shipments, duty_tax, other, records=None):
+        self.invoice = invoice
+        self.shipments = shipments          # {tracking: "12.34"} in table order
+        self.records = records or []        # table_model.ShipmentRecords (locate the rows)
+        self.duty_tax = duty_tax            # already disputed for Duty/Tax -> skip
+        self.other = other                  # disputed for another reason -> still dispute
+        self.to_dispute = [t for t in shipments if t not in duty_tax]
+        self.page = None                    # tab the invoice was read on
+
+    @property
+    def handled(self):
+        return len(self.duty_tax) + len(self.other)
+
+
+# Stages do their page work in `*_steps` scripts (steps.py), so the same stage runs on a sync
+# page (Pipeline.run/scan/process) and an async one (async_engine); the plain methods are the
+# sync entry points.
+
+class InvoiceListSource:
+    """Source: navigate to the invoice list and pick the invoices of the given types"""
+
+    def __init__(self, types=("Duty/Tax",), url=BILLING_INVOICES_URL):
+        self.types = types
+        self.url = url
+
+    def scan_steps(self, page, log=print):
+        if "invoices" not in page.url.lower():
+            yield from navigate_to_invoices_steps(page, log, self.url)
+        return (yield from read_invoice_list_steps(page, log))
+
+    def scan(self, page, log=print):
+        return run(self.scan_steps(page, log))
+
+    def select(self, found):
+        return [inv["invoice"] for inv in found if inv["type"] in self.types]
+
+
+class GivenInvoices:
+    """Source: a fixed list of invoice numbers (test runs, re-runs)"""
+
+    def __init__(self, invoices):
+        self.invoices = list(invoices)
+
+    def scan_steps(self, page, log=print):
+        return done([{"invoice": number, "type": "Given", "text": ""} for number in self.invoices])
+
+    def scan(self, page, log=print):
+        return run(self.scan_steps(page, log))
+
+    def select(self, found):
+        return [inv["invoice"] for inv in found]
+
+
+class InvoicePlanner:
+    """
+    Planner: open an invoice and work out which tracking IDs still need a Duty/Tax dispute.
+    With "prefetch_next_invoice", the next invoice starts loading in a second tab while the
+    current one is disputed; plan() then reads it there and the two tabs swap roles.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.prefetch_enabled = config.get("prefetch_next_invoice", True)
+        self.spare = None           # background tab
+        self.spare_invoice = None   # invoice loading in it
+        self.home = None            # the page the run started on
+        self.active = None          # the tab the current invoice is on
+
+    def plan_steps(self, page, invoice, log=print):
+        """
+        Returns an InvoiceWork, or None if the invoice page did not load.
+        work.page is the tab the invoice was read on (the prefetch tab when it was ready).
+        """
+        if self.home is None:
+            self.home = page
+        tab = yield from self._take_prefetched_steps(invoice)
+        if tab is not None:
+            if "invoice-details" in tab.url:
+                self.spare, self.active = page, tab
+                yield lambda: tab.bring_to_front()
+                return (yield from self.read_steps(tab, invoice, log))
+            log(f"   Prefetch of {invoice} did not load - opening it again")
+
+        self.active = page
+        yield lambda: page.goto(invoice_details_url(self.config, invoice), wait_until="domcontentloaded")
+        yield Pause(3)
+        if "invoice-details" not in page.url:
+            return None
+        return (yield from self.read_steps(page, invoice, log))
+
+    def plan(self, page, invoice, log=print):
+        return run(self.plan_steps(page, invoice, log))
+
+    def read_steps(self, page, invoice, log=print):
+        """Read an invoice page that is already open"""
+        records = yield from read_shipment_rows_steps(page)
+        try:
+            duty_tax, other = yield from read_dispute_activity_steps(page)
+        except Exception as e:
+            log(f"   ⚠ Error reading Dispute Activity: {str(e)[:100]}")
+            duty_tax, other = set(), set()
+        work = InvoiceWork(invoice, shipments_by_tracking(records), duty_tax, other, records)
+        work.page = page
+        return work
+
+    def read(self, page, invoice, log=print):
+        return run(self.read_steps(page, invoice, log))
+
+    def prefetch_steps(self, page, invoice, log=print):
+        """Start loading `invoice` in the background tab while `page` (the tab in use) is busy"""
+        if not self.prefetch_enabled or not invoice:
+            return
+        try:
+            if self.spare is None or self.spare.is_closed() or self.spare is page:
+                self.spare = yield lambda: page.context.new_page()
+                yield lambda: page.bring_to_front()
+            # Only wait for the response to start; the browser keeps loading while we dispute
+            yield lambda: self.spare.goto(invoice_details_url(self.config, invoice), wait_until="commit", timeout=60000)
+            self.spare_invoice = invoice
+        except Exception as e:
+            log(f"   Prefetch of {invoice} failed: {str(e)[:80]}")
+            self.spare_invoice = None
+
+    def prefetch(self, page, invoice, log=print):
+        run(self.prefetch_steps(page, invoice, log))
+
+    def _take_prefetched_steps(self, invoice):
+        if self.spare_invoice != invoice or self.spare is None or self.spare.is_closed():
+            return None
+        self.spare_invoice = None
+        tab = self.spare
+        try:
+            yield lambda: tab.wait_for_url("**/invoice-details**", timeout=30000)
+            yield lambda: tab.wait_for_load_state("domcontentloaded")
+        except Exception:
+            pass
+        return tab
+
+    def close_steps(self):
+        """Close the extra tab. Returns the page the run started on (None if plan() never ran)"""
+        home = self.home
+        extra = [tab for tab in (self.spare, self.active) if tab is not None and tab is not home]
+        self.spare = self.spare_invoice = self.home = self.active = None
+        for tab in set(extra):
+            try:
+                yield lambda: tab.close()
+            except Exception:
+                pass
+        return home
+
+    def close(self):
+        return run(self.close_steps())
+
+
+class FormExecutor:
+    """
+    Executor: file disputes through the dispute form. With "submission_mode": "http" and a
+    recorded request shape, disputes go straight to the API and the form is only the fallback.
+    """
+    dry_run = False
+
+    def __init__(self, config, recorder=None):
+        self.config = config
+        self.recorder = recorder
+        self.use_http = config.get("submission_mode") == "http" and load_request_shape(config) is not None
+
+    def submit_steps(self, page, row, invoice, tracking, amount, log=print):
+        """
+        Returns (outcome, detail). outcome is "disputed", "skipped", "failed", "error",
+        "no_button", or "needs_row" when direct submission failed and no row was given.
+        """
+        if self.use_http:
+            status, detail = yield from submit_dispute_http_steps(page.context, self.config, invoice, tracking, amount)
+            if status == "disputed":
+                return "disputed", detail
+            if status == "already_disputed":
+                return "skipped", detail
+            log(f"   HTTP submit failed for {tracking} ({detail}) - using the dispute form")
+            if row is None:
+                return "needs_row", detail
+
+        if row is None:
+            log(f"   ✗ {tracking} is no longer in the shipments table")
+            return "error", "row_not_found"
+        if self.recorder:
+            self.recorder.expect(invoice, tracking, amount)
+        return (yield from file_dispute_steps(page, row, self.config, log))
+
+    def submit(self, page, row, invoice, tracking, amount, log=print):
+        return run(self.submit_steps(page, row, invoice, tracking, amount, log))
+
+
+class DryRunExecutor:
+    """Executor that submits nothing and reports what would have been disputed"""
+    dry_run = True
+
+    def __init__(self, config=None):
+        self.config = config or {}
+
+    def submit_steps(self, page, row, invoice, tracking, amount, log=print):
+        return done(("would_dispute", ""))
+
+    def submit(self, page, row, invoice, tracking, amount, log=print):
+        return run(self.submit_steps(page, row, invoice, tracking, amount, log))
+
+
+# ========== SINKS ==========
+
+class Sink:
+    """Receives pipeline events; every method is optional"""
+
+    def log(self, message, level="INFO"):
+        pass
+
+    def invoices_found(self, found, selected):
+        pass
+
+    def invoice_started(self, invoice, index, total):
+        pass
+
+    def invoice_planned(self, work):
+        pass
+
+    def dispute_result(self, invoice, tracking, amount, outcome, detail=""):
+        pass
+
+    def invoice_finished(self, work, counts, status, partial=False):
+        pass
+
+    def invoice_error(self, invoice, error):
+        pass
+
+    def page_switched(self, page):
+        pass
+
+    def retry_started(self, invoice, trackings):
+        pass
+
+    def job_finished(self, totals):
+        pass
+
+
+class PrintSink(Sink):
+    """Console output (legacy scripts and dry-run checks)"""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+
+    def log(self, message, level="INFO"):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+    def invoices_found(self, found, selected):
+        self.log(f"📊 {len(found)} invoices listed, {len(selected)} to process")
+
+    def invoice_started(self, invoice, index, total):
+        self.log("=" * 60)
+        self.log(f"INVOICE {index} of {total}: {invoice}")
+        self.log("=" * 60)
+
+    def invoice_planned(self, work):
+        self.log(f"Tracking IDs in shipments table: {len(work.shipments)}")
+        self.log(f"Already disputed for Duty/Tax:   {len(work.duty_tax)}")
+        if self.verbose:
+            for tracking in sorted(work.duty_tax & set(work.shipments)):
+                self.log(f"   ⏭ {tracking} (already disputed for Duty/Tax)")
+            for tracking in sorted(work.other):
+                self.log(f"   ○ {tracking} (disputed for another reason - still needs Duty/Tax)")
+
+    def dispute_result(self, invoice, tracking, amount, outcome, detail=""):
+        symbols = {"disputed": "✓", "would_dispute": "📝", "skipped": "⏭"}
+        self.log(f"   {symbols.get(outcome, '✗')} {tracking} (${amount}) - {outcome}")
+
+    def invoice_finished(self, work, counts, status, partial=False):
+        if not work.to_dispute:
+            self.log(f"✅ {work.invoice}: all {len(work.shipments)} tracking IDs already disputed - nothing to do")
+            return
+        self.log(f"Invoice {work.invoice} complete: {counts['disputed']} disputed, "
+                 f"{counts['would_dispute']} would dispute, {counts['skipped']} skipped"
+                 + (" - TERMINATED EARLY" if partial else ""))
+
+    def invoice_error(self, invoice, error):
+        self.log(f"❌ ERROR processing invoice {invoice}: {error}")
+
+    def retry_started(self, invoice, trackings):
+        self.log("=" * 60)
+        self.log(f"RETRY {invoice}: {', '.join(trackings)}")
+        self.log("=" * 60)
+
+    def job_finished(self, totals):
+        self.log("=" * 60)
+        self.log(f"TOTAL: {totals['disputed']} disputed, {totals['would_dispute']} would dispute, "
+                 f"{totals['skipped']} skipped, {totals['errors']} errors")
+        retries = totals.get("retries")
+        if retries and retries["items"]:
+            self.log(f"Pending retry: {retries['pending']}, gave up: {retries['exhausted']}")
+            for item in retries["items"]:
+                self.log(f"   🔁 {item['invoice']} {item['tracking']} - {item['kind']} "
+                         f"({item['attempts']} attempts, {item['status']})")
+        self.log("=" * 60)
+
+
+# ========== PIPELINE ==========
+
+class Pipeline:
+    def __init__(self, config, source=None, planner=None, executor=None, sinks=None, should_stop=None,
+                 retries=None, breaker=None, pacer=None, fingerprints=None, budget=None):
+        self.config = config
+        self.source = source or InvoiceListSource(url=config.get("billing_url", BILLING_INVOICES_URL))
+        self.planner = planner or InvoicePlanner(config)
+        self.executor = executor or FormExecutor(config)
+        self.sinks = sinks or [PrintSink()]
+        user_stop = should_stop or (lambda: False)
+        # A spent run time budget stops the run like the stop command (the budget starts in run())
+        self.budget = budget if budget is not None else budget_for(config)
+        self.should_stop = user_stop if self.budget is None else lambda: self.budget.spent(self.log) or user_stop()
+        self.page = None          # tab in use (changes when a prefetched invoice is swapped in)
+        self.upcoming = None      # next invoice, loaded in the background while this one runs
+        # Dry runs never fail a submission, so they neither queue retries nor trip the breaker
+        dry_run = self.executor.dry_run
+        self.retries = retries if retries is not None or dry_run else retry_queue_for(config)
+        self.breaker = breaker if breaker is not None or dry_run else breaker_for(config)
+        self.pacer = pacer if pacer is not None or dry_run else controller_for(config)
+        self.fingerprints = fingerprints if fingerprints is not None or dry_run else fingerprints_for(config)
+
+    def emit(self, event, *args, **kwargs):
+        for sink in self.sinks:
+            getattr(sink, event)(*args, **kwargs)
+
+    def log(self, message, level="INFO"):
+        self.emit("log", message, level)
+
+    def scan_steps(self, page):
+        """Run the source; returns (everything listed, invoices selected for processing)"""
+        found = yield from self.source.scan_steps(page, self.log)
+        selected = self.source.select(found)
+        if self.fingerprints is not None:
+            # Fully handled invoices whose list row has not changed are not reopened
+            selected = self.fingerprints.skip_unchanged(found, selected, self.log)
+        selected = order_invoices(found, selected, self.config, log=self.log)
+        self.emit("invoices_found", found, selected)
+        return found, selected
+
+    def scan(self, page):
+        return run(self.scan_steps(page))
+
+    def run_steps(self, page, invoices=None):
+        """Process every selected invoice, then the retries that are due. Returns "completed" or "stopped" """
+        if invoices is None:
+            _, invoices = yield from self.scan_steps(page)
+        self.page = page
+        if self.budget is not None:
+            self.budget.start()
+        try:
+            return (yield from self._run_steps(invoices))
+        finally:
+            # Back on the starting tab, with the prefetch tab closed
+            home = yield from self.planner.close_steps()
+            if home is not None and home is not self.page:
+                self.page = home
+                self.emit("page_switched", home)
+
+    def run(self, page, invoices=None):
+        return run(self.run_steps(page, invoices))
+
+    def _run_steps(self, invoices):
+        totals = {"invoices": 0, "disputed": 0, "would_dispute": 0, "skipped": 0, "errors": 0}
+        for i, invoice in enumerate(invoices):
+            if self.should_stop():
+                self.log("Stopping by user request...")
+                return "stopped"
+
+            self.emit("invoice_started", invoice, i + 1, len(invoices))
+            self.upcoming = invoices[i + 1] if i + 1 < len(invoices) else None
+            counts = yield from self.process_guarded_steps(self.page, invoice, totals)
+            if counts is None:
+                return "stopped"
+        self.upcoming = None
+
+        if self.retries is not None:
+            for invoice, trackings in self.retries.due().items():
+                if self.should_stop():
+                    self.log("Stopping by user request...")
+                    return "stopped"
+                only = None if WHOLE_INVOICE in trackings else set(trackings)
+                self.emit("retry_started", invoice, trackings)
+                if (yield from self.process_guarded_steps(self.page, invoice, totals, only)) is None:
+                    return "stopped"
+            totals["retries"] = self.retries.summary()
+        if self.breaker is not None:
+            totals["breaker"] = self.breaker.to_dict()
+        if self.pacer is not None:
+            self.pacer.publish(min_interval=0)
+            totals["pacing"] = self.pacer.to_dict()
+
+        self.emit("job_finished", totals)
+        return "completed"
+
+    def process_guarded_steps(self, page, invoice, totals, only=None):
+        """process() with invoice-level failures counted, queued for retry and recovered from"""
+        try:
+            counts = yield from self.process_steps(page, invoice, only)
+        except Exception as e:
+            totals["errors"] += 1
+            self.emit("invoice_error", invoice, e)
+            if self.retries is not None:
+                self.retries.add(invoice, WHOLE_INVOICE, "", classify_exception(e), e)
+            try:
+                yield lambda: self.page.goto(BILLING_INVOICES_URL, wait_until="domcontentloaded")
+                yield Pause(3)
+            except Exception:
+                pass
+            return {}
+
+        if counts is None:
+            return None
+        if counts:
+            totals["invoices"] += 1
+        for key in ("disputed", "would_dispute", "skipped"):
+            totals[key] += counts.get(key, 0)
+        totals["errors"] += counts.get("failed", 0) + counts.get("error", 0)
+        return counts
+
+    def process_guarded(self, page, invoice, totals, only=None):
+        return run(self.process_guarded_steps(page, invoice, totals, only))
+
+    def process_steps(self, page, invoice, only=None):
+        """
+        Plan and execute one invoice (only the tracking IDs in `only` when given, e.g. a retry).
+        Returns the outcome counts, {} if the page did not load, or None if a stop was
+        requested part-way through.
+        """
+        work = yield from self.planner.plan_steps(page, invoice, self.log)
+        if work is not None and work.page is not None and work.page is not page:
+            page = self.page = work.page
+            self.emit("page_switched", page)
+        # The next invoice loads in the other tab while this one is disputed
+        yield from self.planner.prefetch_steps(page, self.upcoming, self.log)
+        if work is None:
+            self.log(f"Failed to load invoice {invoice}")
+            if self.retries is not None:
+                self.retries.add(invoice, WHOLE_INVOICE, "", NAVIGATION_TIMEOUT, "invoice page did not load")
+            return {}
+        if self.retries is not None:
+            self.retries.resolve(invoice, WHOLE_INVOICE)
+        if only is not None and self.retries is not None:
+            # Retried IDs that now show up in Dispute Activity went through after all
+            for tracking in only - set(work.to_dispute):
+                self.retries.resolve(invoice, tracking)
+            work.to_dispute = [t for t in work.to_dispute if t in only]
+        self.emit("invoice_planned", work)
+
+        counts = {"disputed": 0, "would_dispute": 0, "skipped": 0, "failed": 0, "error": 0, "no_button": 0}
+        if not work.to_dispute:
+            if only is None and self.fingerprints is not None:
+                self.fingerprints.record(invoice, work.shipments, complete=True)
+            self.emit("invoice_finished", work, counts, "pending")
+            return counts
+
+        status = "pending"
+        pending = set(work.to_dispute)
+        filed = set()
+        try:
+            records = work.records or (yield from read_shipment_records_steps(page))
+            for record in order_records(records, self.config):
+                if not pending:
+                    break
+                if record.tracking not in pending:
+                    continue
+                if self.should_stop():
+                    self.log("Stop command received.")
+                    return None
+                tracking = record.tracking
+
+                # Pause while the site is failing most submissions (each pipeline is its own trial owner)
+                if self.breaker is not None and not (yield from self.breaker.wait_steps(self.should_stop, self.log, self)):
+                    self.log("Stop command received.")
+                    return None
+                paced = False
+                try:
+                    if self.pacer is not None:
+                        if not (yield from self.pacer.pace_steps(self.should_stop)):
+                            self.log("Stop command received.")
+                            return None
+                        paced = True
+                    row = yield from locate_row_steps(page, record)
+                    amount = work.shipments.get(tracking) or record.amount
+                    started = time.time()
+                    outcome, detail = yield from self.executor.submit_steps(page, row, invoice, tracking, amount, self.log)
+                    counts[outcome] = counts.get(outcome, 0) + 1
+                    self.emit("dispute_result", invoice, tracking, amount, outcome, detail)
+                    self._record_outcome(invoice, tracking, amount, outcome, detail, time.time() - started)
+                finally:
+                    if paced:
+                        self.pacer.release()
+                    if self.breaker is not None:
+                        # A half-open trial that gave no verdict (no button, a crash, a stop) frees the slot
+                        self.breaker.end_trial(self)
+                # Only now: a crash before this point queues the ID for retry below
+                pending.discard(tracking)
+                if outcome in ("disputed", "skipped"):
+                    filed.add(tracking)
+                if outcome in ("disputed", "would_dispute"):
+                    status = "processing"
+                elif outcome in ("failed", "error"):
+                    status = "warning"
+        except Exception as e:
+            self.log(f"Error processing shipments: {e}")
+            if self.retries is not None:
+                for tracking in pending:
+                    self.retries.add(invoice, tracking, work.shipments.get(tracking, ""), classify_exception(e), e)
+            self.emit("invoice_finished", work, counts, "warning", partial=True)
+            return counts
+        except BaseException:
+            # Cancelled (async engine) or interrupted: report what was done; the rest is picked up next run
+            self.emit("invoice_finished", work, counts, "warning", partial=True)
+            raise
+
+        if only is None and self.fingerprints is not None:
+            self.fingerprints.record(invoice, work.shipments, complete=filed == set(work.to_dispute))
+        self.emit("invoice_finished", work, counts, status)
+        return counts
+
+    def process(self, page, invoice, only=None):
+        return run(self.process_steps(page, invoice, only))
+
+    def _record_outcome(self, invoice, tracking, amount, outcome, detail, latency):
+        """Feed a submission result to the retry queue, the circuit breaker and the pacer"""
+        kind = self.retries.record_outcome(invoice, tracking, amount, outcome, detail) \
+            if self.retries is not None else classify(outcome, detail)
+        if self.breaker is not None and kind not in (ALREADY_IN_DISPUTE, NO_BUTTON):
+            self.breaker.record(kind not in RETRYABLE)
+        if self.pacer is not None and kind != NO_BUTTON:
+            self.pacer.record(kind not in RETRYABLE, latency, kind)
@@ -0,0 +1,249 @@
+"""
+Planner - Two-phase plan/execute mode
+Planning opens invoices concurrently in read-only tabs and computes the exact set of
+tracking IDs to dispute; execution then submits only those items without re-reading
+the Dispute Activity section.
+"""
+import json
+import os
+from datetime import datetime
+
+from browser_worker import (
+    load_state, log, log_event, update_stat, dispute_tracking_row,
+    log_invoice_start, log_invoice_complete
+)
+from pipeline import invoice_details_url, read_shipments, read_dispute_activity
+from direct_submit import load_request_shape
+from fingerprints import fingerprints_for
+from table_model import read_shipment_records, locate_row
+
+PLAN_FILE = "dispute_plan.json"
+
+
+def load_plan(path=PLAN_FILE):
+    """Load the saved plan, or None"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return None
+
+
+def save_plan(plan, path=PLAN_FILE):
+    """Save the plan (the dashboard reads it through /plan)"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(plan, f, indent=2)
+    os.replace(tmp, path)
+
+
+def plan_entry(invoice_number, shipments, already_disputed_duty_tax, already_disputed_other):
+    """Plan entry for one invoice from what its page showed"""
+    items = [
+        {"tracking": tracking, "amount": float(amount), "status": "planned"}
+        for tracking, amount in shipments.items()
+        if tracking not in already_disputed_duty_tax
+    ]
+    return {
+        "invoice": invoice_number,
+        "scanned": len(shipments),
+        "handled": len(already_disputed_duty_tax) + len(already_disputed_other),
+        "items": items,
+        "expected_amount": round(sum(item["amount"] for item in items), 2),
+        "status": "planned" if items else "nothing_to_do"
+    }
+
+
+def read_invoice_for_plan(page, invoice_number, fingerprints=None):
+    """Read one already-loading invoice tab. Returns a plan entry (read-only)"""
+    try:
+        page.wait_for_url("**/invoice-details**", timeout=30000)
+    except:
+        pass
+    if "invoice-details" not in page.url:
+        return {"invoice": invoice_number, "scanned": 0, "handled": 0, "items": [],
+                "expected_amount": 0.0, "status": "load_failed"}
+
+    shipments = read_shipments(page)
+    try:
+        already_disputed_duty_tax, already_disputed_other = read_dispute_activity(page)
+    except Exception as e:
+        log(f"   ⚠ Error reading Dispute Activity for {invoice_number}: {str(e)[:100]}")
+        already_disputed_duty_tax, already_disputed_other = set(), set()
+    entry = plan_entry(invoice_number, shipments, already_disputed_duty_tax, already_disputed_other)
+    if fingerprints is not None and entry["status"] == "nothing_to_do":
+        fingerprints.record(invoice_number, shipments, complete=True)
+    return entry
+
+
+def build_plan(context, invoices, config, budget=None):
+    """
+    PLANNING PHASE: open invoices in batches of read-only tabs.
+    All tabs of a batch start loading at once; they are then read one by one,
+    so page loads overlap instead of adding up. `budget` (priority.RunBudget) is the
+    run's time budget - planning stops between batches once it is spent.
+    """
+    tabs = max(1, int(config.get("plan_tabs", 4)))
+    fingerprints = fingerprints_for(config)
+    plan = {
+        "created": datetime.now().isoformat(),
+        "account": config.get("account_number"),
+        "status": "planning",
+        "invoices": []
+    }
+    save_plan(plan)
+    log(f"🗺️ Planning {len(invoices)} invoices with {tabs} read-only tabs...")
+
+    pages = [context.new_page() for _ in range(min(tabs, len(invoices)))]
+    try:
+        for start in range(0, len(invoices), tabs):
+            if budget is not None and budget.spent(log):
+                plan["status"] = "stopped"
+                break
+            if load_state().get("command") == "stop":
+                log("Stop command received during planning.")
+                plan["status"] = "stopped"
+                break
+
+            batch = invoices[start:start + tabs]
+            # Kick off every navigation in the batch without waiting for the page to render
+            for page, invoice_number in zip(pages, batch):
+                try:
+                    page.goto(invoice_details_url(config, invoice_number), wait_until="commit", timeout=60000)
+                except Exception as e:
+                    log(f"Navigation warning for {invoice_number}: {e}")
+
+            for page, invoice_number in zip(pages, batch):
+                try:
+                    entry = read_invoice_for_plan(page, invoice_number, fingerprints)
+                except Exception as e:
+                    log(f"Error planning invoice {invoice_number}: {e}")
+                    entry = {"invoice": invoice_number, "scanned": 0, "handled": 0, "items": [],
+                             "expected_amount": 0.0, "status": "load_failed"}
+                plan["invoices"].append(entry)
+            save_plan(plan)
+    finally:
+        for page in pages:
+            try:
+                page.close()
+            except:
+                pass
+
+    plan["total_items"] = sum(len(entry["items"]) for entry in plan["invoices"])
+    plan["total_amount"] = round(sum(entry["expected_amount"] for entry in plan["invoices"]), 2)
+    if plan["status"] == "planning":
+        plan["status"] = "planned"
+    save_plan(plan)
+
+    log_event(
+        "Plan Ready",
+        f"{plan['total_items']} disputes planned across {len(plan['invoices'])} invoices (${plan['total_amount']:.2f})",
+        "success",
+        ["plan_ready"],
+        data={
+            "type": "plan_ready",
+            "invoices": len(plan["invoices"]),
+            "items": plan["total_items"],
+            "amount": plan["total_amount"]
+        }
+    )
+    return plan
+
+
+def execute_plan(page, plan, config, recorder=None, budget=None):
+    """
+    EXECUTION PHASE: submit exactly the planned items.
+    The Dispute Activity section is not read again; rows are only looked up to click them.
+    With prioritize_by_value the largest planned amounts go first; `budget` (priority.RunBudget)
+    stops execution once the run's time is up. Returns "completed" or "stopped".
+    """
+    use_http = config.get("submission_mode") == "http" and load_request_shape(config) is not None
+    entries = [entry for entry in plan["invoices"] if entry["items"]]
+    if config.get("prioritize_by_value", True):
+        # The plan knows the exact amounts to dispute - order by those, not the list rows
+        entries.sort(key=lambda entry: -entry["expected_amount"])
+        for entry in entries:
+            entry["items"].sort(key=lambda item: -item["amount"])
+    plan["status"] = "executing"
+    save_plan(plan)
+
+    def stopping():
+        return (budget is not None and budget.spent(log)) or load_state().get("command") == "stop"
+
+    for i, entry in enumerate(entries):
+        if stopping():
+            log("Stopping by user request...")
+            plan["status"] = "stopped"
+            save_plan(plan)
+            return "stopped"
+
+        invoice_number = entry["invoice"]
+        update_stat("invoices_processed", i + 1)
+        log_invoice_start(invoice_number, i + 1, len(entries))
+
+        invoice_logs = []
+        counts = {"disputed": 0, "skipped": 0}
+        invoice_status = "pending"
+        pending = {item["tracking"]: item for item in entry["items"] if item["status"] == "planned"}
+
+        try:
+            # Direct submission needs no page at all; only items it could not file go through the form
+            needs_form = dict(pending)
+            if use_http:
+                for tracking, item in pending.items():
+                    if stopping():
+                        needs_form = {}
+                        break
+                    outcome = dispute_tracking_row(page, None, invoice_number, tracking, f"{item['amount']:.2f}",
+                                                   config, invoice_logs, recorder, use_http=True)
+                    if outcome != "needs_row":
+                        needs_form.pop(tracking)
+                        item["status"] = outcome
+                        if outcome in counts:
+                            counts[outcome] += 1
+                        if outcome == "disputed":
+                            invoice_status = "processing"
+
+            records = {}
+            if needs_form:
+                page.goto(invoice_details_url(config, invoice_number), wait_until="domcontentloaded")
+                page.wait_for_selector("tbody tr", timeout=10000)
+                for record in read_shipment_records(page):
+                    records.setdefault(record.tracking, record)
+
+            for tracking, item in needs_form.items():
+                if stopping():
+                    break
+                # Located right before use, so a table re-rendered by the last dispute is read again
+                row = locate_row(page, records[tracking]) if tracking in records else None
+                if row is None:
+                    item["status"] = "row_not_found"
+                    invoice_status = "warning"
+                    continue
+                outcome = dispute_tracking_row(page, row, invoice_number, tracking, f"{item['amount']:.2f}",
+                                               config, invoice_logs, recorder)
+                item["status"] = outcome
+                if outcome in counts:
+                    counts[outcome] += 1
+                if outcome == "disputed":
+                    invoice_status = "processing"
+                elif outcome in ("failed", "error", "no_button"):
+                    invoice_status = "warning"
+        except Exception as e:
+            log(f"❌ Error executing plan for {invoice_number}: {e}")
+            update_stat("errors", increment=True)
+            invoice_status = "warning"
+
+        entry["status"] = "executed"
+        save_plan(plan)
+
+        summary_desc = f"{entry['scanned']} IDs planned, {counts['disputed']} new disputes ({counts['skipped']} skipped)"
+        log_invoice_complete(invoice_number, summary_desc, invoice_status, ["invoice_complete"], invoice_logs,
+                             entry["scanned"], counts["disputed"], counts["skipped"], entry["handled"])
+
+    plan["status"] = "executed"
+    plan["executed"] = datetime.now().isoformat()
+    save_plan(plan)
+    return "completed"
@@ -0,0 +1,100 @@
+"""
+Priority - Value-first ordering of invoices and tracking IDs, plus a run time budget
+Invoices are worked largest amount first, using the amount on their invoice-list row.
+That amount is weighted up to 2x as the dispute window closes; the window is counted
+from the invoice date on the row. Invoices whose window has already closed go last.
+Inside an invoice, tracking IDs are disputed largest amount due first. A stopped or
+time-boxed run (run_budget_minutes) has then spent its time on the largest disputes.
+"""
+import time
+from datetime import datetime
+
+DISPUTE_WINDOW_DAYS = 180
+URGENCY_WEIGHT = 1.0       # extra weight of an invoice on the last day of its window
+
+
+def parse_list_date(text):
+    """MM/DD/YYYY (as shown on the invoice list) -> date, or None"""
+    try:
+        return datetime.strptime(text, "%m/%d/%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def days_left(invoice_date, window_days=DISPUTE_WINDOW_DAYS, today=None):
+    """Days until the dispute window of an invoice dated `invoice_date` closes (None without a date)"""
+    if invoice_date is None:
+        return None
+    today = today or datetime.now().date()
+    return window_days - (today - invoice_date).days
+
+
+def invoice_score(invoice, window_days=DISPUTE_WINDOW_DAYS, today=None):
+    """
+    Value of working an invoice-list entry now: its amount, weighted up as the window
+    closes. -1 once the window has closed; 0 when the row shows no amount.
+    """
+    left = days_left(parse_list_date(invoice.get("date")), window_days, today)
+    if left is not None and left < 0:
+        return -1
+    amount = max(0.0, invoice.get("amount") or 0.0)
+    urgency = 0.0 if left is None else max(0.0, 1 - left / window_days)
+    return amount * (1 + URGENCY_WEIGHT * urgency)
+
+
+def order_invoices(found, selected, config, today=None, log=print):
+    """`selected` (invoice numbers) in priority order; list order breaks ties"""
+    if not config.get("prioritize_by_value", True) or len(selected) < 2:
+        return list(selected)
+    window = config.get("dispute_window_days", DISPUTE_WINDOW_DAYS)
+    rows = {inv["invoice"]: inv for inv in found}
+    scores = {number: invoice_score(rows.get(number, {}), window, today) for number in selected}
+    ordered = sorted(selected, key=lambda number: -scores[number])
+
+    closed = sum(1 for number in selected if scores[number] < 0)
+    if ordered != list(selected):
+        log(f"💰 Working {len(ordered)} invoices largest disputable amount first "
+            f"(weighted by days left in the {window}-day dispute window)")
+    if closed:
+        log(f"⌛ {closed} invoices are past the dispute window - they go last")
+    return ordered
+
+
+def order_records(records, config):
+    """Shipment records largest amount due first (table order breaks ties)"""
+    if not config.get("prioritize_by_value", True):
+        return list(records)
+    return sorted(records, key=lambda record: -float(record.amount))
+
+
+class RunBudget:
+    """Wall-clock budget for a run; the pipeline stops once it is spent"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = None
+        self.reported = False
+
+    def start(self):
+        self.started = time.time()
+        self.reported = False
+
+    def remaining(self):
+        if self.started is None:
+            return self.seconds
+        return max(0.0, self.started + self.seconds - time.time())
+
+    def spent(self, log=print):
+        """True once the budget is used up (reported once). Never true before start()"""
+        if self.started is None or self.remaining() > 0:
+            return False
+        if not self.reported:
+            self.reported = True
+            log(f"⏱ Run time budget of {self.seconds / 60:g} min used up - stopping")
+        return True
+
+
+def budget_for(config):
+    """The run's time budget, or None when run_budget_minutes is 0 (no limit)"""
+    minutes = config.get("run_budget_minutes", 0)
+    return RunBudget(minutes * 60) if minutes else None
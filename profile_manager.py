@@ -0,0 +1,178 @@
+"""
+Profile Manager - Per-worker copies of the logged-in Chrome profile
+launch_persistent_context locks its user_data_dir, so two workers cannot share
+./user_data_v6. Each extra worker gets its own clone under ./profiles/worker-<id>
+(the source profile without lock files and caches), and picks up the newest login
+from the shared session snapshot (session_state.json) whenever another worker re-logs in.
+
+Usage: python profile_manager.py --clone 2          clone (or refresh) worker 2's profile
+       python profile_manager.py --list             show the clones
+       python profile_manager.py --cleanup [--max-age-hours H]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+from session_store import load_snapshot, SESSION_FILE
+
+PROFILE_ROOT = "profiles"
+CLONE_MARKER = ".clone.json"
+
+# Never copied: Chrome's single-instance locks (they would make the clone look "in use")
+# and caches that Chrome rebuilds on its own
+SKIP_NAMES = {
+    "SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile", "RunningChromeVersion",
+    "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache", "DawnCache", "DawnGraphiteCache",
+    "CacheStorage", "Crashpad", "BrowserMetrics", "component_crx_cache"
+}
+
+# Files whose change means the source profile holds a newer login
+SESSION_FILES = ("Local State", os.path.join("Default", "Cookies"), os.path.join("Default", "Network", "Cookies"))
+
+
+def _copy_file(src, dst, *, follow_symlinks=True):
+    try:
+        return shutil.copy2(src, dst, follow_symlinks=follow_symlinks)
+    except OSError:
+        # Files the running Chrome holds open exclusively (Windows); cookies come from the snapshot instead
+        return dst
+
+
+class ProfileManager:
+    def __init__(self, source="./user_data_v6", root=PROFILE_ROOT, session_file=SESSION_FILE):
+        self.source = source
+        self.root = root
+        self.session_file = session_file
+        self.session_applied = 0   # saved_at of the last snapshot applied to this worker's context
+
+    def path_for(self, worker_id):
+        return os.path.join(self.root, f"worker-{worker_id}")
+
+    def _source_changed(self):
+        """Newest modification time of the source profile's session files"""
+        times = [os.path.getmtime(os.path.join(self.source, name))
+                 for name in SESSION_FILES if os.path.exists(os.path.join(self.source, name))]
+        return max(times) if times else 0
+
+    def _marker(self, path):
+        try:
+            with open(os.path.join(path, CLONE_MARKER), 'r') as f:
+                return json.load(f)
+        except:
+            return None
+
+    def clone(self, worker_id, refresh=False):
+        """
+        Return worker_id's profile directory, copying the source profile first if there is
+        no clone yet, the source has logged in again since, or refresh is requested.
+        """
+        path = self.path_for(worker_id)
+        marker = self._marker(path)
+        if marker and not refresh and marker.get("cloned_at", 0) >= self._source_changed():
+            return path
+
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        if os.path.isdir(self.source):
+            shutil.copytree(self.source, path, symlinks=False, copy_function=_copy_file,
+                            ignore=lambda _, names: [n for n in names if n in SKIP_NAMES],
+                            ignore_dangling_symlinks=True)
+        else:
+            os.makedirs(path)   # no logged-in profile yet - the worker logs in itself
+        with open(os.path.join(path, CLONE_MARKER), 'w') as f:
+            json.dump({"worker_id": worker_id, "source": self.source, "cloned_at": time.time(),
+                       "pid": os.getpid()}, f)
+        return path
+
+    def apply_session(self, context):
+        """
+        Load the shared session snapshot's cookies into the context if another worker saved
+        a newer login since the last call. Returns True if cookies were applied.
+        """
+        snapshot = load_snapshot(self.session_file)
+        if not snapshot or snapshot.get("saved_at", 0) <= self.session_applied:
+            return False
+        try:
+            context.add_cookies(snapshot.get("cookies", []))
+        except Exception as e:
+            print(f"Could not apply session snapshot: {e}")
+            return False
+        self.session_applied = snapshot.get("saved_at", 0)
+        return True
+
+    def skip_current(self):
+        """Treat the snapshot on disk as already applied (the profile is at least as new)"""
+        snapshot = load_snapshot(self.session_file)
+        self.session_applied = snapshot.get("saved_at", 0) if snapshot else 0
+
+    def clones(self):
+        """Every clone with its marker (worker id, when it was cloned, by which process)"""
+        if not os.path.isdir(self.root):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            marker = self._marker(path)
+            if os.path.isdir(path) and marker is not None:
+                result.append({"path": path, **marker})
+        return result
+
+    def remove(self, worker_id):
+        path = self.path_for(worker_id)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+        return False
+
+    def cleanup(self, max_age_hours=None, keep=()):
+        """
+        Remove clones that are not in `keep` and are older than max_age_hours
+        (all of them when no age is given). Returns the removed paths.
+        """
+        removed = []
+        now = time.time()
+        for clone in self.clones():
+            if clone.get("worker_id") in keep:
+                continue
+            if max_age_hours is not None and now - clone.get("cloned_at", 0) < max_age_hours * 3600:
+                continue
+            shutil.rmtree(clone["path"], ignore_errors=True)
+            removed.append(clone["path"])
+        return removed
+
+
+def profiles_for(config):
+    return ProfileManager(config.get("user_data_dir", "./user_data_v6"),
+                          config.get("profile_root", PROFILE_ROOT),
+                          config.get("session_file", SESSION_FILE))
+
+
+def user_data_dir_for(config, worker_id=None):
+    """The profile a worker launches with: the main profile, or a clone for extra workers"""
+    if not worker_id:
+        return config.get("user_data_dir", "./user_data_v6")
+    return profiles_for(config).clone(worker_id)
+
+
+if __name__ == "__main__":
+    from config import load_config
+
+    parser = argparse.ArgumentParser(description="Per-worker Chrome profile clones")
+    parser.add_argument("--clone", metavar="WORKER_ID", help="clone (or refresh) a worker's profile")
+    parser.add_argument("--refresh", action="store_true", help="re-copy even if the clone is current")
+    parser.add_argument("--list", action="store_true", help="show the clones")
+    parser.add_argument("--cleanup", action="store_true", help="remove clones")
+    parser.add_argument("--max-age-hours", type=float, default=None, help="only remove clones older than this")
+    args = parser.parse_args()
+
+    manager = profiles_for(load_config())
+    if args.clone:
+        print(manager.clone(args.clone, refresh=args.refresh))
+    elif args.cleanup:
+        removed = manager.cleanup(args.max_age_hours)
+        print(f"Removed {len(removed)} clone(s)")
+    else:
+        print(json.dumps(manager.clones(), indent=2))
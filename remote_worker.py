@@ -0,0 +1,250 @@
+"""
+Remote Worker - Takes invoice work from a coordinator (coordinator.py), on any machine
+Leases one item at a time, keeps the lease alive with heartbeats while it works and
+reports the outcome. If the worker dies mid-item the lease runs out and the coordinator
+hands the item to another worker. Retries of failed tracking IDs are the coordinator's
+job: they are reported back instead of kept in the local retry queue.
+
+Usage: python remote_worker.py --coordinator http://coordinator-host:5060 [--worker-id 2] [--name NAME]
+
+Local end-to-end run (several workers against billing_standin.py):
+       python billing_standin.py 5050
+       python coordinator.py --scan
+       python remote_worker.py --standin http://localhost:5050 --worker-id a
+       python remote_worker.py --standin http://localhost:5050 --worker-id b
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import requests
+
+from accounts import account_config
+from direct_submit import SHAPE_FILE, EXAMPLE_SHAPE_FILE
+from pipeline import Pipeline, FormExecutor, PrintSink, Sink
+from resilience import WHOLE_INVOICE
+from session_store import BILLING_URL
+
+POLL_INTERVAL = 5          # seconds between lease attempts while the queue is empty
+DEFAULT_LEASE_TTL = 60
+
+
+class CoordinatorClient:
+    """The coordinator's HTTP API"""
+
+    def __init__(self, base_url, worker, ttl=DEFAULT_LEASE_TTL, timeout=10):
+        self.base_url = base_url.rstrip("/")
+        self.worker = worker
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        return requests.post(f"{self.base_url}{path}", json={"worker": self.worker, **body}, timeout=self.timeout)
+
+    def lease(self):
+        """The next item, or None if nothing is due"""
+        response = self._post("/lease", {"ttl": self.ttl})
+        if response.status_code == 204:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def heartbeat(self, item_id):
+        """False once the lease is lost; None if the coordinator could not be reached"""
+        try:
+            return self._post(f"/items/{item_id}/heartbeat", {"ttl": self.ttl}).status_code == 200
+        except requests.RequestException:
+            return None
+
+    def complete(self, item_id, status, result):
+        return self._post(f"/items/{item_id}/complete", {"status": status, "result": result}).status_code == 200
+
+
+class LeaseKeeper:
+    """Renews an item's lease in the background; `lost` is set once the coordinator gave it away"""
+
+    def __init__(self, client, item_id, interval):
+        self.client = client
+        self.item_id = item_id
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.client.timeout + 1)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if self.client.heartbeat(self.item_id) is False:
+                print(f"⚠️ Lease on item {self.item_id} lost - stopping it")
+                self.lost.set()
+                return
+
+
+class ResultSink(Sink):
+    """Collects the tracking IDs disputed for the item in hand"""
+
+    def __init__(self):
+        self.disputed = []
+
+    def dispute_result(self, invoice, tracking, amount, outcome, detail=""):
+        if outcome in ("disputed", "would_dispute"):
+            self.disputed.append(tracking)
+
+
+class BrowserHandler:
+    """Works leased items on a logged-in Playwright page (one pipeline per account)"""
+
+    def __init__(self, page, config):
+        self.page = page
+        self.config = config
+        self.pipelines = {}
+        self.collector = ResultSink()
+        self.should_stop = lambda: False
+
+    def _pipeline(self, account):
+        if account not in self.pipelines:
+            config = account_config(self.config, account)
+            self.pipelines[account] = Pipeline(config, executor=FormExecutor(config),
+                                               sinks=[PrintSink(), self.collector],
+                                               should_stop=lambda: self.should_stop())
+        return self.pipelines[account]
+
+    def __call__(self, item, should_stop):
+        self.should_stop = should_stop
+        pipeline = self._pipeline(item["account"])
+
+        if item["kind"] == "scan":
+            self.page.goto(pipeline.config.get("billing_url", BILLING_URL), wait_until="domcontentloaded")
+            _, selected = pipeline.scan(self.page)
+            return "done", {"invoices": selected}
+
+        invoice = item["invoice"]
+        only = set(item["params"]["only"]) if item["params"].get("only") else None
+        self.collector.disputed = []
+        try:
+            counts = pipeline.process(self.page, invoice, only)
+        finally:
+            retry = self._take_retries(pipeline, invoice)
+        if counts is None:
+            return "stopped", {}
+        if not counts:
+            return "error", {"error": "invoice page did not load"}
+        return "done", {"counts": counts, "disputed": self.collector.disputed, "retry": retry}
+
+    @staticmethod
+    def _take_retries(pipeline, invoice):
+        """Move this invoice's entries from the local retry queue to the result"""
+        if pipeline.retries is None:
+            return []
+        entries = [entry["tracking"] for entry in pipeline.retries.pending() if entry["invoice"] == invoice]
+        for tracking in entries:
+            pipeline.retries.resolve(invoice, tracking)
+        return [tracking for tracking in entries if tracking != WHOLE_INVOICE]
+
+
+class RemoteWorker:
+    def __init__(self, client, handler, poll_interval=POLL_INTERVAL, should_stop=None):
+        self.client = client
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.should_stop = should_stop or (lambda: False)
+
+    def run_once(self):
+        """Lease, work and report one item. Returns the item, or None if nothing was due"""
+        item = self.client.lease()
+        if item is None:
+            return None
+        label = item["invoice"] or f"account {item['account'] or 'default'}"
+        print(f"▶️ {item['kind']} {label} (item {item['id']}, attempt {item['attempts']})")
+
+        keeper = LeaseKeeper(self.client, item["id"], max(1, item.get("ttl", self.client.ttl) / 3))
+        keeper.start()
+        try:
+            status, result = self.handler(item, lambda: keeper.lost.is_set() or self.should_stop())
+        except Exception as e:
+            print(f"❌ Item {item['id']} failed: {e}")
+            status, result = "error", {"error": str(e)[:200]}
+        finally:
+            keeper.stop()
+
+        if keeper.lost.is_set():
+            # Another worker has it now - its result is the one that counts
+            return item
+        if not self.client.complete(item["id"], status, result):
+            print(f"⚠️ Item {item['id']} was reassigned before it was reported")
+        return item
+
+    def run_forever(self):
+        print(f"Worker {self.client.worker} taking work from {self.client.base_url}")
+        while not self.should_stop():
+            try:
+                item = self.run_once()
+            except requests.RequestException as e:
+                print(f"Coordinator unreachable: {e}")
+                item = None
+            if item is None:
+                deadline = time.time() + self.poll_interval
+                while time.time() < deadline and not self.should_stop():
+                    time.sleep(0.2)
+
+
+def standin_config(config, base_url):
+    """Point a worker at billing_standin.py instead of the portal (local end-to-end runs)"""
+    base = base_url.rstrip("/")
+    shape = config.get("dispute_request_shape", SHAPE_FILE)
+    return {
+        **config,
+        "fedex_url": f"{base}/online/billing/cbs/invoices",
+        "billing_url": f"{base}/online/billing/cbs/invoices",
+        "session_probe_url": f"{base}/api/disputes",
+        "submission_mode": "http",
+        "dispute_api_url": f"{base}/api/disputes",
+        "dispute_request_shape": shape if os.path.exists(shape) else EXAMPLE_SHAPE_FILE,
+        "username": "",
+        "password": ""
+    }
+
+
+def serve(coordinator_url, worker_id="remote", name=None, standin=None):
+    from playwright.sync_api import sync_playwright
+    from browser_worker import load_worker_config, use_worker_files, launch_browser, login_phase, stop_requested
+
+    config = load_worker_config()
+    if config is None:
+        return
+    if standin:
+        config = standin_config(config, standin)
+    config = use_worker_files(config, worker_id)
+    client = CoordinatorClient(coordinator_url or config.get("coordinator_url", "http://localhost:5060"),
+                               name or f"{socket.gethostname()}:{worker_id}", config.get("lease_ttl", DEFAULT_LEASE_TTL))
+
+    with sync_playwright() as p:
+        browser_context, page = launch_browser(p, config, worker_id)
+        try:
+            login_phase(browser_context, page, config)
+            RemoteWorker(client, BrowserHandler(page, config), should_stop=stop_requested).run_forever()
+        except KeyboardInterrupt:
+            # The current item's lease runs out and another worker picks it up
+            print("Worker interrupted")
+        finally:
+            try:
+                browser_context.close()
+            except:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker that takes invoice work from a coordinator")
+    parser.add_argument("--coordinator", default=None, help="coordinator URL (default: coordinator_url)")
+    parser.add_argument("--worker-id", default="remote", help="local worker id (profile clone and control files)")
+    parser.add_argument("--name", default=None, help="name reported to the coordinator (default: host:worker-id)")
+    parser.add_argument("--standin", default=None, help="billing_standin.py URL to work against instead of the portal")
+    args = parser.parse_args()
+    serve(args.coordinator, args.worker_id, args.name, args.standin)
@@ -0,0 +1,258 @@
+"""
+Resilience - Failure classification, a persistent retry queue and a circuit breaker
+A dispute that hits the ERROR CODE popup, a form that never rendered or a navigation
+timeout is not lost any more: it goes into retry_queue.json with an exponential backoff
+(plus jitter) and is retried later in the run or by the next run. When too many recent
+submissions fail, the circuit breaker pauses submission instead of hammering a degraded site.
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from steps import Pause, run
+
+RETRY_FILE = "retry_queue.json"
+
+# Failure kinds (passed as the `detail` of a dispute outcome)
+ERROR_POPUP = "error_popup"                # FedEx "ERROR CODE" popup after submitting
+FORM_NOT_RENDERED = "form_not_rendered"    # dispute form never appeared / could not be filled
+NAVIGATION_TIMEOUT = "navigation_timeout"  # page or element timed out
+ALREADY_IN_DISPUTE = "already_in_dispute"  # "Item already in dispute status" popup
+NO_BUTTON = "no_button"                    # row has no action menu
+UNKNOWN = "unknown"
+
+RETRYABLE = (ERROR_POPUP, FORM_NOT_RENDERED, NAVIGATION_TIMEOUT, UNKNOWN)
+
+WHOLE_INVOICE = "*"  # retry entry for an invoice that failed before its rows were read
+
+
+def classify_exception(error):
+    """Failure kind for an exception raised while working on the portal"""
+    text = f"{type(error).__name__} {error}".lower()
+    if "timeout" in text or "net::err" in text or "navigation" in text:
+        return NAVIGATION_TIMEOUT
+    return UNKNOWN
+
+
+def classify(outcome, detail=""):
+    """Failure kind for a dispute outcome, or None if it succeeded / needs no retry"""
+    if outcome in ("disputed", "would_dispute"):
+        return None
+    if outcome == "skipped":
+        return ALREADY_IN_DISPUTE
+    if outcome == "no_button":
+        return NO_BUTTON
+    if detail in RETRYABLE:
+        return detail
+    if outcome == "failed":
+        return FORM_NOT_RENDERED
+    if "timeout" in (detail or "").lower():
+        return NAVIGATION_TIMEOUT
+    return UNKNOWN
+
+
+class RetryQueue:
+    """Failed disputes waiting for another attempt, persisted across runs"""
+
+    def __init__(self, path=RETRY_FILE, max_attempts=5, base_delay=60, max_delay=3600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.items = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {}
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.items, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def backoff(self, attempts):
+        """Exponential backoff with jitter: half the delay fixed, half random"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def add(self, invoice, tracking, amount, kind, error=""):
+        """Record a failed attempt; gives up (status "exhausted") after max_attempts"""
+        key = f"{invoice}|{tracking}"
+        with self.lock:
+            item = self.items.get(key) or {
+                "invoice": invoice, "tracking": tracking, "amount": amount,
+                "attempts": 0, "first_failed": datetime.now().isoformat(timespec="seconds")
+            }
+            item["attempts"] += 1
+            item["kind"] = kind
+            item["last_error"] = str(error)[:200]
+            if item["attempts"] >= self.max_attempts:
+                item["status"] = "exhausted"
+                item["next_attempt"] = None
+            else:
+                item["status"] = "pending"
+                item["next_attempt"] = time.time() + self.backoff(item["attempts"])
+            self.items[key] = item
+            self._save()
+        return item
+
+    def resolve(self, invoice, tracking):
+        """Drop an entry once the dispute went through (or turned out not to be needed)"""
+        with self.lock:
+            if self.items.pop(f"{invoice}|{tracking}", None) is not None:
+                self._save()
+
+    def record_outcome(self, invoice, tracking, amount, outcome, detail=""):
+        """Queue or clear an entry for a dispute outcome. Returns the failure kind (None on success)"""
+        kind = classify(outcome, detail)
+        if kind in RETRYABLE:
+            self.add(invoice, tracking, amount, kind, detail)
+        elif f"{invoice}|{tracking}" in self.items:
+            self.resolve(invoice, tracking)
+        return kind
+
+    def due(self, now=None):
+        """Pending entries whose backoff has elapsed, grouped by invoice: {invoice: [tracking, ...]}"""
+        now = now or time.time()
+        grouped = {}
+        with self.lock:
+            for item in self.items.values():
+                if item["status"] == "pending" and item["next_attempt"] <= now:
+                    grouped.setdefault(item["invoice"], []).append(item["tracking"])
+        return grouped
+
+    def pending(self):
+        """Every entry not yet resolved (pending and exhausted), oldest first"""
+        with self.lock:
+            return sorted(self.items.values(), key=lambda item: item["first_failed"])
+
+    def summary(self):
+        items = self.pending()
+        return {
+            "pending": sum(1 for item in items if item["status"] == "pending"),
+            "exhausted": sum(1 for item in items if item["status"] == "exhausted"),
+            "items": items
+        }
+
+
+def retry_queue_for(config):
+    return RetryQueue(config.get("retry_file", RETRY_FILE),
+                      max_attempts=config.get("retry_max_attempts", 5),
+                      base_delay=config.get("retry_base_seconds", 60))
+
+
+class CircuitBreaker:
+    """
+    Trips when the failure rate over the last `window` submissions reaches `threshold`
+    (after at least `min_calls`). While open, wait() pauses submission for `cooldown`
+    seconds; then one trial submission is let through (half open) and every other caller
+    keeps waiting until it is recorded. A failed trial re-opens the breaker with twice the
+    cooldown, up to `max_cooldown`.
+    """
+
+    def __init__(self, threshold=0.5, window=20, min_calls=5, cooldown=120, max_cooldown=1800):
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.results = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0
+        self.trips = 0
+        self.lock = threading.Lock()
+        self.trial_owner = None     # caller making the half-open trial submission
+
+    def failure_rate(self):
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    def record(self, success):
+        with self.lock:
+            self.results.append(success)
+            if self.state == "half_open":
+                self.trial_owner = None
+                if success:
+                    self.state = "closed"
+                    self.cooldown = self.base_cooldown
+                    self.results.clear()
+                else:
+                    self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    self._open()
+            elif (self.state == "closed" and len(self.results) >= self.min_calls
+                  and self.failure_rate() >= self.threshold):
+                self._open()
+
+    def end_trial(self, owner=None):
+        """Called after every submission: a trial that was not recorded lets the next caller try"""
+        with self.lock:
+            if self.trial_owner == (owner if owner is not None else threading.get_ident()):
+                self.trial_owner = None
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.time()
+        self.trips += 1
+
+    def remaining(self):
+        """Seconds until the next trial submission is allowed (0 when closed)"""
+        if self.state != "open":
+            return 0
+        return max(0, self.opened_at + self.cooldown - time.time())
+
+    def wait_steps(self, should_stop=None, log=print, owner=None):
+        """
+        Wait while the breaker is open, and while another caller's half-open trial is in
+        flight (a steps.py script). `owner` identifies the caller for end_trial(); it defaults
+        to the current thread, so coroutines sharing a thread must pass their own token.
+        Returns False if a stop was requested meanwhile
+        """
+        owner = owner if owner is not None else threading.get_ident()
+        announced = False
+        while True:
+            with self.lock:
+                if self.state == "closed":
+                    return True
+                if self.state == "open" and self.remaining() <= 0:
+                    self.state = "half_open"
+                    log("▶️ Circuit half open - trying one dispute")
+                if self.state == "half_open" and self.trial_owner is None:
+                    self.trial_owner = owner
+                    return True
+                if self.state == "open" and not announced:
+                    announced = True
+                    log(f"⏸️ Circuit open ({self.failure_rate():.0%} of recent disputes failed) - "
+                        f"pausing submission for {self.remaining():.0f}s")
+            if should_stop and should_stop():
+                return False
+            yield Pause(min(1.0, max(0.1, self.remaining())))
+
+    def wait(self, should_stop=None, log=print, owner=None):
+        """Block while the breaker is open (sync API) - see wait_steps"""
+        return run(self.wait_steps(should_stop, log, owner))
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate(), 2),
+            "trips": self.trips,
+            "cooldown": self.cooldown,
+            "remaining": round(self.remaining(), 1)
+        }
+
+
+def breaker_for(config):
+    return CircuitBreaker(threshold=config.get("breaker_error_rate", 0.5),
+                          cooldown=config.get("breaker_cooldown_seconds", 120))
@@ -0,0 +1,151 @@
+"""
+Screencast Relay - Streams page frames to the dashboard via CDP screencast
+Works for headless pages too, so the live view survives the headless handoff
+"""
+import base64
+import os
+import threading
+import time
+
+import requests
+
+FRAME_URL = "http://localhost:5000/update_frame"
+
+
+class ScreencastRelay:
+    """
+    Subscribes to Page.screencastFrame on a page and posts the newest JPEG
+    to the dashboard's /update_frame endpoint from a background thread.
+
+    Chrome only emits a frame when the page actually repaints, and frames are
+    acknowledged on the Playwright thread (the sync API is not thread-safe),
+    so the automation thread only pays for a base64 decode per frame.
+    Note: the sync API dispatches events while the worker is inside a
+    Playwright call, so frames arrive in bursts between steps.
+    """
+
+    def __init__(self, url=FRAME_URL, quality=60, max_fps=5, max_width=1280, max_height=720):
+        self.url = url
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+        self.max_width = max_width
+        self.max_height = max_height
+
+        self.cdp = None
+        self.latest = None
+        self.last_frame_time = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self._lock = threading.Lock()
+        self._new_frame = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, page):
+        """Start streaming frames from this page (detaches from any previous page)"""
+        self.detach()
+        try:
+            self.cdp = page.context.new_cdp_session(page)
+            self.cdp.on("Page.screencastFrame", self._on_frame)
+            self.cdp.send("Page.startScreencast", {
+                "format": "jpeg",
+                "quality": self.quality,
+                "maxWidth": self.max_width,
+                "maxHeight": self.max_height
+            })
+        except Exception as e:
+            print(f"Screencast unavailable: {e}")
+            self.cdp = None
+            return False
+
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._post_loop, daemon=True)
+            self._thread.start()
+        return True
+
+    def detach(self):
+        """Stop the screencast on the current page"""
+        if self.cdp:
+            try:
+                self.cdp.send("Page.stopScreencast")
+                self.cdp.detach()
+            except:
+                pass
+            self.cdp = None
+
+    def stop(self):
+        """Stop streaming and shut down the poster thread"""
+        self.detach()
+        self._stop.set()
+        self._new_frame.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _on_frame(self, params):
+        # Ack first so Chrome keeps sending frames
+        try:
+            self.cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+        except:
+            pass
+
+        now = time.time()
+        if now - self.last_frame_time < self.min_interval:
+            self.frames_dropped += 1
+            return
+        self.last_frame_time = now
+
+        with self._lock:
+            self.latest = base64.b64decode(params["data"])
+        self._new_frame.set()
+
+    def _post_loop(self):
+        session = requests.Session()
+        while not self._stop.is_set():
+            self._new_frame.wait(timeout=1)
+            self._new_frame.clear()
+            with self._lock:
+                frame, self.latest = self.latest, None
+            if not frame:
+                continue
+            self.deliver(frame, session)
+
+    def deliver(self, frame, session):
+        """Hand one JPEG frame to its destination (runs on the background thread)"""
+        try:
+            session.post(self.url, data=frame, timeout=2,
+                         headers={"Content-Type": "image/jpeg"})
+            self.frames_sent += 1
+        except:
+            # Dashboard not running - keep going, the next frame may get through
+            pass
+
+
+class ScreenshotFileRelay(ScreencastRelay):
+    """
+    Same screencast, but each frame replaces a JPEG file on disk (for bot_engine's
+    latest_view). Frames identical to the last one written are skipped, and the file
+    is swapped atomically so readers never see a half-written image.
+    """
+
+    def __init__(self, path, quality=60, max_fps=2, max_width=1280, max_height=720):
+        super().__init__(url=None, quality=quality, max_fps=max_fps, max_width=max_width, max_height=max_height)
+        self.path = path
+        self.last_written = None
+        self.frames_unchanged = 0
+
+    def deliver(self, frame, session):
+        if frame == self.last_written:
+            self.frames_unchanged += 1
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(frame)
+            os.replace(tmp, self.path)
+            self.last_written = frame
+            self.frames_sent += 1
+        except Exception as e:
+            print(f"Screenshot write failed: {e}")
@@ -0,0 +1,117 @@
+"""
+Session Store - Saves and checks Playwright storage-state snapshots
+Lets the worker skip the interactive login when the saved session is still valid
+"""
+import json
+import os
+import time
+
+from steps import run
+
+SESSION_FILE = "session_state.json"
+BILLING_URL = "https://www.fedex.com/online/billing/cbs/invoices"
+
+# If a probe request ends up on one of these URLs the session has expired
+LOGIN_URL_MARKERS = ("secure-login", "/login", "logged-out")
+
+# The billing SPA answers 200 with the same shell whether or not the session is alive, so an
+# HTML probe only passes if the page shows one of these ("session_logged_in_markers")
+LOGGED_IN_MARKERS = ("Sign Out", "Log Out", "Logout", "My Profile")
+
+
+def save_snapshot_steps(context, path=SESSION_FILE):
+    """Save the context's cookies and local storage to disk (a steps.py script)"""
+    try:
+        state = yield lambda: context.storage_state()
+        state["saved_at"] = time.time()
+        with open(path, 'w') as f:
+            json.dump(state, f)
+        return True
+    except Exception as e:
+        print(f"Could not save session snapshot: {e}")
+        return False
+
+
+def save_snapshot(context, path=SESSION_FILE):
+    """Save the context's cookies and local storage to disk"""
+    return run(save_snapshot_steps(context, path))
+
+
+def load_snapshot(path=SESSION_FILE):
+    """Load a saved snapshot, or None if there is none"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return None
+
+
+def has_live_cookies(cookies, domain="fedex.com", now=None):
+    """True if at least one cookie for the domain has not expired yet"""
+    if now is None:
+        now = time.time()
+    for cookie in cookies or []:
+        if domain not in cookie.get("domain", ""):
+            continue
+        expires = cookie.get("expires", -1)
+        # -1 means a session cookie, which is alive as long as the profile is
+        if expires == -1 or expires > now:
+            return True
+    return False
+
+
+def probe_session_steps(context, url=BILLING_URL, timeout=8000, markers=LOGGED_IN_MARKERS):
+    """
+    Fast API probe - fetch `url` with the context's cookies. A 200 alone proves nothing:
+    the response must not have been redirected to the login page, and must be either JSON
+    (point "session_probe_url" at an authenticated API endpoint) or a page that shows a
+    logged-in marker. No page is rendered, so this takes a fraction of a second.
+    """
+    try:
+        response = yield lambda: context.request.get(url, timeout=timeout)
+        if not response.ok or any(marker in response.url for marker in LOGIN_URL_MARKERS):
+            return False
+        if "json" in response.headers.get("content-type", ""):
+            return True
+        body = yield lambda: response.text()
+    except Exception as e:
+        print(f"Session probe failed: {e}")
+        return False
+    return any(marker in body for marker in markers)
+
+
+def probe_session(context, url=BILLING_URL, timeout=8000, markers=LOGGED_IN_MARKERS):
+    """Fast API probe (sync API) - see probe_session_steps"""
+    return run(probe_session_steps(context, url, timeout, markers))
+
+
+def session_is_valid_steps(context, config):
+    """
+    Check the session before rendering any login page (a steps.py script).
+    1. Cookie check - the profile (or the saved snapshot) must still hold live cookies
+    2. API probe   - an authenticated endpoint (or a page showing a logged-in marker) must
+                     answer without bouncing us to the login page
+    """
+    path = config.get("session_file", SESSION_FILE)
+    probe_url = config.get("session_probe_url", BILLING_URL)
+    markers = config.get("session_logged_in_markers", LOGGED_IN_MARKERS)
+
+    if not has_live_cookies((yield lambda: context.cookies())):
+        snapshot = load_snapshot(path)
+        if not snapshot or not has_live_cookies(snapshot.get("cookies")):
+            return False
+        # Profile lost its cookies but the snapshot still has them - restore
+        try:
+            yield lambda: context.add_cookies(snapshot["cookies"])
+        except Exception as e:
+            print(f"Could not restore cookies from snapshot: {e}")
+            return False
+
+    return (yield from probe_session_steps(context, probe_url, markers=markers))
+
+
+def session_is_valid(context, config):
+    """Check the session before rendering any login page (sync API)"""
+    return run(session_is_valid_steps(context, config))
@@ -0,0 +1,257 @@
+"""
+Stats Store - Embedded SQLite store of filed disputes with precomputed rollups
+Every dispute is one row in `disputes`; the daily, monthly and all-time counts and
+dollar amounts (overall and per account) are kept in `rollups` and updated in the same
+transaction, so summaries are a primary-key lookup instead of a scan.
+
+Replaces stats.json (its totals are imported once on first use).
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+DB_FILE = "stats.db"
+LEGACY_STATS_FILE = "stats.json"
+
+ALL_ACCOUNTS = ""  # rollup rows that cover every account
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS disputes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filed_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    month TEXT NOT NULL,
+    account TEXT NOT NULL DEFAULT '',
+    invoice TEXT NOT NULL,
+    tracking TEXT NOT NULL,
+    amount REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_disputes_filed_at ON disputes(filed_at);
+CREATE INDEX IF NOT EXISTS idx_disputes_account_filed_at ON disputes(account, filed_at);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    period_type TEXT NOT NULL,   -- 'day', 'month' or 'all'
+    period TEXT NOT NULL,        -- 'YYYY-MM-DD', 'YYYY-MM' or ''
+    account TEXT NOT NULL,       -- '' for all accounts
+    count INTEGER NOT NULL DEFAULT 0,
+    amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (period_type, period, account)
+);
+
+-- Credits FedEx issued against disputes (imported from credit notes / statements)
+CREATE TABLE IF NOT EXISTS credits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    credited_at TEXT NOT NULL,
+    account TEXT NOT NULL DEFAULT '',
+    invoice TEXT NOT NULL,
+    tracking TEXT NOT NULL,
+    amount REAL NOT NULL DEFAULT 0,
+    UNIQUE (invoice, tracking, credited_at)
+);
+CREATE INDEX IF NOT EXISTS idx_credits_tracking ON credits(invoice, tracking);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_initialized = set()
+
+
+def connect(path=DB_FILE):
+    """Open the store (creating the schema and importing stats.json the first time)"""
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if path not in _initialized:
+        # WAL lets the dashboard read while the worker writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        migrate_stats_json(conn)
+        _initialized.add(path)
+    return conn
+
+
+def _bump_rollups(conn, filed_at, account, count, amount):
+    """Add count/amount to the day, month and all-time rollups for the account and overall"""
+    periods = [("day", filed_at[:10]), ("month", filed_at[:7]), ("all", "")]
+    accounts = {ALL_ACCOUNTS, account}
+    conn.executemany(
+        """INSERT INTO rollups (period_type, period, account, count, amount) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(period_type, period, account)
+           DO UPDATE SET count = count + excluded.count, amount = amount + excluded.amount""",
+        [(period_type, period, acct, count, amount) for period_type, period in periods for acct in accounts]
+    )
+
+
+def _bump_version(conn):
+    conn.execute(
+        """INSERT INTO meta (key, value) VALUES ('version', '1')
+           ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"""
+    )
+
+
+def migrate_stats_json(conn, path=LEGACY_STATS_FILE):
+    """Import the totals from stats.json once (it has no per-dispute detail, only counts)"""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_stats_json'").fetchone():
+        return
+    stats = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                stats = json.load(f)
+        except:
+            pass
+
+    with conn:
+        monthly = stats.get("monthly_disputes", {})
+        for month, count in monthly.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO rollups (period_type, period, account, count, amount) VALUES ('month', ?, ?, ?, 0)",
+                (month, ALL_ACCOUNTS, int(count))
+            )
+        total = int(stats.get("total_disputes", sum(monthly.values())))
+        if total:
+            conn.execute(
+                "INSERT OR IGNORE INTO rollups (period_type, period, account, count, amount) VALUES ('all', '', ?, ?, 0)",
+                (ALL_ACCOUNTS, total)
+            )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_stats_json', ?)", (datetime.now().isoformat(),))
+
+
+def record_dispute(invoice_number, tracking_num, amount, account="", filed_at=None, path=DB_FILE):
+    """Store one filed dispute and update its rollups (one transaction)"""
+    filed_at = filed_at or datetime.now().isoformat()
+    account = str(account or "")
+    amount = float(amount or 0)
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute(
+                """INSERT INTO disputes (filed_at, day, month, account, invoice, tracking, amount)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (filed_at, filed_at[:10], filed_at[:7], account, invoice_number, tracking_num, amount)
+            )
+            _bump_rollups(conn, filed_at, account, 1, amount)
+            _bump_version(conn)
+    finally:
+        conn.close()
+
+
+def record_credit(invoice_number, tracking_num, amount, credited_at=None, account="", path=DB_FILE):
+    """Store a credit received for a disputed shipment. Returns False if it was already recorded"""
+    credited_at = credited_at or datetime.now().isoformat()
+    conn = connect(path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                """INSERT OR IGNORE INTO credits (credited_at, account, invoice, tracking, amount)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (credited_at, str(account or ""), invoice_number, tracking_num, float(amount or 0))
+            )
+            if cursor.rowcount:
+                _bump_version(conn)
+            return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def summary(account=None, now=None, path=DB_FILE):
+    """
+    Today / this month / all-time counts and amounts, read straight from the rollups.
+    Returns {"day": {...}, "month": {...}, "all": {...}} with "count" and "amount".
+    """
+    now = now or datetime.now()
+    result = {key: {"count": 0, "amount": 0.0} for key in ("day", "month", "all")}
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            """SELECT period_type, count, amount FROM rollups
+               WHERE account = ? AND ((period_type = 'day' AND period = ?)
+                                   OR (period_type = 'month' AND period = ?)
+                                   OR (period_type = 'all' AND period = ''))""",
+            (str(account or ALL_ACCOUNTS), now.strftime("%Y-%m-%d"), now.strftime("%Y-%m"))
+        ).fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        result[row["period_type"]] = {"count": row["count"], "amount": round(row["amount"], 2)}
+    return result
+
+
+def history(period_type="day", start=None, end=None, account=None, path=DB_FILE):
+    """Rollups for a range of days ('YYYY-MM-DD') or months ('YYYY-MM'), oldest first"""
+    if period_type not in ("day", "month"):
+        raise ValueError("period_type must be 'day' or 'month'")
+    query = "SELECT period, count, amount FROM rollups WHERE period_type = ? AND account = ?"
+    params = [period_type, str(account or ALL_ACCOUNTS)]
+    if start:
+        query += " AND period >= ?"
+        params.append(start)
+    if end:
+        query += " AND period <= ?"
+        params.append(end)
+    query += " ORDER BY period"
+    conn = connect(path)
+    try:
+        return [{"period": r["period"], "count": r["count"], "amount": round(r["amount"], 2)}
+                for r in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def accounts(path=DB_FILE):
+    """All-time count and amount per account"""
+    conn = connect(path)
+    try:
+        return [{"account": r["account"], "count": r["count"], "amount": round(r["amount"], 2)}
+                for r in conn.execute(
+                    "SELECT account, count, amount FROM rollups WHERE period_type = 'all' AND account != '' ORDER BY account")]
+    finally:
+        conn.close()
+
+
+def version(path=DB_FILE):
+    """Counter bumped on every write (lets readers cache derived results)"""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row["value"]) if row else 0
+    finally:
+        conn.close()
+
+
+def _range_params(start=None, end=None, account=None):
+    """WHERE clause for a day range (inclusive 'YYYY-MM-DD' bounds) and account, using the filed_at indexes"""
+    clauses, params = [], []
+    if account:
+        clauses.append("account = ?")
+        params.append(str(account))
+    if start:
+        clauses.append("filed_at >= ?")
+        params.append(start)
+    if end:
+        clauses.append("filed_at < ?")
+        next_day = datetime.strptime(end[:10], "%Y-%m-%d") + timedelta(days=1)
+        params.append(next_day.strftime("%Y-%m-%d"))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def iter_disputes(start=None, end=None, account=None, batch_size=1000, path=DB_FILE):
+    """Yield filed disputes (dicts, oldest first) in batches from a cursor - never the whole table at once"""
+    where, params = _range_params(start, end, account)
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            "SELECT filed_at, account, invoice, tracking, amount FROM disputes" + where + " ORDER BY filed_at, id",
+            params
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
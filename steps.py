@@ -0,0 +1,68 @@
+"""
+Steps - Page scripts written once and run on either Playwright API
+A step script is a generator that yields one browser call at a time as a zero-argument
+callable (or a Pause) and gets its result back from the yield:
+
+    visible = yield lambda: page.locator("text=Dispute type").first.is_visible(timeout=3000)
+    yield Pause(1)
+
+run() executes the calls directly (playwright.sync_api); run_async() awaits them
+(playwright.async_api), so the same script drives a sync page or an async page without
+threads. Exceptions are thrown back into the script at the yield, so its try/except and
+finally blocks work the same way; on the async side that includes task cancellation.
+Scripts catch `Exception`, never a bare except, so cancellation is not swallowed.
+"""
+import asyncio
+import inspect
+import time
+
+
+class Pause:
+    """Step: sleep (time.sleep on the sync driver, asyncio.sleep on the async one)"""
+
+    def __init__(self, seconds):
+        self.seconds = max(0.0, seconds)
+
+
+def run(steps):
+    """Run a step script on the sync API. Returns the script's return value"""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        try:
+            if isinstance(step, Pause):
+                time.sleep(step.seconds)
+            else:
+                result = step()
+        except BaseException as e:
+            error = e
+
+
+async def run_async(steps):
+    """Run a step script on the async API, awaiting every call. Returns the script's return value"""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        try:
+            if isinstance(step, Pause):
+                await asyncio.sleep(step.seconds)
+            else:
+                result = step()
+                if inspect.isawaitable(result):
+                    result = await result
+        except BaseException as e:
+            error = e
+
+
+def done(value=None):
+    """A script that yields nothing (for stages with nothing to do on the page)"""
+    return value
+    yield
@@ -0,0 +1,170 @@
+"""
+Supervisor - Dispatches queued and scheduled jobs (job_queue.py) to the resident worker
+Only one supervisor acts at a time (a lease in jobs.db), so the dashboard's built-in
+supervisor and a standalone `python supervisor.py` never hand out two jobs at once.
+The worker records how each job ended; the supervisor requeues a job whose worker died.
+
+Usage: python supervisor.py                                  run the dispatch loop
+       python supervisor.py --add-schedule daily@02:00 [--account N] [--priority P]
+       python supervisor.py --enqueue [--account N] [--priority P]
+       python supervisor.py --list
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import job_queue
+from browser_worker import load_state, save_state, save_logs
+from worker_daemon import load_heartbeat, worker_is_alive, worker_is_ready
+
+# How long to wait for a freshly spawned worker to report in
+WORKER_HANDSHAKE_TIMEOUT = 180   # covers the worker's login
+POLL_INTERVAL = 2      # seconds between dispatch ticks
+LEASE_TTL = 30         # seconds a supervisor lease stays valid without renewal
+
+_worker_process = None
+
+
+def ensure_worker():
+    """
+    Make sure a resident worker is running, spawning one if needed.
+    Waits for its heartbeat to report "ready" (readiness handshake) instead of a fixed sleep;
+    a worker that is still booting or logging in is waited for, not replaced.
+    """
+    global _worker_process
+
+    heartbeat = load_heartbeat()
+    if worker_is_ready(heartbeat):
+        return True
+
+    process = None
+    if worker_is_alive(heartbeat):
+        pid = heartbeat.get("pid")
+    else:
+        process = _worker_process = subprocess.Popen([sys.executable, "worker_daemon.py"])
+        pid = process.pid
+
+    deadline = time.time() + WORKER_HANDSHAKE_TIMEOUT
+    while time.time() < deadline:
+        heartbeat = load_heartbeat()
+        if heartbeat.get("pid") == pid and worker_is_ready(heartbeat):
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        if process is None and not worker_is_alive(heartbeat):
+            return False
+        time.sleep(0.1)
+    return False
+
+
+def run_in_progress(state):
+    """True if the worker is busy with a run (including one started outside the queue)"""
+    return state.get("status") in ("running", "processing") or state.get("command") in ("start", "processing")
+
+
+class Supervisor:
+    def __init__(self, poll_interval=POLL_INTERVAL, lease_ttl=LEASE_TTL, path=job_queue.DB_FILE):
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()   # one tick at a time (background loop vs. /start)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tick(self):
+        """
+        One dispatch pass: enqueue due schedules, watch the running job, hand the next
+        job to the worker. Returns the job that was dispatched (or None).
+        """
+        with self.lock:
+            if not job_queue.acquire_lease(self.owner, self.lease_ttl, self.path):
+                return None
+            job_queue.enqueue_due_schedules(path=self.path)
+
+            running = job_queue.running_job(self.path)
+            if running:
+                self._watch(running)
+                return None
+            if run_in_progress(load_state()) and worker_is_alive():
+                return None
+
+            job = job_queue.claim_next(self.path)
+            if job:
+                self.dispatch(job)
+            return job
+
+    def dispatch(self, job):
+        """Hand a claimed job to the worker through the control channel"""
+        print(f"▶️ Dispatching job {job['id']} ({job['source']}, account {job['account'] or 'default'})")
+
+        # Fresh session log for the run
+        save_logs({"logs": [], "stats": {"disputed": 0, "skipped": 0, "errors": 0, "invoices_processed": 0, "total_invoices": 0}, "invoices": []})
+
+        # Queue the command first - a worker that is still logging in picks it up once ready
+        state = load_state()
+        state["command"] = "start"
+        state["job"] = {"id": job["id"], "account": job["account"], "params": job["params"]}
+        save_state(state)
+
+        if not ensure_worker():
+            state = load_state()
+            state["command"] = "idle"
+            save_state(state)
+            job_queue.finish(job["id"], "failed", "worker_failed", self.path)
+            print(f"❌ Job {job['id']} failed: worker did not start")
+
+    def _watch(self, job):
+        """Requeue the running job if its worker died before recording the outcome"""
+        if worker_is_alive():
+            return
+        state = load_state()
+        state.update({"command": "idle", "status": "error"})
+        save_state(state)
+        status = job_queue.requeue(job["id"], "worker_died", self.path)
+        print(f"⚠️ Worker died during job {job['id']} - {status}")
+
+    def run_forever(self):
+        print(f"Supervisor {self.owner} watching {self.path}")
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Supervisor tick failed: {e}")
+                self._stop.wait(self.poll_interval)
+        finally:
+            job_queue.release_lease(self.owner, self.path)
+
+    def start(self):
+        """Run the dispatch loop on a background thread (used by app.py)"""
+        self._thread = threading.Thread(target=self.run_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job supervisor for unattended runs")
+    parser.add_argument("--add-schedule", metavar="SPEC", help="daily@HH:MM, weekly@mon@HH:MM or every@6h")
+    parser.add_argument("--enqueue", action="store_true", help="queue one run now")
+    parser.add_argument("--account", default="", help="account number for the job/schedule")
+    parser.add_argument("--priority", type=int, default=job_queue.PRIORITY_SCHEDULED)
+    parser.add_argument("--list", action="store_true", help="show jobs and schedules")
+    args = parser.parse_args()
+
+    if args.add_schedule:
+        schedule_id = job_queue.add_schedule(args.add_schedule, args.account, args.priority)
+        print(f"Added schedule {schedule_id}: {args.add_schedule}")
+    elif args.enqueue:
+        print(f"Queued job {job_queue.enqueue(args.account, args.priority, source='cli')}")
+    elif args.list:
+        print(json.dumps({"jobs": job_queue.list_jobs(), "schedules": job_queue.list_schedules()}, indent=2))
+    else:
+        Supervisor().run_forever()
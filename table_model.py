@@ -0,0 +1,221 @@
+"""
+Table Model - Header-indexed reading of the invoice page's tables
+Each table is read with one evaluate (header cells + body cells), its header names are
+mapped to column indexes once, and every row becomes a compact ShipmentRecord. Lookups
+go straight to the right cell instead of regex-scanning the row's concatenated text;
+the old text patterns are only a fallback for tables without a usable header.
+The page reads are steps.py scripts, so both Playwright APIs share them.
+"""
+import re
+
+from steps import run
+
+TRACKING_RE = re.compile(r'\b\d{12}\b')
+MONEY_RE = re.compile(r'(-?)\$?\s?(\d[\d,]*\.\d{2})')
+DATE_RE = re.compile(r'\d{2}/\d{2}/\d{4}')
+
+# Header names (upper case) that identify each shipments-table column, best match first
+SHIPMENT_COLUMNS = {
+    "tracking": ("TRACKING ID", "TRACKING NUMBER", "TRACKING", "AIR WAYBILL", "AWB"),
+    "amount_due": ("AMOUNT DUE", "BALANCE DUE", "TOTAL DUE", "AMOUNT"),
+    "duty": ("DUTY",),
+    "tax": ("TAX",),
+    "status": ("STATUS",),
+    "reason": ("DISPUTE REASON", "REASON"),
+    "date": ("SHIP DATE", "SHIPMENT DATE", "DATE"),
+}
+
+# Header of the Dispute Activity table - never read as shipments
+DISPUTE_ID_HEADERS = ("DISPUTE ID", "DISPUTE #", "DISPUTE NUMBER")
+
+# Marks every shipments table (data-shipments-table="k") and returns its header and body cells.
+# Body rows are listed with their position so a record can be clicked later without re-reading.
+READ_TABLES_JS = """
+(disputeHeaders) => {
+    const text = c => c.textContent.trim();
+    const tables = [];
+    document.querySelectorAll('[data-shipments-table]').forEach(t => t.removeAttribute('data-shipments-table'));
+    document.querySelectorAll('table').forEach(table => {
+        let rows = Array.from(table.querySelectorAll('tbody tr'));
+        if (!rows.length) return;
+        let headerRow = table.querySelector('thead tr');
+        if (!headerRow && rows[0].querySelector('th') && !rows[0].querySelector('td')) headerRow = rows[0];
+        const headers = headerRow ? Array.from(headerRow.querySelectorAll('th, td')).map(text) : [];
+        const upper = headers.join('|').toUpperCase();
+        if (disputeHeaders.some(h => upper.includes(h))) return;
+        table.setAttribute('data-shipments-table', String(tables.length));
+        tables.push({
+            headers: headers,
+            rows: rows.map((row, i) => row === headerRow ? null : Array.from(row.querySelectorAll('td, th')).map(text))
+        });
+    });
+    return tables;
+}
+"""
+
+ROW_MATCHES_JS = """
+([table, row, tracking]) => {
+    const t = document.querySelector(`[data-shipments-table="${table}"]`);
+    const r = t && t.querySelectorAll('tbody tr')[row];
+    return !!r && r.textContent.includes(tracking);
+}
+"""
+
+
+def column_indexes(headers, columns):
+    """
+    Map each column name to its index in the header row. Exact header matches win over
+    partial ones, and a header already taken by a partial match is not reused.
+    """
+    upper = [re.sub(r'\s+', ' ', h).strip().upper() for h in headers]
+    indexes = {}
+    for name, aliases in columns.items():
+        for alias in aliases:
+            if alias in upper:
+                indexes[name] = upper.index(alias)
+                break
+    taken = set(indexes.values())
+    for name, aliases in columns.items():
+        if name in indexes:
+            continue
+        for alias in aliases:
+            match = next((i for i, header in enumerate(upper) if alias in header and i not in taken), None)
+            if match is not None:
+                indexes[name] = match
+                taken.add(match)
+                break
+    return indexes
+
+
+def parse_money(text):
+    """First amount in a cell as a plain "12.34" string, or None"""
+    match = MONEY_RE.search(text or "")
+    return match.group(1) + match.group(2).replace(',', '') if match else None
+
+
+class ShipmentRecord:
+    """One shipments-table row. `table` and `row` locate it on the page (see row_locator)"""
+    __slots__ = ("tracking", "others", "amount_due", "duty", "tax", "status", "reason", "date", "table", "row")
+
+    def __init__(self, tracking, others=(), amount_due=None, duty=None, tax=None, status="", reason="",
+                 date="", table=0, row=0):
+        self.tracking = tracking
+        self.others = others            # further tracking IDs in the same row
+        self.amount_due = amount_due    # "12.34" strings (None if the table has no such column)
+        self.duty = duty
+        self.tax = tax
+        self.status = status
+        self.reason = reason
+        self.date = date
+        self.table = table
+        self.row = row
+
+    @property
+    def amount(self):
+        """Amount to dispute ("0.00" if the row shows none)"""
+        return self.amount_due or "0.00"
+
+    def __repr__(self):
+        return f"ShipmentRecord({self.tracking}, ${self.amount}, {self.status or '-'})"
+
+
+class Table:
+    """One table's header and body cells, with the header indexed once"""
+
+    def __init__(self, headers, rows, columns=SHIPMENT_COLUMNS, index=0):
+        self.headers = headers
+        self.rows = rows
+        self.index = index
+        self.columns = column_indexes(headers, columns)
+
+    def cell(self, cells, name):
+        i = self.columns.get(name)
+        return cells[i] if i is not None and i < len(cells) else ""
+
+    def records(self):
+        """ShipmentRecords for the rows that carry a tracking ID, in table order"""
+        for position, cells in enumerate(self.rows):
+            if not cells or not any(cells):
+                continue
+            tracking_cell = self.cell(cells, "tracking")
+            if tracking_cell:
+                trackings = TRACKING_RE.findall(tracking_cell)
+            else:
+                # No tracking column: the first cell that holds one
+                trackings = next((found for found in (TRACKING_RE.findall(c) for c in cells) if found), [])
+            if not trackings:
+                continue
+
+            if "amount_due" in self.columns:
+                amount_due = parse_money(self.cell(cells, "amount_due"))
+            else:
+                # No amount column: the first dollar amount in the row, as before
+                amount_due = next((parse_money(c) for c in cells if '$' in c and parse_money(c)), None)
+
+            date = self.cell(cells, "date")
+            if "date" not in self.columns:
+                date = next((m.group() for m in map(DATE_RE.search, cells) if m), "")
+
+            yield ShipmentRecord(
+                tracking=trackings[0],
+                others=tuple(trackings[1:]),
+                amount_due=amount_due,
+                duty=parse_money(self.cell(cells, "duty")),
+                tax=parse_money(self.cell(cells, "tax")),
+                status=self.cell(cells, "status"),
+                reason=self.cell(cells, "reason"),
+                date=date,
+                table=self.index,
+                row=position
+            )
+
+
+def _tables(data):
+    return [Table(table["headers"], [cells or [] for cells in table["rows"]], index=i)
+            for i, table in enumerate(data or [])]
+
+
+def read_shipment_records_steps(page):
+    """Every shipments-table row on the page as ShipmentRecords (one evaluate; a steps.py script)"""
+    data = yield lambda: page.evaluate(READ_TABLES_JS, list(DISPUTE_ID_HEADERS))
+    records = []
+    for table in _tables(data):
+        records.extend(table.records())
+    return records
+
+
+def read_shipment_records(page):
+    return run(read_shipment_records_steps(page))
+
+
+def row_locator(page, record):
+    """Locator for a record's row (resolved when used, so it survives re-renders of the same table)"""
+    return page.locator(f'[data-shipments-table="{record.table}"] tbody tr').nth(record.row)
+
+
+def locate_row_steps(page, record):
+    """
+    Locator for a record's row, checked with one evaluate. If the page was re-rendered
+    (e.g. after returning from the dispute form) the tables are read and marked again.
+    Returns None if the tracking ID is no longer in any shipments table.
+    """
+    if (yield lambda: page.evaluate(ROW_MATCHES_JS, [record.table, record.row, record.tracking])):
+        return row_locator(page, record)
+    for fresh in (yield from read_shipment_records_steps(page)):
+        if fresh.tracking == record.tracking:
+            return row_locator(page, fresh)
+    return None
+
+
+def locate_row(page, record):
+    return run(locate_row_steps(page, record))
+
+
+def shipments_by_tracking(records):
+    """{tracking: amount} in table order; extra IDs in a row get "0.00" like before"""
+    shipments = {}
+    for record in records:
+        shipments.setdefault(record.tracking, record.amount)
+        for tracking in record.others:
+            shipments.setdefault(tracking, "0.00")
+    return shipments
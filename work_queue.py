@@ -0,0 +1,262 @@
+"""
+Work Queue - SQLite store of invoice work items leased to workers on other machines
+The coordinator (coordinator.py) owns this database; remote workers (remote_worker.py)
+lease one item at a time and renew the lease while they work on it. An item whose lease
+runs out (the worker crashed, lost its network or was closed) goes back to the queue.
+
+    scan      read an account's invoice list; its result becomes one invoice item per invoice
+    invoice   open one invoice and dispute what is left (params "only": just these tracking IDs)
+
+Tracking IDs that failed with a retryable error come back as a new invoice item for
+just those IDs, after a backoff.
+"""
+import json
+import sqlite3
+import time
+
+DB_FILE = "work_queue.db"
+
+MAX_ATTEMPTS = 3          # leases per item before it is marked failed
+MAX_RETRY_ROUNDS = 3      # follow-up items for failed tracking IDs
+RETRY_BASE_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,                      -- scan, invoice
+    account TEXT NOT NULL DEFAULT '',
+    invoice TEXT NOT NULL DEFAULT '',
+    params TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',   -- queued, leased, done, failed
+    not_before REAL NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_items_status_priority ON items(status, priority DESC, not_before, id);
+CREATE INDEX IF NOT EXISTS idx_items_lease ON items(status, lease_until);
+
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL,
+    item_id INTEGER,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_initialized = set()
+
+
+def connect(path=DB_FILE):
+    """Open the queue (creating the schema the first time)"""
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if path not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _initialized.add(path)
+    return conn
+
+
+def _item_dict(row):
+    item = dict(row)
+    item["params"] = json.loads(item["params"] or "{}")
+    item["result"] = json.loads(item["result"]) if item["result"] else None
+    return item
+
+
+def _insert(conn, kind, account, invoice, params, priority, not_before):
+    """Insert an item unless the same work is already waiting or leased. Returns its id or None"""
+    params = params or {}
+    for row in conn.execute(
+            "SELECT params FROM items WHERE kind = ? AND account = ? AND invoice = ? AND status IN ('queued', 'leased')",
+            (kind, account, invoice)):
+        # A whole-invoice item covers any subset; a subset only duplicates the same subset
+        existing = json.loads(row["params"] or "{}").get("only")
+        if existing is None or existing == params.get("only"):
+            return None
+    cursor = conn.execute(
+        """INSERT INTO items (kind, account, invoice, params, priority, not_before, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (kind, str(account or ""), invoice, json.dumps(params), int(priority), not_before or time.time(), time.time())
+    )
+    return cursor.lastrowid
+
+
+def _transaction(path, work):
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+    finally:
+        conn.close()
+
+
+# ========== ADDING WORK ==========
+
+def add_scan(account="", priority=0, path=DB_FILE):
+    """Queue a read of an account's invoice list. Returns the item id (None if one is pending)"""
+    return _transaction(path, lambda conn: _insert(conn, "scan", account, "", None, priority, None))
+
+
+def add_invoices(invoices, account="", priority=0, params=None, path=DB_FILE):
+    """Queue invoices (in the given order). Returns the ids of the items added"""
+    def work(conn):
+        added = []
+        for invoice in invoices:
+            item_id = _insert(conn, "invoice", account, invoice, params, priority, None)
+            if item_id is not None:
+                added.append(item_id)
+        return added
+    return _transaction(path, work)
+
+
+# ========== LEASES ==========
+
+def _reap(conn, now):
+    """Expired leases go back to the queue (or fail after MAX_ATTEMPTS). Returns how many"""
+    expired = conn.execute(
+        "SELECT id, attempts, worker FROM items WHERE status = 'leased' AND lease_until < ?", (now,)).fetchall()
+    for row in expired:
+        if row["attempts"] >= MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE items SET status = 'failed', finished_at = ?, result = ?, worker = NULL WHERE id = ?",
+                (now, json.dumps({"error": f"lease expired ({row['worker']})"}), row["id"]))
+        else:
+            conn.execute("UPDATE items SET status = 'queued', worker = NULL, lease_until = NULL WHERE id = ?",
+                         (row["id"],))
+    return len(expired)
+
+
+def reap_expired(path=DB_FILE):
+    return _transaction(path, lambda conn: _reap(conn, time.time()))
+
+
+def lease(worker, ttl=60, path=DB_FILE):
+    """Lease the next due item to `worker` for `ttl` seconds. Returns the item, or None if nothing is due"""
+    def work(conn):
+        now = time.time()
+        _reap(conn, now)
+        row = conn.execute(
+            """SELECT * FROM items WHERE status = 'queued' AND not_before <= ?
+               ORDER BY priority DESC, not_before, id LIMIT 1""", (now,)).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE items SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, now + ttl, row["id"]))
+        conn.execute(
+            """INSERT INTO workers (name, last_seen, item_id) VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET last_seen = excluded.last_seen, item_id = excluded.item_id""",
+            (worker, now, row["id"] if row else None))
+        return row["id"] if row else None
+
+    item_id = _transaction(path, work)
+    return get_item(item_id, path) if item_id is not None else None
+
+
+def renew(item_id, worker, ttl=60, path=DB_FILE):
+    """Heartbeat: extend the lease. False if `worker` no longer holds it (expired and re-leased)"""
+    def work(conn):
+        now = time.time()
+        cursor = conn.execute(
+            "UPDATE items SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now + ttl, item_id, worker))
+        conn.execute("UPDATE workers SET last_seen = ? WHERE name = ?", (now, worker))
+        return cursor.rowcount > 0
+    return _transaction(path, work)
+
+
+def complete(item_id, worker, status, result=None, path=DB_FILE):
+    """
+    Record a leased item's outcome. status is "done", "error" (retry the whole item) or
+    "stopped" (the worker gave it back). A scan's invoices and an invoice's failed tracking IDs
+    ("retry") are queued as new items. Returns False if `worker` no longer held the lease.
+    """
+    result = result or {}
+
+    def work(conn):
+        now = time.time()
+        row = conn.execute("SELECT * FROM items WHERE id = ? AND worker = ? AND status = 'leased'",
+                           (item_id, worker)).fetchone()
+        if row is None:
+            return False
+        conn.execute("UPDATE workers SET last_seen = ?, item_id = NULL, done = done + 1 WHERE name = ?", (now, worker))
+
+        if status in ("error", "stopped") and row["attempts"] < MAX_ATTEMPTS:
+            delay = 0 if status == "stopped" else RETRY_BASE_SECONDS * 2 ** (row["attempts"] - 1)
+            conn.execute(
+                """UPDATE items SET status = 'queued', worker = NULL, lease_until = NULL, not_before = ?, result = ?
+                   WHERE id = ?""", (now + delay, json.dumps(result), item_id))
+            return True
+
+        final = "done" if status == "done" else "failed"
+        conn.execute("UPDATE items SET status = ?, worker = NULL, lease_until = NULL, finished_at = ?, result = ? WHERE id = ?",
+                     (final, now, json.dumps(result), item_id))
+        if final != "done":
+            return True
+
+        if row["kind"] == "scan":
+            for invoice in result.get("invoices", []):
+                _insert(conn, "invoice", row["account"], invoice, None, row["priority"], None)
+        elif result.get("retry"):
+            params = json.loads(row["params"] or "{}")
+            rounds = params.get("round", 0) + 1
+            if rounds <= MAX_RETRY_ROUNDS:
+                _insert(conn, "invoice", row["account"], row["invoice"],
+                        {"only": sorted(result["retry"]), "round": rounds}, row["priority"],
+                        now + RETRY_BASE_SECONDS * 2 ** (rounds - 1))
+        return True
+
+    return _transaction(path, work)
+
+
+# ========== STATUS ==========
+
+def get_item(item_id, path=DB_FILE):
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        return _item_dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def list_items(status=None, limit=100, path=DB_FILE):
+    conn = connect(path)
+    try:
+        if status:
+            rows = conn.execute("SELECT * FROM items WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit))
+        else:
+            rows = conn.execute("SELECT * FROM items ORDER BY id DESC LIMIT ?", (limit,))
+        return [_item_dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def summary(worker_timeout=120, path=DB_FILE):
+    """Item counts per status, totals over finished invoices, and every worker seen"""
+    conn = connect(path)
+    try:
+        counts = {row["status"]: row["n"] for row in
+                  conn.execute("SELECT status, COUNT(*) AS n FROM items GROUP BY status")}
+        totals = {}
+        for row in conn.execute("SELECT result FROM items WHERE kind = 'invoice' AND status = 'done'"):
+            for key, value in (json.loads(row["result"] or "{}").get("counts") or {}).items():
+                totals[key] = totals.get(key, 0) + value
+        now = time.time()
+        workers = [{**dict(row), "alive": now - row["last_seen"] < worker_timeout}
+                   for row in conn.execute("SELECT * FROM workers ORDER BY name")]
+    finally:
+        conn.close()
+    return {"items": {status: counts.get(status, 0) for status in ("queued", "leased", "done", "failed")},
+            "totals": totals, "workers": workers}
@@ -0,0 +1,286 @@
+"""
+Worker Daemon - Resident browser worker that stays warm between runs
+Keeps Chrome and the logged-in session alive and takes jobs from the control channel
+(bot_state.json "command"), reporting liveness through worker_heartbeat.json
+
+Usage: python worker_daemon.py                  the main worker (./user_data_v6)
+       python worker_daemon.py --worker-id 2    an extra worker on a profile clone, with its
+                                                own bot_state.worker-2.json / bot_logs.worker-2.json
+       python worker_daemon.py --worker-id 2 --account N   ... logged in with account N's credentials
+                                                (orchestrator.py starts its shards this way)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from playwright.sync_api import sync_playwright
+
+from browser_worker import (
+    load_state, save_state, log, log_event,
+    load_worker_config, launch_browser, login_phase, login_to_fedex,
+    handoff_to_headless, start_live_view, publish_persistent_stats, run_job, use_worker_files, worker_file
+)
+from accounts import account_config
+from session_store import session_is_valid, save_snapshot, BILLING_URL, SESSION_FILE
+from profile_manager import profiles_for
+import job_queue
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+HEARTBEAT_FILE = "worker_heartbeat.json"
+HEARTBEAT_INTERVAL = 2       # seconds between heartbeats
+COMMAND_POLL_INTERVAL = 0.2  # seconds between control channel reads
+
+DEFAULT_MAX_JOBS = 20
+DEFAULT_MAX_MEMORY_GROWTH_MB = 500
+
+
+def load_heartbeat():
+    """Load the worker heartbeat (used by the app for the readiness handshake)"""
+    if os.path.exists(HEARTBEAT_FILE):
+        try:
+            with open(HEARTBEAT_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {}
+
+
+def worker_is_alive(heartbeat=None, max_age=15):
+    """True if a resident worker has heartbeated recently and has not exited"""
+    if heartbeat is None:
+        heartbeat = load_heartbeat()
+    if heartbeat.get("phase") in (None, "stopped", "recycled"):
+        return False
+    return time.time() - heartbeat.get("heartbeat", 0) < max_age
+
+
+def worker_is_ready(heartbeat=None, max_age=15):
+    """True if a live worker has logged in and can take jobs (readiness handshake)"""
+    if heartbeat is None:
+        heartbeat = load_heartbeat()
+    return heartbeat.get("phase") in ("ready", "busy") and worker_is_alive(heartbeat, max_age)
+
+
+def worker_memory_mb():
+    """RSS of this worker plus its driver/browser processes in MB (None without psutil)"""
+    if psutil is None:
+        return None
+    try:
+        proc = psutil.Process()
+        total = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except:
+                pass
+        return total / (1024 * 1024)
+    except:
+        return None
+
+
+class Heartbeat:
+    """Background thread writing the worker's phase and counters every few seconds"""
+
+    def __init__(self):
+        self.phase = "booting"
+        self.jobs_done = 0
+        self.memory_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.write()
+        self._thread.start()
+
+    def set_phase(self, phase):
+        self.phase = phase
+        self.write()
+
+    def stop(self, phase="stopped"):
+        self._stop.set()
+        self.phase = phase
+        self.write()
+
+    def write(self):
+        data = {
+            "pid": os.getpid(),
+            "phase": self.phase,
+            "heartbeat": time.time(),
+            "jobs_done": self.jobs_done,
+            "memory_mb": self.memory_mb
+        }
+        tmp = HEARTBEAT_FILE + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, HEARTBEAT_FILE)
+        except:
+            pass
+
+    def _loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            self.write()
+
+
+def set_status(status):
+    """Update the status without dropping a command (or supervisor job) queued while we were busy"""
+    state = load_state()
+    save_state({"command": state.get("command", "idle"), "job": state.get("job"), "status": status})
+
+
+def ensure_session(page, config, profiles=None):
+    """Re-check the session before each job and log in again if it expired"""
+    # Another worker may have logged in again since - take its cookies first
+    if profiles is not None and profiles.apply_session(page.context):
+        log("🔄 Picked up a newer login from another worker")
+    if session_is_valid(page.context, config):
+        return True
+    log("🔑 Session expired - logging in again...")
+    try:
+        page.goto(config.get('fedex_url', "https://www.fedex.com/en-ca/logged-in-home.html"),
+                  timeout=60000, wait_until="domcontentloaded")
+    except Exception as e:
+        log(f"Navigation warning: {e}")
+    if config.get("username") and config.get("password") and \
+            login_to_fedex(page, config["username"], config["password"]):
+        save_snapshot(page.context, config.get("session_file", SESSION_FILE))
+        return True
+    log_event("Login Warning", "⚠️ Session expired and re-login needs manual intervention.", "warning")
+    return False
+
+
+def should_recycle(heartbeat, config, baseline_mb):
+    """Decide whether the worker has served enough jobs or grown too much"""
+    max_jobs = config.get("worker_max_jobs", DEFAULT_MAX_JOBS)
+    if max_jobs and heartbeat.jobs_done >= max_jobs:
+        log(f"♻️ Recycling worker after {heartbeat.jobs_done} jobs.")
+        return True
+
+    max_growth = config.get("worker_max_memory_growth_mb", DEFAULT_MAX_MEMORY_GROWTH_MB)
+    if max_growth and baseline_mb is not None and heartbeat.memory_mb is not None:
+        growth = heartbeat.memory_mb - baseline_mb
+        if growth >= max_growth:
+            log(f"♻️ Recycling worker after {growth:.0f} MB memory growth.")
+            return True
+    return False
+
+
+def serve(worker_id=None, account=None):
+    """Resident worker loop - log in once, then run a job for every "start" command"""
+    global HEARTBEAT_FILE
+    print("=" * 50)
+    print("FedEx Dispute Bot - Worker Daemon" + (f" (worker {worker_id})" if worker_id else ""))
+    print("=" * 50)
+
+    if worker_id:
+        HEARTBEAT_FILE = worker_file("worker_heartbeat.json", worker_id)
+    heartbeat = Heartbeat()
+    heartbeat.start()
+
+    config = load_worker_config()
+    if config is None:
+        heartbeat.stop()
+        return
+    if psutil is None and config.get("worker_max_memory_growth_mb", DEFAULT_MAX_MEMORY_GROWTH_MB):
+        log("⚠️ psutil is not installed - worker_max_memory_growth_mb is not enforced "
+            "(pip install -r requirements.txt)")
+    worker_config = use_worker_files(config, worker_id)
+    # Log in as the given account's user (its own credentials and session snapshot, if any)
+    config = account_config(worker_config, account)
+    profiles = profiles_for(config)
+
+    set_status("waiting_for_login")
+
+    with sync_playwright() as p:
+        browser_context, page = launch_browser(p, config, worker_id)
+        try:
+            # A clone starts from the newest shared login; the main profile is its own source
+            if worker_id:
+                profiles.apply_session(browser_context)
+            else:
+                profiles.skip_current()
+            heartbeat.set_phase("login")
+            login_phase(browser_context, page, config)
+
+            if config.get("headless_processing", False):
+                _, browser_context, page = handoff_to_headless(p, browser_context, page, config)
+            screencast = start_live_view(page, config)
+
+            publish_persistent_stats()
+            baseline_mb = heartbeat.memory_mb = worker_memory_mb()
+            heartbeat.set_phase("ready")
+            log_event("Worker Ready", "🟢 Browser is warm. Waiting for jobs.", "success")
+            set_status("ready")
+
+            while True:
+                state = load_state()
+                command = state.get("command", "idle")
+
+                if command == "shutdown":
+                    log("Worker shutting down by request...")
+                    break
+
+                if command == "stop":
+                    # Nothing running - just acknowledge
+                    save_state({"command": "idle", "status": "ready"})
+
+                elif command == "start":
+                    heartbeat.set_phase("busy")
+                    # Jobs from the supervisor (job_queue.py) may target another account
+                    job = state.get("job")
+                    job_config = config
+                    if job and job.get("account"):
+                        job_config = account_config(worker_config, job["account"])
+                    save_state({"command": "processing", "status": "running", "start_time": time.time(), "job": job})
+
+                    ensure_session(page, config, profiles)
+                    try:
+                        page.goto(config.get("billing_url", BILLING_URL), wait_until="domcontentloaded")
+                    except Exception as e:
+                        log(f"Navigation warning: {e}")
+
+                    try:
+                        status = run_job(page, job_config, screencast)
+                    except Exception as e:
+                        log(f"❌ Job failed: {e}")
+                        status = "error"
+                    if job and job.get("id"):
+                        job_queue.finish(job["id"], status)
+
+                    heartbeat.jobs_done += 1
+                    heartbeat.memory_mb = worker_memory_mb()
+                    save_state({"command": "idle", "status": status})
+
+                    if should_recycle(heartbeat, config, baseline_mb):
+                        heartbeat.stop("recycled")
+                        break
+                    heartbeat.set_phase("ready")
+
+                time.sleep(COMMAND_POLL_INTERVAL)
+
+            if screencast: screencast.stop()
+        finally:
+            try:
+                browser_context.close()
+            except:
+                pass
+
+    if heartbeat.phase != "recycled":
+        heartbeat.stop()
+    # Clones are per run; the next start copies the (possibly newer) main profile again
+    if worker_id and config.get("profile_cleanup", True):
+        profiles.remove(worker_id)
+    print("Worker Daemon Finished")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident browser worker")
+    parser.add_argument("--worker-id", default=None, help="run as an extra worker on its own profile clone")
+    parser.add_argument("--account", default=None, help="log in with this account's credentials (accounts config)")
+    args = parser.parse_args()
+    serve(args.worker_id, args.account)